@@ -55,6 +55,7 @@ from buzzard._gdal_file_vector import GDALFileVector
 from buzzard._gdal_memory_vector import GDALMemoryVector
 
 from buzzard._cached_raster_recipe import CachedRasterRecipe
+from buzzard._cache_warmup import CacheWarmup
 
 # Misc classes
 # Public methods, but always instanciated by Dataset, never by user.
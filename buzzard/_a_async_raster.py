@@ -1,6 +1,8 @@
 import uuid
 import queue
 import weakref
+import asyncio
+import collections
 
 from buzzard._a_source_raster import ASourceRaster, ABackSourceRaster
 from buzzard._footprint import Footprint
@@ -18,6 +20,7 @@ class AAsyncRaster(ASourceRaster):
     ----------------
     - Has a `queue_data`, a low level method that can be used to query several arrays at once.
     - Has an `iter_data`, a higher level wrapper of `queue_data`.
+    - Has an `iter_data_async` and a `get_data_async`, to be used from within an asyncio event loop.
     """
 
     def queue_data(self, fps, channels=None, dst_nodata=None, interpolation='cv_area',
@@ -125,6 +128,75 @@ class AAsyncRaster(ASourceRaster):
             )
         )
 
+    def iter_data_async(self, fps, channels=None, dst_nodata=None, interpolation='cv_area',
+                        max_queue_size=5, **kwargs):
+        """Read several rectangles of data on several channels from the source raster, from within
+        an asyncio event loop.
+
+        This is the asyncio counterpart of the `iter_data` method. It returns an asynchronous
+        iterator, the scheduler delivers the arrays straight to the event loop that iterates it, no
+        thread is blocked while waiting for data. The iterator may be created outside of this
+        event loop, but it should always be iterated from the same one. While waiting for data,
+        the Dataset's scheduler is periodically probed to reraise an exception if it crashed.
+
+        If you wish to cancel your request, loose the reference to the iterator and the scheduler
+        will gracefully cancel the query.
+
+        >>> async def serve(r, fps):
+        ...     async for arr in r.iter_data_async(fps):
+        ...         await send(arr)
+
+        see `iter_data` documentation, it shares all of the parameters
+
+        Returns
+        -------
+        iterable: asynchronous iterable of ndarray
+            The arrays are yielded in the same order as in the `fps` parameter.
+
+        """
+        for fp in fps:
+            if not isinstance(fp, Footprint):
+                raise ValueError('element of `fps` parameter should be a Footprint (not {})'.format(
+                    fp
+                )) # pragma: no cover
+
+        return self._back.iter_data_async(
+            fps=fps,
+            **_tools.parse_queue_data_parameters(
+                'iter_data_async', self, channels, dst_nodata, interpolation, max_queue_size,
+                **kwargs
+            )
+        )
+
+    def get_data_async(self, fp=None, channels=None, dst_nodata=None, interpolation='cv_area',
+                       **kwargs):
+        """Read a rectangle of data on several channels from the source raster, from within an
+        asyncio event loop.
+
+        This is the asyncio counterpart of the `get_data` method, it returns an awaitable. It
+        should be called from within the event loop that awaits it.
+
+        >>> arr = await r.get_data_async(fp)
+
+        see `get_data` documentation, it shares all of the parameters
+
+        Returns
+        -------
+        awaitable: asyncio.Future of ndarray
+
+        """
+        if fp is None:
+            fp = self.fp
+        elif not isinstance(fp, Footprint): # pragma: no cover
+            raise ValueError('`fp` parameter should be a Footprint (not {})'.format(fp))
+
+        return self._back.get_data_async(
+            fp=fp,
+            **_tools.parse_queue_data_parameters(
+                'get_data_async', self, channels, dst_nodata, interpolation, 1, **kwargs
+            )
+        )
+
 class ABackAsyncRaster(ABackSourceRaster):
     """Implementation of AAsyncRaster's specifications"""
 
@@ -143,20 +215,10 @@ class ABackAsyncRaster(ABackSourceRaster):
 
     def queue_data(self, fps, channel_ids, dst_nodata, interpolation, max_queue_size, is_flat,
                    parent_uid, key_in_parent):
-        q = queue.Queue(max_queue_size)
-        self.back_ds.put_message(Msg(
-            '/Raster{}/QueriesHandler'.format(self.uid),
-            'new_query',
-            weakref.ref(q),
-            max_queue_size,
-            fps,
-            channel_ids,
-            is_flat,
-            dst_nodata,
-            interpolation,
-            parent_uid,
-            key_in_parent
-        ))
+        wakeup = self.back_ds.scheduler_wakeup(self._queries_handler_address)
+        q = _SchedulerQueue(max_queue_size, wakeup)
+        self._send_query(q, wakeup, fps, channel_ids, dst_nodata, interpolation, max_queue_size,
+                         is_flat, parent_uid, key_in_parent)
         return q
 
     def iter_data(self, fps, channel_ids, dst_nodata, interpolation, max_queue_size, is_flat):
@@ -186,6 +248,20 @@ class ABackAsyncRaster(ABackSourceRaster):
         )
         return next(it)
 
+    def iter_data_async(self, fps, channel_ids, dst_nodata, interpolation, max_queue_size,
+                        is_flat):
+        wakeup = self.back_ds.scheduler_wakeup(self._queries_handler_address)
+        q = _AsyncSchedulerQueue(wakeup, self.back_ds)
+        self._send_query(q, wakeup, fps, channel_ids, dst_nodata, interpolation, max_queue_size,
+                         is_flat, None, None)
+        return _AsyncIterData(q, len(fps))
+
+    def get_data_async(self, fp, channel_ids, dst_nodata, interpolation, max_queue_size, is_flat):
+        # The queue is kept alive by the event loop until the future is done or cancelled
+        return self.iter_data_async(
+            [fp], channel_ids, dst_nodata, interpolation, max_queue_size, is_flat,
+        ).__anext__()
+
     def create_actors(self): # pragma: no cover
         raise NotImplementedError('ABackAsyncRaster.create_actors is virtual pure')
 
@@ -196,9 +272,147 @@ class ABackAsyncRaster(ABackSourceRaster):
 
         Should be called after scheduler's end
         """
-        self.back_ds.put_message(Msg(
+        back_ds = self.back_ds
+        super().close()
+
+        # The scheduler may not have created the actors of this raster yet (e.g. closed right after
+        # a `warm_cache`), they get the Dataset from the raster. The TopLevel forgets it when it
+        # receives `kill_raster`.
+        self.back_ds = back_ds
+        back_ds.put_message(Msg(
             '/Global/TopLevel', 'kill_raster', self,
         ), check_scheduler_status=False)
         # TODO: just sending a kill_raster message may not be enough. Need synchro?
-        self.back_ds.deactivate_many(self.async_dict_path_of_cache_fp.values())
-        super().close()
+        # The cache files may still be read or checked, by a warmup for example
+        back_ds.deactivate_many_idle(set(self.async_dict_path_of_cache_fp.values()))
+        back_ds.deactivate_all_in_workers()
+
+    @property
+    def _queries_handler_address(self):
+        return '/Raster{}/QueriesHandler'.format(self.uid)
+
+    def _send_query(self, q, wakeup, fps, channel_ids, dst_nodata, interpolation, max_queue_size,
+                    is_flat, parent_uid, key_in_parent):
+        self.back_ds.put_message(Msg(
+            self._queries_handler_address,
+            'new_query',
+            # The scheduler needs to be notified when the queue is collected
+            weakref.ref(q, lambda _: wakeup.set()),
+            max_queue_size,
+            fps,
+            channel_ids,
+            is_flat,
+            dst_nodata,
+            interpolation,
+            parent_uid,
+            key_in_parent
+        ))
+
+class _SchedulerQueue(queue.Queue):
+    """Output queue of a query. The scheduler is woken up each time an array is pulled from it,
+    since it may allow new arrays to be produced.
+    """
+
+    def __init__(self, maxsize, wakeup):
+        super().__init__(maxsize)
+        self._wakeup = wakeup
+
+    def _get(self):
+        res = super()._get()
+        self._wakeup.set()
+        return res
+
+class _AsyncSchedulerQueue(object):
+    """Output queue of a query, consumed from an asyncio event loop.
+
+    The scheduler only uses the `put_nowait` and `qsize` methods, like with a `queue.Queue`. The
+    arrays are handed to the event loop with `call_soon_threadsafe`, the futures returned by `get`
+    are resolved in the event loop's thread. The event loop is the one of the thread of the first
+    call to `get`, the arrays put before are delivered by this call.
+    """
+
+    def __init__(self, wakeup, back_ds):
+        self._wakeup = wakeup
+        self._loop = None
+        self._back_ds = back_ds
+
+        # Arrays put by the scheduler and not yet pulled by a future
+        self._arrays = collections.deque()
+
+        # Futures waiting for an array
+        self._waiters = collections.deque()
+
+        self._probe_handle = None
+
+    # Scheduler's thread ************************************************************************ **
+    def qsize(self):
+        return len(self._arrays)
+
+    def put_nowait(self, array):
+        # Appended before reading `_loop`, that is set before the first `_deliver`
+        self._arrays.append(array)
+        loop = self._loop
+        if loop is None:
+            return
+        try:
+            loop.call_soon_threadsafe(self._deliver)
+        except RuntimeError:
+            # The event loop was closed, nobody will ever pull that array
+            pass
+
+    # Event loop's thread *********************************************************************** **
+    def get(self):
+        """Create a future of the next array of the queue, in the event loop of the calling
+        thread"""
+        loop = asyncio.get_event_loop()
+        if self._loop is None:
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError('This query is consumed by another event loop')
+        fut = loop.create_future()
+        self._waiters.append(fut)
+        self._deliver()
+        if not fut.done() and self._probe_handle is None:
+            self._probe_handle = self._loop.call_later(QUEUE_POLL_DISTANCE, self._probe)
+        return fut
+
+    def _deliver(self):
+        while self._waiters and self._arrays:
+            fut = self._waiters.popleft()
+            if fut.done():
+                # Cancelled by user
+                continue
+            fut.set_result(self._arrays.popleft())
+            self._wakeup.set()
+
+    def _probe(self):
+        """Periodically check that the scheduler is still alive while some futures are pending.
+        The event loop holds a reference to this queue until then."""
+        self._probe_handle = None
+        self._waiters = collections.deque(fut for fut in self._waiters if not fut.done())
+        if not self._waiters:
+            return
+        try:
+            self._back_ds.ensure_scheduler_still_alive()
+        except Exception as e:
+            while self._waiters:
+                self._waiters.popleft().set_exception(e)
+            return
+        self._probe_handle = self._loop.call_later(QUEUE_POLL_DISTANCE, self._probe)
+
+class _AsyncIterData(object):
+    """Asynchronous iterator returned by `iter_data_async`"""
+
+    def __init__(self, q, count):
+        self._q = q
+        self._count = count
+        self._i = 0
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        if self._i == self._count:
+            raise StopAsyncIteration()
+        self._i += 1
+        return self._q.get()
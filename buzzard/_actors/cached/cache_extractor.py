@@ -11,6 +11,7 @@ class ActorCacheExtractor(object):
 
     def __init__(self, raster):
         self._raster = raster
+        self._back_ds = raster.back_ds
         self._alive = True
 
         self._path_of_cache_files_ready = {} # type: Mapping[Footprint, str]
@@ -35,10 +36,7 @@ class ActorCacheExtractor(object):
         missing_cache_fps = cache_fps - available_cache_fps
 
         for cache_fp in available_cache_fps:
-            msgs += [Msg(
-                'Reader', 'sample_cache_file_to_unique_array',
-                qi, prod_idx, cache_fp, self._path_of_cache_files_ready[cache_fp],
-            )]
+            msgs += [self._read_msg(qi, prod_idx, cache_fp)]
         for cache_fp in missing_cache_fps:
             self._reads_waiting_for_cache_fp[cache_fp][qi].add(prod_idx)
 
@@ -59,20 +57,30 @@ class ActorCacheExtractor(object):
             # TODO Idea: Send a external message to the facade to expose the set of path to cache files with a mutex
             for qi, prod_idxs in self._reads_waiting_for_cache_fp[cache_fp].items():
                 for prod_idx in prod_idxs:
-                    msgs += [Msg(
-                        'Reader', 'sample_cache_file_to_unique_array',
-                        qi, prod_idx, cache_fp, self._path_of_cache_files_ready[cache_fp]
-                    )]
+                    msgs += [self._read_msg(qi, prod_idx, cache_fp)]
             del self._reads_waiting_for_cache_fp[cache_fp]
 
 
         return msgs
 
+    def receive_cache_file_removed(self, cache_fp):
+        """Receive message: A cache file was evicted or invalidated, it will be computed again if
+        needed
+
+        Parameters
+        ----------
+        cache_fp: Footprint
+        """
+        # Unknown if it was only made ready for a warmup
+        self._path_of_cache_files_ready.pop(cache_fp, None)
+        return []
+
     def receive_sampled_a_cache_file_to_the_array(self, qi, prod_idx, cache_fp, array):
         """Receive message: A cache file was read for that output array"""
-        return [Msg(
-            'Producer', 'sampled_a_cache_file_to_the_array', qi, prod_idx, cache_fp, array,
-        )]
+        return [
+            Msg('Producer', 'sampled_a_cache_file_to_the_array', qi, prod_idx, cache_fp, array),
+            Msg('CacheSupervisor', 'cache_file_sampled', qi, prod_idx, cache_fp),
+        ]
 
     def receive_cancel_this_query(self, qi):
         """Receive message: One query was dropped
@@ -95,6 +103,19 @@ class ActorCacheExtractor(object):
         self._alive = False
         self._reads_waiting_for_cache_fp.clear()
         self._raster = None
+        self._back_ds = None
         return []
 
     # ******************************************************************************************* **
+    def _read_msg(self, qi, prod_idx, cache_fp):
+        """Read from the tile memory cache of the Dataset if possible, from the cache file
+        otherwise"""
+        tile_array = self._back_ds.tile_memory_cache.get(self._raster.uid, cache_fp)
+        if tile_array is not None:
+            return Msg('Reader', 'sample_cache_tile_from_memory', qi, prod_idx, cache_fp, tile_array)
+        return Msg(
+            'Reader', 'sample_cache_file_to_unique_array',
+            qi, prod_idx, cache_fp, self._path_of_cache_files_ready[cache_fp],
+        )
+
+    # ******************************************************************************************* **
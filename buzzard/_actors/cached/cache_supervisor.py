@@ -3,9 +3,12 @@ import collections
 import itertools
 import logging
 import os
+import time
 
 from buzzard._actors.message import Msg
-from buzzard._actors.cached.query_infos import CacheComputationInfos
+from buzzard._cache_lock import CacheTileLocks, LOCK_DIRNAME
+from buzzard._actors.cached.query_infos import CacheComputationInfos, CacheWarmupInfos
+from buzzard._tools import IndexedHeap
 
 LOGGER = logging.getLogger(__name__)
 
@@ -19,6 +22,7 @@ class ActorCacheSupervisor(object):
         raster: _a_recipe_raster.ABackRecipeRaster
         """
         self._raster = raster
+        self._back_ds = raster.back_ds
         self._cache_fps_status = {
             cache_fp: _CacheTileStatus.unknown
             for cache_fp in raster.cache_fps.flat
@@ -28,12 +32,51 @@ class ActorCacheSupervisor(object):
         self.address = '/Raster{}/CacheSupervisor'.format(self._raster.uid)
         self._directory_primed = False
 
+        # Whether or not the cache files found may have been encoded with other options than the
+        # ones of this raster, their encoding is then checked by the FileChecker
+        self._check_encoding = True
+
         # Should contain the path to all files that will be opened using the Dataset's activation
         # pool. It means all cache files in those status:
         # - _CacheTileStatus.checking
         # - _CacheTileStatus.ready
         self._path_of_cache_fp = raster.async_dict_path_of_cache_fp
 
+        # The cache files found corrupted by a background check, see `cache_validation='lazy'`
+        self._corrupted_path_of_cache_fp = {}
+
+        # The cache files invalidated by `CachedRasterRecipe.invalidate_cache`, that are removed
+        # once unpinned, and the ones being checked or computed at the time
+        self._invalidated_paths_of_cache_fp = collections.defaultdict(set)
+        self._invalidated_cache_fps_checking = set()
+        self._invalidated_cache_fps_computing = set()
+
+        # The cache tiles whose computation was started and whose cache file was not written yet
+        self._cache_fps_computing = set()
+
+        # The cache files on disk, to evict some when `max_cache_bytes` or `max_cache_tiles` is
+        # exceeded. The cache tiles of the alive queries and the ones being checked are pinned. A
+        # cache tile of a query is unpinned once sampled to all the arrays of the query needing it.
+        self._budget = _CacheBudget(
+            raster.max_cache_bytes, raster.max_cache_tiles, raster.cache_eviction,
+        )
+        self._pinned_cache_fps_of_query = {} # type: Dict[CachedQueryInfos, Dict[Footprint, Set[int]]]
+
+        # The warmups of `CachedRasterRecipe.warm_cache` and their cache tiles not ready yet
+        self._warmups = {} # type: Dict[CacheWarmup, CacheWarmupInfos]
+        self._cache_fps_left_of_warmup = {} # type: Dict[CacheWarmupInfos, Set[Footprint]]
+
+        # The claims on the cache tiles shared with other processes, see `cache_lock_lease`
+        self._locks = None
+        if raster.cache_lock_lease is not None:
+            self._locks = CacheTileLocks(
+                os.path.join(raster.cache_dir, LOCK_DIRNAME), raster.cache_lock_lease,
+            )
+        self._claimed_cache_fps = set() # Absent, claimed by this process
+        self._foreign_cache_fps = set() # Absent, claimed by other processes and polled
+        self._adopted_cache_fps = set() # Checking, written by other processes
+        self._next_lock_poll = 0.
+
     @property
     def alive(self):
         return self._alive
@@ -49,56 +92,22 @@ class ActorCacheSupervisor(object):
         qi: _actors.cached.query_infos.QueryInfos
         """
 
-        if not self._directory_primed:
-            self._directory_primed = True
-            os.makedirs(self._raster.cache_dir, exist_ok=True)
-            if self._raster.overwrite:
-                file_list = self._raster.list_cache_path_candidates()
-                LOGGER.info('Removing {} cache files'.format(
-                    len(file_list)
-                ))
-                for path in file_list:
-                    os.remove(path)
+        self._prime_directory()
 
-        msgs = []
         cache_fps = qi.list_of_cache_fp
 
         query = _Query()
         self._queries[qi] = query
 
+        self._pinned_cache_fps_of_query[qi] = {
+            cache_fp: set(qi.dict_of_prod_idxs_per_cache_fp[cache_fp])
+            for cache_fp in cache_fps
+        }
         for cache_fp in cache_fps:
-            status = self._cache_fps_status[cache_fp]
-
-            if status == _CacheTileStatus.ready:
-                query.cache_fps_ensured.add(cache_fp)
-
-            elif status == _CacheTileStatus.checking:
-                query.cache_fps_checking.add(cache_fp)
+            self._budget.access(cache_fp)
+            self._budget.pin(cache_fp)
 
-            elif status == _CacheTileStatus.absent:
-                query.cache_fps_to_compute.add(cache_fp)
-
-            elif status == _CacheTileStatus.unknown:
-                path_candidates = self._raster.list_cache_path_candidates(cache_fp)
-                if len(path_candidates) == 1:
-                    self._cache_fps_status[cache_fp] = _CacheTileStatus.checking
-                    self._path_of_cache_fp[cache_fp] = path_candidates[0]
-                    self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'unknown')
-                    query.cache_fps_checking.add(cache_fp)
-                    msgs += [
-                        Msg('FileChecker', 'infer_cache_file_status', cache_fp, path_candidates[0])
-                    ]
-                else:
-                    self._cache_fps_status[cache_fp] = _CacheTileStatus.absent
-                    self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'absent')
-                    for path in path_candidates: # pragma: no cover
-                        LOGGER.warning(
-                            'Removing {} because {} tiles with the same prefix'.format(path, len(path_candidates))
-                        )
-                        os.remove(path)
-                    query.cache_fps_to_compute.add(cache_fp)
-            else: # pragma: no cover
-                assert False
+        msgs, background_msgs = self._sort_cache_tiles(query, cache_fps)
 
         if len(query.cache_fps_ensured) != 0:
             # Notify the production pipeline that those cache tiles are already ready
@@ -117,6 +126,153 @@ class ActorCacheSupervisor(object):
                 # now
                 msgs += self._query_start_collection(qi, query)
 
+        msgs += self._evict()
+        return msgs + background_msgs
+
+    def ext_receive_warm_cache(self, warmup, cache_fps, priority):
+        """Receive message sent by something else than an actor, still treated synchronously: Make
+        those cache files available, without producing arrays
+
+        Parameters
+        ----------
+        warmup: _cache_warmup.CacheWarmup
+            Progress handle returned to the user
+        cache_fps: sequence of Footprint
+        priority: str
+            One of `_cache_warmup.WARM_CACHE_PRIORITIES`
+        """
+        self._prime_directory()
+
+        qi = CacheWarmupInfos(warmup, cache_fps, priority)
+        query = _Query()
+        for cache_fp in cache_fps:
+            self._budget.access(cache_fp)
+
+        msgs, background_msgs = self._sort_cache_tiles(query, cache_fps)
+        warmup._tiles_done(len(query.cache_fps_ensured))
+
+        cache_fps_left = query.cache_fps_checking | query.cache_fps_to_compute
+        if len(cache_fps_left) == 0:
+            warmup._finish(cancelled=False)
+        else:
+            self._warmups[warmup] = qi
+            self._cache_fps_left_of_warmup[qi] = cache_fps_left
+            if len(query.cache_fps_checking) != 0:
+                self._queries[qi] = query
+            else:
+                msgs += self._query_start_collection(qi, query)
+
+        msgs += self._evict()
+        return msgs + background_msgs
+
+    def ext_receive_cancel_warm_cache(self, warmup):
+        """Receive message sent by something else than an actor, still treated synchronously: The
+        user cancelled a warmup
+
+        Parameters
+        ----------
+        warmup: _cache_warmup.CacheWarmup
+        """
+        qi = self._warmups.get(warmup)
+        if qi is None:
+            # Already finished
+            return []
+        return self._end_warmup(qi, cancelled=True)
+
+    def ext_receive_invalidate_cache(self, cache_fps):
+        """Receive message sent by something else than an actor, still treated synchronously: Remove
+        those cache files, they will be computed again when needed
+
+        The cache files given to the ongoing queries are removed once unpinned, the ongoing queries
+        compute them again. The cache tiles being computed may use the data that was invalidated,
+        their cache files are removed once written and they are computed again if needed.
+
+        Parameters
+        ----------
+        cache_fps: sequence of Footprint
+        """
+        self._prime_directory()
+
+        msgs = []
+        wanted = self._wanted_cache_fps()
+        cache_fps_to_compute = []
+        for cache_fp in cache_fps:
+            status = self._cache_fps_status[cache_fp]
+            self._back_ds.tile_memory_cache.discard(self._raster.uid, cache_fp)
+
+            if status == _CacheTileStatus.ready:
+                self._budget.uncount(cache_fp)
+                path = self._path_of_cache_fp.pop(cache_fp)
+                if self._budget.pinned(cache_fp):
+                    # It may be read at the moment
+                    self._invalidated_paths_of_cache_fp[cache_fp].add(path)
+                else:
+                    self._remove_cache_file(path)
+                if cache_fp in wanted:
+                    cache_fps_to_compute.append(cache_fp)
+                msgs += [Msg('CacheExtractor', 'cache_file_removed', cache_fp)]
+                msgs += self._cache_tile_removed_msgs(cache_fp)
+
+            elif status == _CacheTileStatus.checking:
+                # It is removed once checked, the queries waiting for it then compute it
+                self._invalidated_cache_fps_checking.add(cache_fp)
+                continue
+
+            elif cache_fp in self._cache_fps_computing:
+                # It is removed once written, and then computed again if still needed
+                self._invalidated_cache_fps_computing.add(cache_fp)
+                continue
+
+            elif status == _CacheTileStatus.unknown:
+                self._budget.uncount(cache_fp)
+                for path in self._raster.list_cache_path_candidates(cache_fp):
+                    os.remove(path)
+                    self._raster.cache_manifest.remove(path)
+
+            else:
+                # Not on disk
+                continue
+
+            self._cache_fps_status[cache_fp] = _CacheTileStatus.absent
+            self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'absent')
+
+        LOGGER.info('Invalidated {} cache tiles of {}'.format(len(cache_fps), self._raster.cache_dir))
+        if cache_fps_to_compute:
+            msgs += self._compute_in_background(cache_fps_to_compute)
+        return msgs
+
+    def ext_receive_nothing(self):
+        """Receive message sent by something else than an actor, still treated synchronously: What's
+        up?
+        Renew the claims of this process on its cache tiles, and poll the ones claimed by other
+        processes.
+        """
+        if self._locks is None:
+            return []
+        now = time.monotonic()
+        if now < self._next_lock_poll:
+            return []
+        self._next_lock_poll = now + self._locks.poll_interval
+
+        msgs = []
+        wanted = self._wanted_cache_fps()
+        for cache_fp in self._claimed_cache_fps - wanted:
+            # The queries that needed it were cancelled, let another process compute it
+            self._release(cache_fp)
+        self._locks.renew()
+
+        self._foreign_cache_fps &= wanted
+        if self._foreign_cache_fps:
+            paths_of_cache_fp = self._scan_cache_path_candidates(self._foreign_cache_fps)
+            cache_fps_orphan = []
+            for cache_fp in list(self._foreign_cache_fps):
+                paths = paths_of_cache_fp.get(cache_fp, [])
+                if len(paths) == 1:
+                    msgs += self._adopt_cache_file(cache_fp, paths[0])
+                elif not self._locks.claimed_by_another(self._raster.fname_prefix_of_cache_fp(cache_fp)):
+                    cache_fps_orphan.append(cache_fp)
+            if cache_fps_orphan:
+                msgs += self._compute_in_background(cache_fps_orphan)
         return msgs
 
     def receive_inferred_cache_file_status(self, cache_fp, path, status):
@@ -129,6 +285,34 @@ class ActorCacheSupervisor(object):
         status: bool
         """
         msgs = []
+        self._budget.unpin(cache_fp)
+        adopted = cache_fp in self._adopted_cache_fps
+        self._adopted_cache_fps.discard(cache_fp)
+
+        if path in self._invalidated_paths_of_cache_fp.get(cache_fp, ()):
+            # This cache tile was checked in the background and invalidated since
+            self._remove_invalidated_cache_files([cache_fp])
+            return msgs
+
+        if self._cache_fps_status[cache_fp] == _CacheTileStatus.ready:
+            # This cache tile was trusted and checked in the background
+            assert self._raster.cache_validation == 'lazy'
+            assert self._path_of_cache_fp[cache_fp] == path
+            if not status:
+                self._budget.uncount(cache_fp)
+                # It is corrupted, it will be computed again for the next queries and for the
+                # reads of the ongoing queries that were not issued yet. The reads already issued
+                # keep this path, the file is removed once replaced.
+                self._cache_fps_status[cache_fp] = _CacheTileStatus.absent
+                del self._path_of_cache_fp[cache_fp]
+                self._corrupted_path_of_cache_fp[cache_fp] = path
+                self._back_ds.tile_memory_cache.discard(self._raster.uid, cache_fp)
+                self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'absent')
+                msgs += [Msg('CacheExtractor', 'cache_file_removed', cache_fp)]
+                msgs += self._cache_tile_removed_msgs(cache_fp)
+                if cache_fp in self._wanted_cache_fps():
+                    msgs += self._compute_in_background([cache_fp])
+            return msgs
 
         # assertions
         assert self._cache_fps_status[cache_fp] == _CacheTileStatus.checking
@@ -136,17 +320,29 @@ class ActorCacheSupervisor(object):
             assert cache_fp not in query.cache_fps_ensured
             assert cache_fp not in query.cache_fps_to_compute
 
+        if cache_fp in self._invalidated_cache_fps_checking:
+            # This cache tile was invalidated while being checked
+            self._invalidated_cache_fps_checking.remove(cache_fp)
+            if status:
+                self._remove_cache_file(path)
+                status = False
+
         if status:
             # This cache tile is OK to be read
             # - notify the production pipeline
+            if self._raster.cache_validation == 'stat':
+                # Trust it without checking it from now on
+                self._raster.cache_manifest.add(path)
             self._path_of_cache_fp[cache_fp] = path
             self._cache_fps_status[cache_fp] = _CacheTileStatus.ready
             self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'ready')
             msgs += [
                 Msg('CacheExtractor', 'cache_files_ready', {cache_fp: path})
             ]
+            msgs += self._warmups_progress(cache_fp)
         else:
             # This cache tile was corrupted and removed
+            self._budget.uncount(cache_fp)
             self._cache_fps_status[cache_fp] = _CacheTileStatus.absent
             del self._path_of_cache_fp[cache_fp]
             self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'absent')
@@ -172,6 +368,13 @@ class ActorCacheSupervisor(object):
         for qi in queries_treated:
             del self._queries[qi]
 
+        if (adopted and not status and cache_fp not in self._claimed_cache_fps and
+                cache_fp in self._wanted_cache_fps() and
+                all(cache_fp not in query.cache_fps_to_compute for query in self._queries.values())):
+            # Written by another process, the queries that need it do not compute it
+            msgs += self._compute_in_background([cache_fp])
+
+        msgs += self._evict()
         return msgs
 
     def receive_cache_file_written(self, cache_fp, path):
@@ -184,6 +387,38 @@ class ActorCacheSupervisor(object):
         """
         msgs = []
         assert self._cache_fps_status[cache_fp] == _CacheTileStatus.absent
+        self._cache_fps_computing.discard(cache_fp)
+        if cache_fp in self._claimed_cache_fps:
+            self._release(cache_fp)
+
+        if cache_fp in self._invalidated_cache_fps_computing:
+            # Computed before the invalidation, it is never read
+            self._invalidated_cache_fps_computing.remove(cache_fp)
+            self._back_ds.tile_memory_cache.discard(self._raster.uid, cache_fp)
+            if path not in self._invalidated_paths_of_cache_fp.get(cache_fp, ()):
+                # Otherwise it is the invalidated cache file, still read by the ongoing queries
+                os.remove(path)
+                self._raster.cache_manifest.remove(path)
+            msgs += self._cache_tile_removed_msgs(cache_fp)
+            if cache_fp in self._wanted_cache_fps():
+                msgs += self._compute_in_background([cache_fp])
+            return msgs
+
+        if path in self._invalidated_paths_of_cache_fp.get(cache_fp, ()):
+            # Replaced by a cache file with the same checksum
+            self._invalidated_paths_of_cache_fp[cache_fp].remove(path)
+
+        corrupted_path = self._corrupted_path_of_cache_fp.pop(cache_fp, None)
+        if corrupted_path is not None and corrupted_path != path:
+            LOGGER.warning('Removing {} because it failed its check'.format(corrupted_path))
+            os.remove(corrupted_path)
+            self._raster.cache_manifest.remove(corrupted_path)
+        elif corrupted_path is not None:
+            # Replaced by a cache file with the same name, the driver objects opened on the
+            # corrupted file still read its bytes
+            if self._back_ds.used_count(path) == 0:
+                self._back_ds.deactivate(path)
+            self._back_ds.deactivate_all_in_workers()
 
         self._path_of_cache_fp[cache_fp] = path
         self._cache_fps_status[cache_fp] = _CacheTileStatus.ready
@@ -191,6 +426,10 @@ class ActorCacheSupervisor(object):
         msgs += [
             Msg('CacheExtractor', 'cache_files_ready', {cache_fp: path})
         ]
+        msgs += self._warmups_progress(cache_fp)
+        if self._budget.enabled:
+            self._budget.count(cache_fp, os.stat(path).st_size)
+            msgs += self._evict()
         return msgs
 
     def receive_cancel_this_query(self, qi):
@@ -202,38 +441,416 @@ class ActorCacheSupervisor(object):
         """
         if qi in self._queries:
             del self._queries[qi]
-        return []
+        return self._unpin_query(qi)
+
+    def receive_cache_file_sampled(self, qi, prod_idx, cache_fp):
+        """Receive message: A cache file was read for an array of a query
+
+        Parameters
+        ----------
+        qi: _actors.cached.query_infos.QueryInfos
+        prod_idx: int
+        cache_fp: Footprint
+        """
+        prod_idxs_of_cache_fp = self._pinned_cache_fps_of_query.get(qi)
+        if prod_idxs_of_cache_fp is None or cache_fp not in prod_idxs_of_cache_fp:
+            # The query is over
+            return []
+        prod_idxs = prod_idxs_of_cache_fp[cache_fp]
+        prod_idxs.discard(prod_idx)
+        if prod_idxs:
+            return []
+        del prod_idxs_of_cache_fp[cache_fp]
+        self._budget.unpin(cache_fp)
+        self._remove_invalidated_cache_files([cache_fp])
+        return self._evict()
+
+    def receive_query_done(self, qi):
+        """Receive message: All the arrays of a query were produced
+
+        Parameters
+        ----------
+        qi: _actors.cached.query_infos.QueryInfos
+        """
+        return self._unpin_query(qi)
 
     def receive_die(self):
         """Receive message: The raster was killed"""
         assert self._alive
         self._alive = False
 
+        if self._locks is not None:
+            self._locks.release_all()
+            self._locks = None
+        self._claimed_cache_fps.clear()
+        self._foreign_cache_fps.clear()
+        self._adopted_cache_fps.clear()
+        for paths in self._invalidated_paths_of_cache_fp.values():
+            for path in paths:
+                self._remove_cache_file(path)
+        self._invalidated_paths_of_cache_fp.clear()
+        for cache_fp in self._invalidated_cache_fps_checking:
+            path = self._path_of_cache_fp[cache_fp]
+            if os.path.isfile(path):
+                self._remove_cache_file(path)
+        self._invalidated_cache_fps_checking.clear()
+        if self._invalidated_cache_fps_computing:
+            # Written before the raster was killed, but not received yet
+            paths_of_cache_fp = self._raster.scan_cache_path_candidates(
+                self._invalidated_cache_fps_computing
+            )
+            for paths in paths_of_cache_fp.values():
+                for path in paths:
+                    os.remove(path)
+                    self._raster.cache_manifest.remove(path)
+        self._invalidated_cache_fps_computing.clear()
+        self._cache_fps_computing.clear()
+        for warmup in self._warmups.keys():
+            warmup._finish(cancelled=True)
+        self._warmups.clear()
+        self._cache_fps_left_of_warmup.clear()
         self._queries.clear()
         self._path_of_cache_fp = None
+        self._corrupted_path_of_cache_fp.clear()
+        self._pinned_cache_fps_of_query.clear()
+        self._budget = None
         self._cache_fps_status.clear()
         self._raster = None
+        self._back_ds = None
         return []
 
     # ******************************************************************************************* **
+    def _trusted_without_check(self, path):
+        """Whether a cache file found in the cache directory can be read before being checked by the
+        FileChecker, according to the validation policy of the raster"""
+        validation = self._raster.cache_validation
+        if validation == 'full' or self._check_encoding:
+            return False
+        if validation == 'stat':
+            return self._raster.cache_file_matches_manifest(path)
+        return True
+
+    def _prime_directory(self):
+        """Prepare `cache_dir` and index its cache files, before the first query or warmup"""
+        if self._directory_primed:
+            return
+        self._directory_primed = True
+        os.makedirs(self._raster.cache_dir, exist_ok=True)
+        if self._locks is not None:
+            # Before indexing the cache files, creating it modifies `cache_dir`
+            os.makedirs(os.path.join(self._raster.cache_dir, LOCK_DIRNAME), exist_ok=True)
+        if self._raster.overwrite:
+            file_list = self._raster.list_cache_path_candidates()
+            LOGGER.info('Removing {} cache files'.format(
+                len(file_list)
+            ))
+            for path in file_list:
+                os.remove(path)
+            self._raster.cache_manifest.clear()
+
+        encoding = self._raster.cache_encoding
+        recorded_encoding = self._raster.read_cache_encoding()
+        self._check_encoding = recorded_encoding != encoding
+        if self._check_encoding:
+            if recorded_encoding is not None:
+                LOGGER.info(
+                    'The encoding of the cache files of {} changed from {} to {}, the cache '
+                    'files encoded differently will be recomputed'.format(
+                        self._raster.cache_dir, recorded_encoding, encoding,
+                    )
+                )
+                # The files not read in this session must not be trusted by the next ones, the
+                # FileChecker compares their encoding when they are checked
+                self._raster.cache_manifest.forget_stats()
+            self._raster.write_cache_encoding()
+
+        # Index the cache files of the directory, in one pass
+        self._raster.load_cache_manifest()
+        if self._raster.stale_cache_paths:
+            LOGGER.info('Removing {} cache files computed by another version of the recipe'.format(
+                len(self._raster.stale_cache_paths)
+            ))
+            for path in self._raster.stale_cache_paths:
+                os.remove(path)
+                self._raster.cache_manifest.remove(path)
+
+        if self._budget.enabled:
+            for cache_fp in self._raster.cache_fps.flat:
+                path_candidates = self._raster.list_cache_path_candidates(cache_fp)
+                if len(path_candidates) == 1:
+                    self._budget.count(
+                        cache_fp, self._raster.cache_file_size(path_candidates[0]),
+                    )
+
+    def _sort_cache_tiles(self, query, cache_fps):
+        """Sort the cache tiles of a query or of a warmup by status, and start checking the cache
+        files found on disk. The background messages should be sent after the ready cache tiles are
+        notified."""
+        msgs = []
+        background_msgs = []
+        for cache_fp in cache_fps:
+            status = self._cache_fps_status[cache_fp]
+
+            if status == _CacheTileStatus.ready:
+                query.cache_fps_ensured.add(cache_fp)
+
+            elif status == _CacheTileStatus.checking:
+                query.cache_fps_checking.add(cache_fp)
+
+            elif status == _CacheTileStatus.absent:
+                query.cache_fps_to_compute.add(cache_fp)
+
+            elif status == _CacheTileStatus.unknown:
+                path_candidates = self._raster.list_cache_path_candidates(cache_fp)
+                if len(path_candidates) == 1 and self._trusted_without_check(path_candidates[0]):
+                    self._path_of_cache_fp[cache_fp] = path_candidates[0]
+                    self._cache_fps_status[cache_fp] = _CacheTileStatus.ready
+                    self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'ready')
+                    query.cache_fps_ensured.add(cache_fp)
+                    if self._raster.cache_validation == 'lazy':
+                        self._budget.pin(cache_fp)
+                        background_msgs += [
+                            Msg('FileChecker', 'check_cache_file_in_background', cache_fp,
+                                path_candidates[0])
+                        ]
+                elif len(path_candidates) == 1:
+                    self._cache_fps_status[cache_fp] = _CacheTileStatus.checking
+                    self._path_of_cache_fp[cache_fp] = path_candidates[0]
+                    self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'unknown')
+                    query.cache_fps_checking.add(cache_fp)
+                    self._budget.pin(cache_fp)
+                    msgs += [
+                        Msg('FileChecker', 'infer_cache_file_status', cache_fp, path_candidates[0])
+                    ]
+                else:
+                    self._cache_fps_status[cache_fp] = _CacheTileStatus.absent
+                    self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'absent')
+                    for path in path_candidates: # pragma: no cover
+                        LOGGER.warning(
+                            'Removing {} because {} tiles with the same prefix'.format(path, len(path_candidates))
+                        )
+                        os.remove(path)
+                    query.cache_fps_to_compute.add(cache_fp)
+            else: # pragma: no cover
+                assert False
+        return msgs, background_msgs
+
+    def _warmups_progress(self, cache_fp):
+        msgs = []
+        for qi, cache_fps_left in list(self._cache_fps_left_of_warmup.items()):
+            if cache_fp in cache_fps_left:
+                cache_fps_left.remove(cache_fp)
+                if qi.warmup is not None:
+                    qi.warmup._tiles_done(1)
+                if len(cache_fps_left) == 0:
+                    msgs += self._end_warmup(qi, cancelled=False)
+        return msgs
+
+    def _end_warmup(self, qi, cancelled):
+        del self._cache_fps_left_of_warmup[qi]
+        if qi in self._queries:
+            del self._queries[qi]
+        if qi.warmup is not None:
+            del self._warmups[qi.warmup]
+            qi.warmup._finish(cancelled)
+        if qi.cache_computation is None:
+            return []
+        # The computations still scheduled may have been performed for the queries
+        return [
+            Msg('/Global/GlobalPrioritiesWatcher', 'cancel_this_query', self._raster.uid, qi),
+            Msg('ComputationGate1', 'cancel_this_query', qi),
+            Msg('ComputationGate2', 'cancel_this_query', qi),
+            Msg('Computer', 'cancel_this_query', qi),
+        ]
+
+    def _unpin_query(self, qi):
+        cache_fps = self._pinned_cache_fps_of_query.pop(qi, None)
+        if cache_fps is None:
+            return []
+        for cache_fp in cache_fps:
+            self._budget.unpin(cache_fp)
+        self._remove_invalidated_cache_files(cache_fps)
+        return self._evict()
+
+    def _remove_cache_file(self, path):
+        if self._back_ds.used_count(path) == 0:
+            # Otherwise a read of a cancelled query is still running, its result will be discarded
+            self._back_ds.deactivate(path)
+        os.remove(path)
+        self._raster.cache_manifest.remove(path)
+
+    def _remove_invalidated_cache_files(self, cache_fps):
+        for cache_fp in cache_fps:
+            if cache_fp in self._invalidated_paths_of_cache_fp and not self._budget.pinned(cache_fp):
+                for path in self._invalidated_paths_of_cache_fp.pop(cache_fp):
+                    self._remove_cache_file(path)
+
+    def _scan_cache_path_candidates(self, cache_fps):
+        """List the cache files of `cache_dir` for some cache tiles, to find the ones written by
+        other processes, except the ones of this process waiting to be removed"""
+        paths_to_remove = set(self._corrupted_path_of_cache_fp.values())
+        for paths in self._invalidated_paths_of_cache_fp.values():
+            paths_to_remove.update(paths)
+        return {
+            cache_fp: [path for path in paths if path not in paths_to_remove]
+            for cache_fp, paths in self._raster.scan_cache_path_candidates(cache_fps).items()
+        }
+
+    def _evict(self):
+        """Remove the unpinned cache files that exceed the budget, they will be computed again on
+        demand"""
+        msgs = []
+        victims = self._budget.victims()
+        for cache_fp in victims:
+            status = self._cache_fps_status[cache_fp]
+            if status == _CacheTileStatus.ready:
+                path = self._path_of_cache_fp.pop(cache_fp)
+                msgs += [Msg('CacheExtractor', 'cache_file_removed', cache_fp)]
+            else:
+                # Found on disk and not used since
+                assert status == _CacheTileStatus.unknown
+                path, = self._raster.list_cache_path_candidates(cache_fp)
+            self._cache_fps_status[cache_fp] = _CacheTileStatus.absent
+            self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'absent')
+            self._back_ds.tile_memory_cache.discard(self._raster.uid, cache_fp)
+            self._remove_cache_file(path)
+            msgs += self._cache_tile_removed_msgs(cache_fp)
+        if victims:
+            LOGGER.info('Evicted {} cache files from {}'.format(len(victims), self._raster.cache_dir))
+        return msgs
+
+    @staticmethod
+    def _cache_tile_removed_msgs(cache_fp):
+        """The messages that allow a cache tile that was ready to be computed again"""
+        return [
+            Msg('Computer', 'cache_tile_removed', cache_fp),
+            Msg('ComputationAccumulator', 'cache_tile_removed', cache_fp),
+        ]
+
     def _query_start_collection(self, qi, query):
         assert len(query.cache_fps_checking) == 0
         assert len(query.cache_fps_to_compute) > 0
+        msgs = []
+        if self._locks is not None:
+            msgs += self._claim(query.cache_fps_to_compute)
+            if len(query.cache_fps_to_compute) == 0:
+                return msgs
         cache_fps = [
             fp
             for fp in qi.list_of_cache_fp
             if fp in query.cache_fps_to_compute
         ]
         assert qi.cache_computation is None
+        self._cache_fps_computing.update(cache_fps)
         qi.cache_computation = CacheComputationInfos(qi, self._raster, cache_fps)
         self._raster.debug_mngr.event('object_allocated', qi.cache_computation)
-        return [
+        return msgs + [
             Msg('/Global/GlobalPrioritiesWatcher', 'a_query_need_those_cache_tiles',
                 self._raster.uid, qi, cache_fps
             ),
             Msg('ComputationGate1', 'compute_those_cache_files', qi),
         ]
 
+    def _wanted_cache_fps(self):
+        """The cache tiles of the alive queries and warmups"""
+        wanted = set()
+        for cache_fps in self._pinned_cache_fps_of_query.values():
+            wanted.update(cache_fps)
+        for cache_fps in self._cache_fps_left_of_warmup.values():
+            wanted.update(cache_fps)
+        return wanted
+
+    def _claim(self, cache_fps):
+        """Claim some cache tiles before computing them. Remove from the set `cache_fps` the ones
+        claimed by other processes, and the ones they already wrote."""
+        msgs = []
+        cache_fps_claimed = []
+        for cache_fp in list(cache_fps):
+            if cache_fp in self._claimed_cache_fps:
+                continue
+            if (cache_fp in self._foreign_cache_fps or
+                    not self._locks.claim(self._raster.fname_prefix_of_cache_fp(cache_fp))):
+                self._foreign_cache_fps.add(cache_fp)
+                cache_fps.remove(cache_fp)
+            else:
+                self._claimed_cache_fps.add(cache_fp)
+                cache_fps_claimed.append(cache_fp)
+
+        if cache_fps_claimed:
+            # The manifest was loaded before the last cache files of the other processes
+            paths_of_cache_fp = self._scan_cache_path_candidates(cache_fps_claimed)
+            for cache_fp, paths in paths_of_cache_fp.items():
+                if len(paths) == 1:
+                    self._release(cache_fp)
+                    cache_fps.remove(cache_fp)
+                    msgs += self._adopt_cache_file(cache_fp, paths[0])
+        return msgs
+
+    def _release(self, cache_fp):
+        self._claimed_cache_fps.remove(cache_fp)
+        self._locks.release(self._raster.fname_prefix_of_cache_fp(cache_fp))
+
+    def _adopt_cache_file(self, cache_fp, path):
+        """A cache file was written by another process, check it like a cache file found on
+        disk"""
+        msgs = []
+        assert self._cache_fps_status[cache_fp] == _CacheTileStatus.absent
+        self._foreign_cache_fps.discard(cache_fp)
+        if self._budget.enabled:
+            self._budget.count(cache_fp, os.stat(path).st_size)
+        self._path_of_cache_fp[cache_fp] = path
+
+        if self._trusted_without_check(path):
+            self._cache_fps_status[cache_fp] = _CacheTileStatus.ready
+            self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'ready')
+            for query in self._queries.values():
+                if cache_fp in query.cache_fps_to_compute:
+                    query.cache_fps_to_compute.remove(cache_fp)
+                    query.cache_fps_ensured.add(cache_fp)
+            msgs += [
+                Msg('CacheExtractor', 'cache_files_ready', {cache_fp: path})
+            ]
+            msgs += self._warmups_progress(cache_fp)
+            if self._raster.cache_validation == 'lazy':
+                self._budget.pin(cache_fp)
+                msgs += [
+                    Msg('FileChecker', 'check_cache_file_in_background', cache_fp, path)
+                ]
+        else:
+            self._cache_fps_status[cache_fp] = _CacheTileStatus.checking
+            self._raster.debug_mngr.event('cache_file_update', self._raster.facade_proxy, cache_fp, 'unknown')
+            self._adopted_cache_fps.add(cache_fp)
+            self._budget.pin(cache_fp)
+            for query in self._queries.values():
+                if cache_fp in query.cache_fps_to_compute:
+                    query.cache_fps_to_compute.remove(cache_fp)
+                    query.cache_fps_checking.add(cache_fp)
+            msgs += [
+                Msg('FileChecker', 'infer_cache_file_status', cache_fp, path)
+            ]
+        return msgs
+
+    def _compute_in_background(self, cache_fps):
+        """Compute some cache tiles that the ongoing queries need but that none of their
+        collection phases computes, as a warmup"""
+        cache_fps = set(cache_fps)
+        msgs = []
+        if self._locks is not None:
+            self._foreign_cache_fps -= cache_fps
+            msgs += self._claim(cache_fps)
+            if len(cache_fps) == 0:
+                return msgs
+        qi = CacheWarmupInfos(None, [
+            cache_fp
+            for cache_fp in self._raster.cache_fps.flat
+            if cache_fp in cache_fps
+        ], 'normal')
+        query = _Query()
+        query.cache_fps_to_compute = cache_fps
+        self._cache_fps_left_of_warmup[qi] = set(cache_fps)
+        msgs += self._query_start_collection(qi, query)
+        return msgs
+
     # ******************************************************************************************* **
 
 class _CacheTileStatus(enum.Enum):
@@ -247,3 +864,87 @@ class _Query(object):
         self.cache_fps_checking = set()
         self.cache_fps_ensured = set()
         self.cache_fps_to_compute = set()
+
+class _CacheBudget(object):
+    """Accounting of the cache files of a raster on disk, that chooses the ones to evict when
+    `max_cache_bytes` or `max_cache_tiles` is exceeded.
+
+    The unpinned cache tiles are stored in an `IndexedHeap`, by last access for the 'lru' policy
+    or by access count and then last access for the 'lfu' policy. The tiles never accessed, found
+    on disk, are evicted first.
+    """
+
+    def __init__(self, max_bytes, max_tiles, policy):
+        self.max_bytes = max_bytes
+        self.max_tiles = max_tiles
+        self._policy = policy
+        self._bytes = 0
+        self._bytes_of_cache_fp = {}
+        self._pin_count = collections.Counter()
+        self._ticks = itertools.count(1)
+        self._last_access = {}
+        self._access_count = collections.Counter()
+        self._heap_of_evictable = IndexedHeap()
+
+    @property
+    def enabled(self):
+        return self.max_bytes is not None or self.max_tiles is not None
+
+    def access(self, cache_fp):
+        self._last_access[cache_fp] = next(self._ticks)
+        self._access_count[cache_fp] += 1
+        if cache_fp in self._heap_of_evictable:
+            self._heap_of_evictable.update(cache_fp, self._prio(cache_fp))
+
+    def pin(self, cache_fp):
+        self._pin_count[cache_fp] += 1
+        if cache_fp in self._heap_of_evictable:
+            self._heap_of_evictable.remove(cache_fp)
+
+    def pinned(self, cache_fp):
+        return cache_fp in self._pin_count
+
+    def unpin(self, cache_fp):
+        self._pin_count[cache_fp] -= 1
+        if self._pin_count[cache_fp] == 0:
+            del self._pin_count[cache_fp]
+            if cache_fp in self._bytes_of_cache_fp:
+                self._heap_of_evictable.push(cache_fp, self._prio(cache_fp))
+
+    def count(self, cache_fp, nbytes):
+        """A cache file of `nbytes` bytes is on disk"""
+        assert cache_fp not in self._bytes_of_cache_fp
+        self._bytes_of_cache_fp[cache_fp] = nbytes
+        self._bytes += nbytes
+        if cache_fp not in self._pin_count:
+            self._heap_of_evictable.push(cache_fp, self._prio(cache_fp))
+
+    def uncount(self, cache_fp):
+        """A cache file was removed from disk"""
+        nbytes = self._bytes_of_cache_fp.pop(cache_fp, None)
+        if nbytes is None:
+            return
+        self._bytes -= nbytes
+        if cache_fp in self._heap_of_evictable:
+            self._heap_of_evictable.remove(cache_fp)
+
+    def victims(self):
+        """Uncount and return the cache tiles to evict to get back within the budget"""
+        cache_fps = []
+        while self._exceeded() and len(self._heap_of_evictable) > 0:
+            cache_fp = self._heap_of_evictable.peek()
+            self.uncount(cache_fp)
+            cache_fps.append(cache_fp)
+        return cache_fps
+
+    def _exceeded(self):
+        return (
+            (self.max_bytes is not None and self._bytes > self.max_bytes) or
+            (self.max_tiles is not None and len(self._bytes_of_cache_fp) > self.max_tiles)
+        )
+
+    def _prio(self, cache_fp):
+        last_access = self._last_access.get(cache_fp, 0)
+        if self._policy == 'lfu':
+            return (self._access_count[cache_fp], last_access)
+        return (last_access,)
@@ -2,16 +2,18 @@ import logging
 import functools
 import os
 import contextlib
-import multiprocessing as mp
-import multiprocessing.pool
 
 import numpy as np
 
 from buzzard._actors.message import Msg
-from buzzard._actors.pool_job import MaxPrioJobWaiting, PoolJobWorking
+from buzzard._actors.pool_adapter import pool_adapter
+from buzzard._actors.pool_job import MaxPrioJobWaiting, MinPrioJobWaiting, PoolJobWorking
 from buzzard._gdal_file_raster import BackGDALFileRaster
 from buzzard._tools import conv
 from buzzard._footprint import Footprint
+from buzzard._cache_checksum import checksum_of_file
+from buzzard import _worker_activation_pool
+from buzzard._actors.cached.reader import _acquire_driver_object
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,12 +26,7 @@ class ActorFileChecker(object):
         self._alive = True
         io_pool = raster.io_pool
         if io_pool is not None:
-            if isinstance(io_pool, mp.pool.ThreadPool):
-                self._same_address_space = True
-            elif isinstance(io_pool, mp.pool.Pool):
-                self._same_address_space = False
-            else: # pragma: no cover
-                assert False, 'Type should be checked in facade'
+            self._same_address_space = pool_adapter(io_pool).same_address_space
             self._waiting_room_address = '/Pool{}/WaitingRoom'.format(id(io_pool))
             self._working_room_address = '/Pool{}/WorkingRoom'.format(id(io_pool))
         self._waiting_jobs = set()
@@ -47,6 +44,8 @@ class ActorFileChecker(object):
         if self._raster.io_pool is None:
             work = Work(self, cache_fp, path)
             status = work.func()
+            if not status:
+                self._raster.cache_manifest.remove(path)
             msgs += [Msg(
                 'CacheSupervisor', 'inferred_cache_file_status', cache_fp, path, status
             )]
@@ -57,16 +56,45 @@ class ActorFileChecker(object):
 
         return msgs
 
+    def receive_check_cache_file_in_background(self, cache_fp, path):
+        """Receive message: This cache file is already being read, check it when the io pool has
+        nothing else to do
+
+        Parameters
+        ----------
+        cache_fp: Footprint
+        path: str
+        """
+        if self._raster.io_pool is None:
+            work = Work(self, cache_fp, path, background=True)
+            status = work.func()
+            return [Msg(
+                'CacheSupervisor', 'inferred_cache_file_status', cache_fp, path, status
+            )]
+        wait = WaitBackground(self, cache_fp, path)
+        self._waiting_jobs.add(wait)
+        return [Msg(self._waiting_room_address, 'schedule_job', wait)]
+
     def receive_token_to_working_room(self, job, token):
+        if job not in self._waiting_jobs:
+            # The job was unscheduled while the token was on its way (multi-shard scheduler)
+            return [Msg(self._working_room_address, 'salvage_token', token)]
         self._waiting_jobs.remove(job)
-        work = Work(self, job.cache_fp, job.path)
+        work = Work(
+            self, job.cache_fp, job.path, background=isinstance(job, WaitBackground),
+        )
         self._working_jobs.add(work)
         return [
             Msg(self._working_room_address, 'launch_job_with_token', work, token)
         ]
 
     def receive_job_done(self, job, status):
+        if job not in self._working_jobs:
+            # The job was cancelled while the result was on its way (multi-shard scheduler)
+            return []
         self._working_jobs.remove(job)
+        if not status and not job.background:
+            self._raster.cache_manifest.remove(job.path)
         return [
             Msg('CacheSupervisor', 'inferred_cache_file_status', job.cache_fp, job.path, status)
         ]
@@ -93,78 +121,122 @@ class Wait(MaxPrioJobWaiting):
         self.path = path
         super().__init__(actor.address)
 
-class Work(PoolJobWorking):
+class WaitBackground(MinPrioJobWaiting):
     def __init__(self, actor, cache_fp, path):
         self.cache_fp = cache_fp
         self.path = path
-        if actor._raster.io_pool is None or actor._same_address_space:
+        super().__init__(actor.address)
+
+class Work(PoolJobWorking):
+    def __init__(self, actor, cache_fp, path, background=False):
+        self.cache_fp = cache_fp
+        self.path = path
+        self.background = background
+        raster = actor._raster
+        if raster.cache_format == 'GTiff':
+            # The cache file may have been written with other options, in this session or in a
+            # previous one
+            encoding_opt = _gtiff_encoding_of_options(raster.cache_options)
+        else:
+            encoding_opt = None
+        if raster.io_pool is None or actor._same_address_space:
             func = functools.partial(
                 _cache_file_check,
-                cache_fp, path, len(actor._raster), actor._raster.dtype,
-                actor._back_ds
+                cache_fp, path, raster.fname_stem_of_cache_fp(cache_fp), len(raster), raster.dtype,
+                raster.cache_format, encoding_opt, actor._back_ds, None,
+                raster.cache_open_options, raster.cache_checksum, not background,
             )
         else:
             func = functools.partial(
                 _cache_file_check,
-                cache_fp, path, len(actor._raster), actor._raster.dtype,
-                None,
+                cache_fp, path, raster.fname_stem_of_cache_fp(cache_fp), len(raster), raster.dtype,
+                raster.cache_format, encoding_opt, None, actor._back_ds.workers_activation_key,
+                raster.cache_open_options, raster.cache_checksum, not background,
             )
         actor._raster.debug_mngr.event('object_allocated', func)
-        super().__init__(actor.address, func)
-
-def _checksum(fname, buffer_size=512 * 1024, dtype='uint64'):
-    # https://github.com/earthcube-lab/buzzard/pull/39/#discussion_r239071556
-    dtype = np.dtype(dtype)
-    dtypesize = dtype.itemsize
-    assert buffer_size % dtypesize == 0
-    assert np.issubdtype(dtype, np.unsignedinteger)
-
-    acc = dtype.type(0)
-    with open(fname, "rb") as f:
-        with np.warnings.catch_warnings():
-            np.warnings.filterwarnings('ignore', r'overflow encountered')
-
-            for chunk in iter(lambda: f.read(buffer_size), b""):
-                head = np.frombuffer(chunk, dtype, count=len(chunk) // dtypesize)
-                head = np.add.reduce(head, dtype=dtype, initial=acc)
-                acc += head
-
-                tailsize = len(chunk) % dtypesize
-                if tailsize > 0:
-                    # This should only be needed for file's tail
-                    tail = chunk[-tailsize:] + b'\0' * (dtypesize - tailsize)
-                    tail = np.frombuffer(tail, dtype)
-                    acc += tail
-        return '{:016x}'.format(acc.item())
-
-def _cache_file_check(cache_fp, path, channel_count, dtype, back_ds_opt):
+        super().__init__(actor.address, func, affinity=path)
+
+def _gtiff_encoding_of_options(options):
+    """The properties of a GTiff cache file created with those GDAL options that can be checked:
+    the name of its compression, as reported by GDAL in the `IMAGE_STRUCTURE` metadata domain, and
+    the size of its blocks if it is tiled"""
+    values = {}
+    for opt in options:
+        key, _, value = opt.partition('=')
+        values[key.upper()] = value.upper()
+    compression = values.get('COMPRESS', 'NONE')
+    if values.get('TILED', 'NO') in {'YES', 'TRUE', 'ON', '1'}:
+        block_size = (
+            int(values.get('BLOCKXSIZE', 256)),
+            int(values.get('BLOCKYSIZE', 256)),
+        )
+    else:
+        block_size = None
+    return compression, block_size
+
+def _gtiff_encoding_of_gdal_ds(gdal_ds, tiled):
+    """Same as `_gtiff_encoding_of_options`, for an opened GTiff file"""
+    compression = (gdal_ds.GetMetadata('IMAGE_STRUCTURE') or {}).get('COMPRESSION', 'NONE')
+    if tiled:
+        block_size = tuple(gdal_ds.GetRasterBand(1).GetBlockSize())
+    else:
+        block_size = None
+    return compression.upper(), block_size
+
+def _cache_file_check(cache_fp, path, fname_stem, channel_count, dtype, cache_format,
+                      encoding_opt, back_ds_opt, workers_activation_key_opt, open_options,
+                      checksum_algorithm, remove_if_corrupted):
+    if not os.path.isfile(path):
+        # Listed in the manifest of the directory but removed since
+        _deactivate(path, back_ds_opt)
+        LOGGER.warning('{} is missing'.format(path))
+        return False
+
     checksum = path
     checksum = checksum.split('.')[-2]
     checksum = checksum.split('_')[-1]
-    new_checksum = _checksum(path)
+    new_checksum = checksum_of_file(path, checksum_algorithm)
     if new_checksum != checksum:
-        if back_ds_opt is not None:
-            back_ds_opt.deactivate(path)
+        if not remove_if_corrupted:
+            # It may be read at the moment, the CacheSupervisor will remove it once replaced
+            LOGGER.warning('Invalid checksum of {} ({} instead of {})'.format(
+                path, new_checksum, checksum,
+            ))
+            return False
+        _deactivate(path, back_ds_opt)
         LOGGER.warning('Removing {} because invalid checksum ({} instead of {})'.format(
             path, new_checksum, checksum,
         ))
         os.remove(path)
         return False
 
-    allocator = lambda: BackGDALFileRaster.open_file(path, 'GTiff', [], 'r') # This may raise
-    with contextlib.ExitStack() as stack:
-        try:
-            if back_ds_opt is None:
-                gdal_ds = allocator()
-            else:
-                gdal_ds = stack.enter_context(back_ds_opt.acquire_driver_object(path, allocator))
-
-            file_fp = Footprint(
-                gt=gdal_ds.GetGeoTransform(),
-                rsize=(gdal_ds.RasterXSize, gdal_ds.RasterYSize),
+    if cache_format == 'npy':
+        allocator = lambda: np.load(path, mmap_mode='r', allow_pickle=False) # This may raise
+    else:
+        allocator = lambda: BackGDALFileRaster.open_file(
+            path, 'GTiff', list(open_options), 'r',
+        ) # This may raise
+    try:
+        # The driver object is released before being deactivated
+        with contextlib.ExitStack() as stack:
+            obj = _acquire_driver_object(
+                stack, path, allocator, back_ds_opt, workers_activation_key_opt,
             )
-            file_dtype = conv.dtype_of_gdt_downcast(gdal_ds.GetRasterBand(1).DataType)
-            file_len = gdal_ds.RasterCount
+            if cache_format == 'npy':
+                # The footprint of the file is only recorded by a fingerprint in its name
+                if not os.path.basename(path).startswith(fname_stem + '_'):
+                    raise RuntimeError('invalid Footprint of {}(written for another Footprint than '
+                                       '{})'.format(path, cache_fp))
+                file_fp = Footprint(gt=cache_fp.gt, rsize=obj.shape[1::-1])
+                file_dtype = obj.dtype
+                file_len = obj.shape[2]
+            else:
+                file_fp = Footprint(
+                    gt=obj.GetGeoTransform(),
+                    rsize=(obj.RasterXSize, obj.RasterYSize),
+                )
+                file_dtype = conv.dtype_of_gdt_downcast(obj.GetRasterBand(1).DataType)
+                file_len = obj.RasterCount
             if file_fp != cache_fp: # pragma: no cover
                 raise RuntimeError('invalid Footprint of {}({} instead of {})'.format(
                     path, file_fp, cache_fp
@@ -177,13 +249,35 @@ def _cache_file_check(cache_fp, path, channel_count, dtype, back_ds_opt):
                 raise RuntimeError('invalid channel_count of {}({} instead of {})'.format(
                     path, file_len, channel_count
                 ))
-            del gdal_ds
-        except Exception:
-            # Those exceptions should not trigger a cache file removal, because it might originate
-            # from a mistake in the code that does not mean that those files are corrupted. For exemple:
-            # - Maximum number of file descriptors reach
-            # - Mismatch in cache directories path
-            back_ds_opt.deactivate(path)
-            raise
+            if encoding_opt is not None:
+                file_encoding = _gtiff_encoding_of_gdal_ds(obj, encoding_opt[1] is not None)
+            del obj
+    except Exception:
+        # Those exceptions should not trigger a cache file removal, because it might originate
+        # from a mistake in the code that does not mean that those files are corrupted. For exemple:
+        # - Maximum number of file descriptors reach
+        # - Mismatch in cache directories path
+        _deactivate(path, back_ds_opt)
+        raise
+
+    if encoding_opt is not None and file_encoding != encoding_opt:
+        if not remove_if_corrupted:
+            # It may be read at the moment, the CacheSupervisor will remove it once replaced
+            LOGGER.warning('{} is encoded with {} instead of {}'.format(
+                path, file_encoding, encoding_opt,
+            ))
+            return False
+        _deactivate(path, back_ds_opt)
+        LOGGER.warning('Removing {} because encoded with {} instead of {}'.format(
+            path, file_encoding, encoding_opt,
+        ))
+        os.remove(path)
+        return False
 
     return True
+
+def _deactivate(path, back_ds_opt):
+    if back_ds_opt is not None:
+        back_ds_opt.deactivate(path)
+    else:
+        _worker_activation_pool.deactivate(path)
@@ -1,11 +1,10 @@
 import functools
 import collections
-import multiprocessing as mp
-import multiprocessing.pool
 
 import numpy as np
 
 from buzzard._actors.message import Msg
+from buzzard._actors.pool_adapter import pool_adapter
 from buzzard._actors.pool_job import CacheJobWaiting, PoolJobWorking
 
 class ActorMerger(object):
@@ -18,12 +17,7 @@ class ActorMerger(object):
         if merge_pool is not None:
             self._waiting_room_address = '/Pool{}/WaitingRoom'.format(id(merge_pool))
             self._working_room_address = '/Pool{}/WorkingRoom'.format(id(merge_pool))
-            if isinstance(merge_pool, mp.pool.ThreadPool):
-                self._same_address_space = True
-            elif isinstance(merge_pool, mp.pool.Pool):
-                self._same_address_space = False
-            else: # pragma: no cover
-                assert False, 'Type should be checked in facade'
+            self._same_address_space = pool_adapter(merge_pool).same_address_space
         self._waiting_jobs = set()
         self._working_jobs = set()
 
@@ -58,6 +52,9 @@ class ActorMerger(object):
         return msgs
 
     def receive_token_to_working_room(self, job, token):
+        if job not in self._waiting_jobs:
+            # The job was unscheduled while the token was on its way (multi-shard scheduler)
+            return [Msg(self._working_room_address, 'salvage_token', token)]
         self._waiting_jobs.remove(job)
         work = self._create_work_job(job.cache_fp, job.array_per_fp)
         self._working_jobs.add(work)
@@ -66,6 +63,9 @@ class ActorMerger(object):
         ]
 
     def receive_job_done(self, job, result):
+        if job not in self._working_jobs:
+            # The job was cancelled while the result was on its way (multi-shard scheduler)
+            return []
         self._working_jobs.remove(job)
         return self._commit_work_result(job, result)
 
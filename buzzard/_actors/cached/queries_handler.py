@@ -177,6 +177,8 @@ class ActorQueriesHandler(object):
 
             if q.produced_count == qi.produce_count:
                 del self._queries[qi]
+                if len(qi.list_of_cache_fp) > 0:
+                    msgs += [Msg('CacheSupervisor', 'query_done', qi)]
         del queue
 
         return msgs
@@ -69,6 +69,9 @@ class CachedQueryInfos(object):
     Classes' attributes are typed for documentation purposes and for validation with `mypy`
     """
 
+    # The queries of the user rank before the cache warmups, see `CacheWarmupInfos`
+    priority_rank = 0
+
     def __init__(self, raster, list_of_prod_fp,
                  channel_ids, is_flat, dst_nodata, interpolation,
                  max_queue_size,
@@ -256,6 +259,50 @@ class CachedQueryInfos(object):
     def __eq__(self, other):
         return self is other
 
+class CacheWarmupInfos(object):
+    """Object that stores informations about a cache warmup, it stands for a query in the
+    computation phase. There is nothing to produce, the `prod_idx` of a cache tile is its index in
+    `list_of_cache_fp`.
+
+    An instance of this class identifies a warmup among the actors, hence the `__hash__`
+    implementation.
+    """
+
+    def __init__(self, warmup, list_of_cache_fp, priority):
+        """
+        Parameters
+        ----------
+        warmup: _cache_warmup.CacheWarmup
+        list_of_cache_fp: sequence of CacheFootprint
+            The cache tiles to warm, ordered by priority
+        priority: str
+            One of `_cache_warmup.WARM_CACHE_PRIORITIES`
+        """
+        # Mutable attributes ******************************************************************** **
+        self.cache_computation = None # type: Union[None, CacheComputationInfos]
+
+        # Immutable attributes ****************************************************************** **
+        self.warmup = warmup
+        self.priority_rank = {'normal': 0, 'low': 1}[priority] # type: int
+        self.parent_uid = None
+        self.key_in_parent = None
+
+        self.list_of_cache_fp = tuple(list_of_cache_fp) # type: Tuple[CacheFootprint, ...]
+        self.dict_of_min_prod_idx_per_cache_fp = MappingProxyType({
+            cache_fp: i
+            for i, cache_fp in enumerate(self.list_of_cache_fp)
+        }) # type: Mapping[CacheFootprint, int]
+
+        # Nothing is produced, all the computations are allowed at once by `ComputationGate1`
+        self.produce_count = len(self.list_of_cache_fp) # type: int
+        self.max_queue_size = len(self.list_of_cache_fp) # type: int
+
+    def __hash__(self):
+        return id(self)
+
+    def __eq__(self, other):
+        return self is other
+
 class CacheComputationInfos(object):
     """Object that store informations about a computation phase of a query.
     Instanciating this object also starts the primitives collection from the list of the cache
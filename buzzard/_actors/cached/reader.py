@@ -1,15 +1,16 @@
 import functools
 import collections
-import multiprocessing as mp
-import multiprocessing.pool
 import contextlib
 
 import numpy as np
 
 from buzzard._actors.message import Msg
+from buzzard._actors.pool_adapter import pool_adapter
 from buzzard._actors.pool_job import ProductionJobWaiting, PoolJobWorking
 from buzzard import _tools
 from buzzard._gdal_file_raster import BackGDALFileRaster
+from buzzard._shared_memory_arena import SharedArray
+from buzzard import _worker_activation_pool
 
 class ActorReader(object):
     """Actor that takes care of reading cache tiles"""
@@ -18,16 +19,14 @@ class ActorReader(object):
         self._raster = raster
         self._back_ds = raster.back_ds
         self._alive = True
+        self._arena = None
         io_pool = raster.io_pool
         if io_pool is not None:
             self._waiting_room_address = '/Pool{}/WaitingRoom'.format(id(io_pool))
             self._working_room_address = '/Pool{}/WorkingRoom'.format(id(io_pool))
-            if isinstance(io_pool, mp.pool.ThreadPool):
-                self._same_address_space = True
-            elif isinstance(io_pool, mp.pool.Pool):
-                self._same_address_space = False
-            else: # pragma: no cover
-                assert False, 'Type should be checked in facade'
+            self._same_address_space = pool_adapter(io_pool).same_address_space
+            if not self._same_address_space:
+                self._arena = raster.back_ds.shared_memory_arena
         self._waiting_jobs = set()
         self._working_jobs = set()
 
@@ -58,7 +57,31 @@ class ActorReader(object):
 
         return msgs
 
+    def receive_sample_cache_tile_from_memory(self, qi, prod_idx, cache_fp, tile_array):
+        """Receive message: This cache tile is in the tile memory cache, sample it without reading
+        its cache file
+
+        Parameters
+        ----------
+        qi: _actors.cached.query_infos.CachedQueryInfos
+        prod_idx: int
+        cache_fp: Footprint
+        tile_array: np.ndarray of shape (Y, X, C)
+            The whole cache tile
+        """
+        dst_array = self._get_sample_array(qi, prod_idx)
+        full_sample_fp = qi.prod[prod_idx].sample_fp
+        sample_fp = full_sample_fp & cache_fp
+        _sample_cache_tile(
+            tile_array, cache_fp, sample_fp, qi.unique_channel_ids,
+            dst_array[sample_fp.slice_in(full_sample_fp)],
+        )
+        return self._commit_sample(qi, prod_idx, cache_fp)
+
     def receive_token_to_working_room(self, job, token):
+        if job not in self._waiting_jobs:
+            # The job was unscheduled while the token was on its way (multi-shard scheduler)
+            return [Msg(self._working_room_address, 'salvage_token', token)]
         self._waiting_jobs.remove(job)
         work = self._create_work_job(job.qi, job.prod_idx, job.cache_fp, job.path)
         self._working_jobs.add(work)
@@ -67,6 +90,10 @@ class ActorReader(object):
         ]
 
     def receive_job_done(self, job, result):
+        if job not in self._working_jobs:
+            # The job was cancelled while the result was on its way (multi-shard scheduler)
+            job.discard()
+            return []
         self._working_jobs.remove(job)
         return self._commit_work_result(job, result)
 
@@ -120,6 +147,10 @@ class ActorReader(object):
 
     # ******************************************************************************************* **
     def _create_work_job(self, qi, prod_idx, cache_fp, path):
+        dst_array = self._get_sample_array(qi, prod_idx)
+        return Work(self, qi, prod_idx, cache_fp, path, dst_array)
+
+    def _get_sample_array(self, qi, prod_idx):
         if prod_idx not in self._sample_array_per_prod_tile[qi]:
             # Allocate sample array
             # If no interpolation or nodata conversion is necessary, this is the array that will be
@@ -135,32 +166,44 @@ class ActorReader(object):
             )
             self._missing_cache_fps_per_prod_tile[qi][prod_idx] = set(qi.prod[prod_idx].cache_fps)
 
-        dst_array = self._sample_array_per_prod_tile[qi][prod_idx]
-        return Work(self, qi, prod_idx, cache_fp, path, dst_array)
+        return self._sample_array_per_prod_tile[qi][prod_idx]
 
     def _commit_work_result(self, job, result):
-        if self._raster.io_pool is None or self._same_address_space:
+        if job.whole_tile:
+            # The whole cache tile was read, keep it in memory
+            tile_array = job.tile_array if job.tile_array is not None else result
+            self._back_ds.tile_memory_cache.put(self._raster.uid, job.cache_fp, tile_array)
+            _sample_cache_tile(
+                tile_array, job.cache_fp, job.sample_fp, job.qi.unique_channel_ids,
+                job.dst_array_slice,
+            )
+        elif self._raster.io_pool is None or self._same_address_space:
             assert result is None
+        elif job.shared_array is not None:
+            assert result is None
+            self._arena.take_back(job.shared_array, job.dst_array_slice)
         else:
             job.dst_array_slice[:] = result
+        return self._commit_sample(job.qi, job.prod_idx, job.cache_fp)
 
-        dst_array = self._sample_array_per_prod_tile[job.qi][job.prod_idx]
-        self._missing_cache_fps_per_prod_tile[job.qi][job.prod_idx].remove(job.cache_fp)
+    def _commit_sample(self, qi, prod_idx, cache_fp):
+        dst_array = self._sample_array_per_prod_tile[qi][prod_idx]
+        self._missing_cache_fps_per_prod_tile[qi][prod_idx].remove(cache_fp)
 
         # Perform fine grain garbage collection
-        if len(self._missing_cache_fps_per_prod_tile[job.qi][job.prod_idx]) == 0:
+        if len(self._missing_cache_fps_per_prod_tile[qi][prod_idx]) == 0:
             # Done reading for that `(qi, prod_idx)`
-            del self._missing_cache_fps_per_prod_tile[job.qi][job.prod_idx]
-            del self._sample_array_per_prod_tile[job.qi][job.prod_idx]
+            del self._missing_cache_fps_per_prod_tile[qi][prod_idx]
+            del self._sample_array_per_prod_tile[qi][prod_idx]
 
-        if len(self._missing_cache_fps_per_prod_tile[job.qi]) == 0:
+        if len(self._missing_cache_fps_per_prod_tile[qi]) == 0:
             # Not reading for that `qi`
-            del self._missing_cache_fps_per_prod_tile[job.qi]
-            del self._sample_array_per_prod_tile[job.qi]
+            del self._missing_cache_fps_per_prod_tile[qi]
+            del self._sample_array_per_prod_tile[qi]
 
         return [
             Msg('CacheExtractor', 'sampled_a_cache_file_to_the_array',
-                job.qi, job.prod_idx, job.cache_fp, dst_array,
+                qi, prod_idx, cache_fp, dst_array,
             )
         ]
 
@@ -185,23 +228,61 @@ class Work(PoolJobWorking):
         sample_fp = full_sample_fp & cache_fp
 
         dst_array_slice = dst_array[sample_fp.slice_in(full_sample_fp)]
+        self.shared_array = None
+        self.tile_array = None
+        self.whole_tile = False
 
-        if actor._raster.io_pool is None or actor._same_address_space:
+        if actor._raster.cache_format == 'npy':
+            read = _npy_cache_file_read
+        else:
+            read = functools.partial(_cache_file_read, open_options=actor._raster.cache_open_options)
+
+        tile_shape = tuple(cache_fp.shape) + (len(raster),)
+        tile_nbytes = int(np.prod(tile_shape)) * np.dtype(raster.dtype).itemsize
+        if actor._back_ds.tile_memory_cache.accepts(tile_nbytes):
+            # Read the whole cache tile to keep it in memory, it is sampled by the actor
+            self.whole_tile = True
+            self.sample_fp = sample_fp
+            self.dst_array_slice = dst_array_slice
+            if actor._raster.io_pool is None or actor._same_address_space:
+                self.tile_array = np.empty(tile_shape, raster.dtype)
+                func = functools.partial(
+                    read,
+                    path, cache_fp, raster.dtype, range(len(raster)), cache_fp, self.tile_array,
+                    actor._back_ds, None,
+                )
+            else:
+                func = functools.partial(
+                    read,
+                    path, cache_fp, raster.dtype, range(len(raster)), cache_fp,
+                    None, None, actor._back_ds.workers_activation_key,
+                )
+        elif actor._raster.io_pool is None or actor._same_address_space:
             func = functools.partial(
-                _cache_file_read,
+                read,
                 path, cache_fp, actor._raster.dtype, qi.unique_channel_ids, sample_fp, dst_array_slice,
-                actor._back_ds,
+                actor._back_ds, None,
             )
         else:
             self.dst_array_slice = dst_array_slice
+            if actor._arena is not None:
+                # Read to shared memory instead of returning the array through the pool
+                self._arena = actor._arena
+                self.shared_array = self._arena.lend(dst_array_slice.shape, dst_array_slice.dtype)
             func = functools.partial(
-                _cache_file_read,
-                path, cache_fp, actor._raster.dtype, qi.unique_channel_ids, sample_fp, None, None,
+                read,
+                path, cache_fp, actor._raster.dtype, qi.unique_channel_ids, sample_fp,
+                self.shared_array, None, actor._back_ds.workers_activation_key,
             )
         actor._raster.debug_mngr.event('object_allocated', func)
-        super().__init__(actor.address, func)
+        super().__init__(actor.address, func, affinity=path)
+
+    def discard(self):
+        if self.shared_array is not None:
+            self._arena.release(self.shared_array)
 
-def _cache_file_read(path, cache_fp, dtype, channel_ids, sample_fp, dst_opt, back_ds_opt):
+def _cache_file_read(path, cache_fp, dtype, channel_ids, sample_fp, dst_opt, back_ds_opt,
+                     workers_activation_key_opt, open_options=()):
     """
     Parameters
     ----------
@@ -213,16 +294,21 @@ def _cache_file_read(path, cache_fp, dtype, channel_ids, sample_fp, dst_opt, bac
     channel_ids: sequence of int
     sample_fp: Footprint
         Rect of `cache_fp` to read
-    dst_opt: None or np.ndarray
+    dst_opt: None or np.ndarray or SharedArray
         optional destination for read
+    back_ds_opt: None or BackDataset
+        activation pool of the driver objects, if in the scheduler's process
+    workers_activation_key_opt: None or (str, int)
+        key of the activation pool of the worker, if on a process pool
+    open_options: sequence of str
+        GDAL open options of the cache file
     """
 
-    allocator = lambda: BackGDALFileRaster.open_file(path, 'GTiff', [], 'r')
+    allocator = lambda: BackGDALFileRaster.open_file(path, 'GTiff', list(open_options), 'r')
     with contextlib.ExitStack() as stack:
-        if back_ds_opt is None:
-            gdal_ds = allocator()
-        else:
-            gdal_ds = stack.enter_context(back_ds_opt.acquire_driver_object(path, allocator))
+        gdal_ds = _acquire_driver_object(
+            stack, path, allocator, back_ds_opt, workers_activation_key_opt,
+        )
 
         # Check raster
         if gdal_ds is None: # pragma: no cover
@@ -243,13 +329,7 @@ def _cache_file_read(path, cache_fp, dtype, channel_ids, sample_fp, dst_opt, bac
                 stored_dtype,
             ))
 
-        # Allocate if ProcessPool
-        if dst_opt is None:
-            dst = np.empty(np.r_[sample_fp.shape, len(channel_ids)], dtype)
-            ret = dst
-        else:
-            dst = dst_opt
-            ret = None
+        dst, ret = _dst_of_dst_opt(dst_opt, sample_fp, dtype, channel_ids)
 
         # Perform read
         rtlx, rtly = cache_fp.spatial_to_raster(sample_fp.tl)
@@ -269,3 +349,76 @@ def _cache_file_read(path, cache_fp, dtype, channel_ids, sample_fp, dst_opt, bac
 
     # Return
     return ret
+
+def _npy_cache_file_read(path, cache_fp, dtype, channel_ids, sample_fp, dst_opt, back_ds_opt,
+                         workers_activation_key_opt):
+    """Same as `_cache_file_read`, for a cache file in the `npy` format. The file is
+    memory-mapped, the memory map is kept by the activation pools like GDAL datasets are.
+    """
+    allocator = lambda: np.load(path, mmap_mode='r', allow_pickle=False)
+    with contextlib.ExitStack() as stack:
+        mm = _acquire_driver_object(
+            stack, path, allocator, back_ds_opt, workers_activation_key_opt,
+        )
+
+        # Check raster
+        if mm.shape[:2] != tuple(cache_fp.shape): # pragma: no cover
+            raise RuntimeError('{} was expected to have shape {}, not {}'.format(
+                path,
+                tuple(cache_fp.shape),
+                mm.shape[:2],
+            ))
+        if mm.dtype != dtype: # pragma: no cover
+            raise RuntimeError('{} was expected to have dtype {}, not {}'.format(
+                path,
+                dtype,
+                mm.dtype,
+            ))
+
+        dst, ret = _dst_of_dst_opt(dst_opt, sample_fp, dtype, channel_ids)
+
+        # Perform read
+        rtlx, rtly = cache_fp.spatial_to_raster(sample_fp.tl)
+        src = mm[
+            int(rtly):int(rtly) + int(sample_fp.rsizey),
+            int(rtlx):int(rtlx) + int(sample_fp.rsizex),
+        ]
+        if list(channel_ids) == list(range(mm.shape[2])):
+            dst[...] = src
+        else:
+            for i, ci in enumerate(channel_ids):
+                dst[..., i] = src[..., ci]
+        del src
+    del mm
+
+    # Return
+    return ret
+
+def _sample_cache_tile(tile_array, cache_fp, sample_fp, channel_ids, dst):
+    """Copy a rect of a whole cache tile to `dst`"""
+    src = tile_array[sample_fp.slice_in(cache_fp)]
+    if list(channel_ids) == list(range(tile_array.shape[2])):
+        dst[...] = src
+    else:
+        for i, ci in enumerate(channel_ids):
+            dst[..., i] = src[..., ci]
+
+def _acquire_driver_object(stack, path, allocator, back_ds_opt, workers_activation_key_opt):
+    """Get a driver object from the right activation pool, if any"""
+    if back_ds_opt is not None:
+        return stack.enter_context(back_ds_opt.acquire_driver_object(path, allocator))
+    if workers_activation_key_opt is not None:
+        return stack.enter_context(_worker_activation_pool.acquire_driver_object(
+            path, allocator, workers_activation_key_opt,
+        ))
+    return allocator()
+
+def _dst_of_dst_opt(dst_opt, sample_fp, dtype, channel_ids):
+    """Get the array to read to, and the array to return"""
+    # Allocate if ProcessPool
+    if dst_opt is None:
+        dst = np.empty(np.r_[sample_fp.shape, len(channel_ids)], dtype)
+        return dst, dst
+    if isinstance(dst_opt, SharedArray):
+        return dst_opt.attach(), None
+    return dst_opt, None
@@ -3,9 +3,11 @@ import uuid
 import functools
 
 import numpy as np
+from osgeo import gdal
 
 from buzzard._actors.message import Msg
 from buzzard._actors.pool_job import CacheJobWaiting, PoolJobWorking
+from buzzard._cache_checksum import checksum_hasher, checksum_of_bytes, HashingStream
 
 create_raster = None # lazy import
 
@@ -14,6 +16,7 @@ class ActorWriter(object):
 
     def __init__(self, raster):
         self._raster = raster
+        self._back_ds = raster.back_ds
         self._alive = True
         io_pool = raster.io_pool
         if io_pool is not None:
@@ -38,10 +41,16 @@ class ActorWriter(object):
         """
         msgs = []
 
+        memory_cache = self._back_ds.tile_memory_cache
+        if memory_cache.accepts(array.nbytes):
+            # Keep a copy, `array` may be a view of a bigger computed array
+            memory_cache.put(self._raster.uid, cache_fp, np.array(array, copy=True))
+
         if self._raster.io_pool is None:
             # No `io_pool` provided by user, perform write operation right now on this thread.
             work = Work(self, cache_fp, array)
             path = work.func()
+            self._raster.cache_manifest.add(path)
             msgs += [Msg('CacheSupervisor', 'cache_file_written', cache_fp, path)]
         else:
             # Enqueue job in the `Pool/WaitingRoom` actor
@@ -58,6 +67,9 @@ class ActorWriter(object):
         job: Wait
         token: pool_waiting_room._PoolToken
         """
+        if job not in self._waiting_jobs:
+            # The job was unscheduled while the token was on its way (multi-shard scheduler)
+            return [Msg(self._working_room_address, 'salvage_token', token)]
         self._waiting_jobs.remove(job)
         work = Work(self, job.cache_fp, job.array)
         self._working_jobs.add(work)
@@ -74,7 +86,11 @@ class ActorWriter(object):
         result: str
             Path to the written file
         """
+        if job not in self._working_jobs:
+            # The job was cancelled while the result was on its way (multi-shard scheduler)
+            return []
         self._working_jobs.remove(job)
+        self._raster.cache_manifest.add(result)
         return [Msg('CacheSupervisor', 'cache_file_written', job.cache_fp, result)]
 
     def receive_die(self):
@@ -90,6 +106,7 @@ class ActorWriter(object):
         self._waiting_jobs.clear()
         self._working_jobs.clear()
         self._raster = None
+        self._back_ds = None
 
         return msgs
 
@@ -111,51 +128,30 @@ class Work(PoolJobWorking):
             _cache_file_write,
             array,
             actor._raster.cache_dir,
-            actor._raster.fname_prefix_of_cache_fp(cache_fp),
-            '.tif',
+            actor._raster.fname_stem_of_cache_fp(cache_fp),
+            actor._raster.cache_file_extension,
             cache_fp,
             {'nodata': actor._raster.nodata},
             actor._raster.wkt_stored,
+            actor._raster.cache_format,
+            actor._raster.cache_options,
+            actor._raster.cache_checksum,
         )
         actor._raster.debug_mngr.event('object_allocated', func)
 
         super().__init__(actor.address, func)
 
-def _checksum(fname, buffer_size=512 * 1024, dtype='uint64'):
-    # https://github.com/earthcube-lab/buzzard/pull/39/#discussion_r239071556
-    dtype = np.dtype(dtype)
-    dtypesize = dtype.itemsize
-    assert buffer_size % dtypesize == 0
-    assert np.issubdtype(dtype, np.unsignedinteger)
-
-    acc = dtype.type(0)
-    with open(fname, "rb") as f:
-        with np.warnings.catch_warnings():
-            np.warnings.filterwarnings('ignore', r'overflow encountered')
-
-            for chunk in iter(lambda: f.read(buffer_size), b""):
-                head = np.frombuffer(chunk, dtype, count=len(chunk) // dtypesize)
-                head = np.add.reduce(head, dtype=dtype, initial=acc)
-                acc += head
-
-                tailsize = len(chunk) % dtypesize
-                if tailsize > 0:
-                    # This should only be needed for file's tail
-                    tail = chunk[-tailsize:] + b'\0' * (dtypesize - tailsize)
-                    tail = np.frombuffer(tail, dtype)
-                    acc += tail
-        return '{:016x}'.format(acc.item())
-
 def _cache_file_write(array,
                       dir_path, filename_prefix, filename_suffix,
-                      cache_fp, channels_schema, sr):
+                      cache_fp, channels_schema, sr, cache_format, options, checksum_algorithm):
     """Write this ndarray to disk.
 
     It can't use the dataset's activation pool because the file must be closed after
-    writing to:
-    1. flush to disk
-    2. checksum
-    3. be renamed
+    writing to be renamed after its checksum.
+
+    The checksum is computed on the bytes while they are produced, the file is never read back:
+    - a 'npy' file is hashed while it is written,
+    - a 'GTiff' file is first encoded in memory by GDAL, hashed, and then written in one go.
 
     Parameters
     ----------
@@ -173,33 +169,49 @@ def _cache_file_write(array,
         Band schema given by user when creating the cached recipe
     sr: str or None
         Spatial reference given by user when creating the cached recipe
+    cache_format: str
+        'GTiff' or 'npy'
+    options: list of str
+        GDAL creation options of a 'GTiff' file
+    checksum_algorithm: str
+        One of `buzzard._cache_checksum.CHECKSUM_ALGORITHMS`
     """
     # Step 0. Lazily import buzzard to avoid circular dependencies
     global create_raster
     if create_raster is None:
         from buzzard import create_raster
 
-    # Step 1. Create/close file with a temporary name
+    # Step 1. Write file with a temporary name, and checksum it on the way
     src_path = os.path.join(
         dir_path, 'tmp_' + filename_prefix + str(uuid.uuid4()) + filename_suffix
     )
 
-    # TODO: Allow the user to choose the type and options of cache files
-    # TODO: Use driver-object allocator
-    options = [
-        "TILED=YES",
-        "BLOCKXSIZE=256", "BLOCKYSIZE=256",
-        "SPARSE_OK=TRUE",
-    ]
     assert array.ndim == 3
-    with create_raster(src_path, cache_fp, array.dtype, array.shape[-1], channels_schema,
-                       sr=sr, options=options).close as r:
-        r.set_data(array, channels=None)
-
-    # Step 2. checksum hash file
-    checksum = _checksum(src_path)
-
-    # Step 3. move file to its final location
+    if cache_format == 'npy':
+        # The footprint of the file is given by its name, only the array is stored
+        hasher = checksum_hasher(checksum_algorithm)
+        with open(src_path, 'wb') as stream:
+            np.lib.format.write_array(
+                HashingStream(stream, hasher), np.ascontiguousarray(array), allow_pickle=False,
+            )
+        checksum = hasher.hexdigest()
+    else:
+        mem_path = '/vsimem/' + os.path.basename(src_path)
+        try:
+            # TODO: Use driver-object allocator
+            with create_raster(mem_path, cache_fp, array.dtype, array.shape[-1], channels_schema,
+                               sr=sr, options=options).close as r:
+                r.set_data(array, channels=None)
+            data = _vsimem_file_bytes(mem_path)
+        finally:
+            if gdal.VSIStatL(mem_path) is not None:
+                gdal.Unlink(mem_path)
+        checksum = checksum_of_bytes(data, checksum_algorithm)
+        with open(src_path, 'wb') as stream:
+            stream.write(data)
+        del data
+
+    # Step 2. move file to its final location
     dst_path = os.path.join(dir_path, filename_prefix + '_' + checksum + filename_suffix)
 
     # TODO: Undefined if it exists, but it will most likely work
@@ -207,3 +219,14 @@ def _cache_file_write(array,
     os.rename(src_path, dst_path)
 
     return dst_path
+
+def _vsimem_file_bytes(path):
+    """Read a file of GDAL's in-memory file system"""
+    stream = gdal.VSIFOpenL(path, 'rb')
+    if stream is None: # pragma: no cover
+        raise RuntimeError('Could not open {}'.format(path))
+    try:
+        size = gdal.VSIStatL(path).size
+        return gdal.VSIFReadL(1, size, stream)
+    finally:
+        gdal.VSIFCloseL(stream)
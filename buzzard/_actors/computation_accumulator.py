@@ -18,6 +18,7 @@ class ActorComputationAccumulator(object):
         self._raster = raster
         self._alive = True
         self._cache_tiles_accumulations = {}
+        self._merged_cache_fps = set()
         self.address = '/Raster{}/ComputationAccumulator'.format(self._raster.uid)
 
     @property
@@ -29,6 +30,9 @@ class ActorComputationAccumulator(object):
         msgs = []
 
         for cache_fp in self._raster.cache_fps_of_compute_fp[compute_fp]:
+            if cache_fp in self._merged_cache_fps:
+                # This array was computed again for another cache tile that was removed
+                continue
 
             # Fetch and update storage for that cache_fp
             if cache_fp in self._cache_tiles_accumulations:
@@ -39,7 +43,9 @@ class ActorComputationAccumulator(object):
                     'ready': {},
                 }
                 self._cache_tiles_accumulations[cache_fp] = store
-            assert compute_fp in store['missing']
+            if compute_fp not in store['missing']:
+                # Same as above, but this cache tile is still being accumulated
+                continue
             store['missing'].remove(compute_fp)
 
             compute_fp_part = compute_fp & cache_fp
@@ -57,13 +63,25 @@ class ActorComputationAccumulator(object):
                     Msg('Merger', 'merge_those_arrays', cache_fp, store['ready'])
                 ]
                 del self._cache_tiles_accumulations[cache_fp]
+                self._merged_cache_fps.add(cache_fp)
         return msgs
 
+    def receive_cache_tile_removed(self, cache_fp):
+        """Receive message: A cache file was removed, it may be accumulated again
+
+        Parameters
+        ----------
+        cache_fp: Footprint
+        """
+        self._merged_cache_fps.discard(cache_fp)
+        return []
+
     def receive_die(self):
         """Receive message: The raster was killed"""
         assert self._alive
         self._alive = False
         self._cache_tiles_accumulations.clear()
+        self._merged_cache_fps.clear()
         self._raster = None
         return []
 
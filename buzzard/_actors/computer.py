@@ -1,11 +1,10 @@
 import collections
-import multiprocessing as mp
-import multiprocessing.pool
 import functools
 
 import numpy as np
 
 from buzzard._actors.message import Msg
+from buzzard._actors.pool_adapter import pool_adapter
 from buzzard._actors.pool_job import ProductionJobWaiting, PoolJobWorking
 
 class ActorComputer(object):
@@ -14,16 +13,14 @@ class ActorComputer(object):
     def __init__(self, raster):
         self._raster = raster
         self._alive = True
+        self._arena = None
         computation_pool = raster.computation_pool
         if computation_pool is not None:
             self._waiting_room_address = '/Pool{}/WaitingRoom'.format(id(computation_pool))
             self._working_room_address = '/Pool{}/WorkingRoom'.format(id(computation_pool))
-            if isinstance(computation_pool, mp.pool.ThreadPool):
-                self._same_address_space = True
-            elif isinstance(computation_pool, mp.pool.Pool):
-                self._same_address_space = False
-            else: # pragma: no cover
-                assert False, 'Type should be checked in facade'
+            self._same_address_space = pool_adapter(computation_pool).same_address_space
+            if not self._same_address_space:
+                self._arena = raster.back_ds.shared_memory_arena
         self._waiting_jobs_per_query = collections.defaultdict(set)
         self._working_jobs = set()
 
@@ -59,6 +56,10 @@ class ActorComputer(object):
     def receive_token_to_working_room(self, job, token):
         msgs = []
 
+        if job not in self._waiting_jobs_per_query.get(job.qi, ()):
+            # The job was unscheduled while the token was on its way (multi-shard scheduler)
+            return [Msg(self._working_room_address, 'salvage_token', token)]
+
         self._waiting_jobs_per_query[job.qi].remove(job)
         if len(self._waiting_jobs_per_query[job.qi]) == 0:
             del self._waiting_jobs_per_query[job.qi]
@@ -71,16 +72,41 @@ class ActorComputer(object):
             self._performed_computations.add(compute_fp)
             self._working_jobs.add(work)
         else:
+            # The work was still created to collect the primitive arrays
+            work.discard()
             msgs += [Msg(self._working_room_address, 'salvage_token', token)]
 
         return msgs
 
     def receive_job_done(self, job, result):
+        if job not in self._working_jobs:
+            # The job was cancelled while the result was on its way (multi-shard scheduler)
+            job.discard()
+            return []
+        if job.shared_array is not None:
+            if result is None:
+                result = self._arena.take_back(job.shared_array)
+            else:
+                # The array did not fit in shared memory, it will be rejected by normalization
+                self._arena.release(job.shared_array)
         result = self._normalize_user_result(job.compute_fp, result)
         self._raster.debug_mngr.event('object_allocated', result)
         self._working_jobs.remove(job)
         return self._commit_work_result(job, result)
 
+    def receive_cache_tile_removed(self, cache_fp):
+        """Receive message: A cache file was removed, the computations it depends on may be
+        performed again
+
+        Parameters
+        ----------
+        cache_fp: Footprint
+        """
+        self._performed_computations.difference_update(
+            self._raster.compute_fps_of_cache_fp[cache_fp]
+        )
+        return []
+
     def receive_cancel_this_query(self, qi):
         """Receive message: One query was dropped
 
@@ -166,6 +192,7 @@ class Work(PoolJobWorking):
         compute_fp = qicc.list_of_compute_fp[compute_idx]
 
         self.compute_fp = compute_fp
+        self.shared_array = None
 
         primitive_arrays = {}
         primitive_footprints = {}
@@ -183,8 +210,23 @@ class Work(PoolJobWorking):
                 primitive_arrays,
                 actor._raster.facade_proxy
             )
+        elif actor._arena is None:
+            func = functools.partial(
+                actor._raster.compute_array,
+                compute_fp,
+                primitive_footprints,
+                primitive_arrays,
+                None,
+            )
         else:
+            # Write the result to shared memory instead of returning it through the pool
+            self._arena = actor._arena
+            self.shared_array = self._arena.lend(
+                np.r_[compute_fp.shape, len(actor._raster)], actor._raster.dtype,
+            )
             func = functools.partial(
+                _compute_array_to_shared_array,
+                self.shared_array,
                 actor._raster.compute_array,
                 compute_fp,
                 primitive_footprints,
@@ -194,3 +236,19 @@ class Work(PoolJobWorking):
         actor._raster.debug_mngr.event('object_allocated', func)
 
         super().__init__(actor.address, func)
+
+    def discard(self):
+        if self.shared_array is not None:
+            self._arena.release(self.shared_array)
+
+def _compute_array_to_shared_array(dst, compute_array, *args):
+    """Call the user's `compute_array` function on a process pool and write its result to `dst`.
+    A result that does not have the expected shape is returned, the scheduler will reject it.
+    """
+    res = compute_array(*args)
+    if isinstance(res, np.ndarray):
+        res = np.atleast_3d(res)
+        if res.shape == dst.shape:
+            dst.attach()[...] = res
+            return None
+    return res
@@ -10,6 +10,10 @@ from buzzard._footprint import Footprint # For mypy
 from buzzard._actors.priorities import Priorities
 from buzzard._actors.message import Msg
 
+# The cache tiles that no query or warmup needs anymore rank after all the others, even after the
+# ones of the 'low' warmups (see `CacheWarmupInfos.priority_rank`)
+ORPHAN_PRIORITY_RANK = 2
+
 class ActorGlobalPrioritiesWatcher(object):
     """Actor that takes care of memorizing priority information between all sub-tasks in all
     ongoing queries. Everytime a priority changes all `ActorPoolWaitingRoom` are notified.
@@ -201,20 +205,20 @@ class ActorGlobalPrioritiesWatcher(object):
         else:
             query_pulled_count = ds1[qi]
 
-        # Priority on `produced arrays` needed soon
+        # Priority on `produced arrays` needed soon, the cache warmups come after the queries
         prio = prod_idx - query_pulled_count
         # TODO: What if prio is negative? Is it a problem?
-        return (prio,)
+        return (qi.priority_rank, prio)
 
     def prio_of_cache_tile(self, raster_uid, cache_fp):
         # Data structures shortcuts
         ds0 = self._sorted_prod_tiles_per_cache_tile
 
         cache_tile_key = (raster_uid, cache_fp)
-        assert cache_tile_key in ds0, (
-            'Needing a priority for a cache_fp implies having it registed '
-            'in this class since a qicc object was created.'
-        )
+        if cache_tile_key not in ds0:
+            # The queries and warmups that needed this cache tile were cancelled while it was being
+            # merged or written, finish it when nothing else waits
+            return (ORPHAN_PRIORITY_RANK, 0)
         prod_tile_key = ds0[cache_tile_key][0]
         prio = self.prio_of_prod_tile(*prod_tile_key)
         return prio
@@ -74,6 +74,13 @@ class AgingMsg(Msg):
         self.id_args = id_args
         super().__init__(address, title, *(list(id_args) + list(other_args)))
 
+class BouncingMsg(Msg):
+    """Message that is replaced by `bounce_msg` if its recipient does not exist. It is used to
+    return a resource to its owner when the recipient of that resource died in the meantime."""
+    def __init__(self, address, title, *args, bounce_msg):
+        self.bounce_msg = bounce_msg
+        super().__init__(address, title, *args)
+
 _COLOR_PER_CLASSNAME = {
     'TopLevel': '\033[37m',
     'GlobalPrioritiesWatcher': '\033[37m',
@@ -0,0 +1,126 @@
+import concurrent.futures
+import multiprocessing as mp
+import multiprocessing.pool
+import sys
+import threading
+
+POOL_TYPES = (
+    mp.pool.Pool, # Including the `multiprocessing.pool.ThreadPool` subclass
+    concurrent.futures.ThreadPoolExecutor,
+    concurrent.futures.ProcessPoolExecutor,
+)
+
+def is_pool(obj):
+    """Is `obj` a thread/process pool that can be used by the async rasters"""
+    return isinstance(obj, POOL_TYPES)
+
+def pool_adapter(pool):
+    """Wrap a thread/process pool in a `PoolAdapter`"""
+    if isinstance(pool, mp.pool.Pool):
+        return MultiprocessingPoolAdapter(pool)
+    if isinstance(pool, (concurrent.futures.ThreadPoolExecutor, concurrent.futures.ProcessPoolExecutor)):
+        return ExecutorAdapter(pool)
+    raise TypeError('Unknown pool type `{}`'.format(type(pool))) # pragma: no cover
+
+class PoolAdapter(object):
+    """Base class of the uniform interfaces over the pools accepted by the async rasters.
+
+    The pool itself (and not its adapter) is the identity of a pool in the Dataset, an adapter can
+    be instantiated at any time.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @property
+    def worker_count(self):
+        """Number of jobs that the pool can run at the same time"""
+        raise NotImplementedError('implement in subclass')
+
+    @property
+    def same_address_space(self):
+        """Do the jobs run in the address space of the scheduler (i.e. on threads)"""
+        raise NotImplementedError('implement in subclass')
+
+    def submit(self, func, callback):
+        """Start `func()` on the pool, return a future.
+
+        `callback` is called with one argument as soon as the job succeeded or failed, from
+        another thread.
+        """
+        raise NotImplementedError('implement in subclass')
+
+    def result(self, future):
+        """Return the result of a finished job, or raise its exception"""
+        raise NotImplementedError('implement in subclass')
+
+    def terminate(self):
+        """Start terminating the pool, return an object to `join`"""
+        raise NotImplementedError('implement in subclass')
+
+class MultiprocessingPoolAdapter(PoolAdapter):
+    """Adapter of `multiprocessing.pool.Pool` and `multiprocessing.pool.ThreadPool`"""
+
+    @property
+    def worker_count(self):
+        return self.pool._processes
+
+    @property
+    def same_address_space(self):
+        return isinstance(self.pool, mp.pool.ThreadPool)
+
+    def submit(self, func, callback):
+        return self.pool.apply_async(func, callback=callback, error_callback=callback)
+
+    def result(self, future):
+        return future.get()
+
+    def terminate(self):
+        if isinstance(self.pool, mp.pool.ThreadPool):
+            self.pool.terminate()
+            return self.pool
+        return _start_thread(_kill_process_pool, self.pool)
+
+class ExecutorAdapter(PoolAdapter):
+    """Adapter of `concurrent.futures.ThreadPoolExecutor` and
+    `concurrent.futures.ProcessPoolExecutor`, with or without initializer or `max_tasks_per_child`.
+    """
+
+    @property
+    def worker_count(self):
+        return self.pool._max_workers
+
+    @property
+    def same_address_space(self):
+        return isinstance(self.pool, concurrent.futures.ThreadPoolExecutor)
+
+    def submit(self, func, callback):
+        future = self.pool.submit(func)
+        future.add_done_callback(callback)
+        return future
+
+    def result(self, future):
+        return future.result()
+
+    def terminate(self):
+        return _start_thread(_shutdown_executor, self.pool)
+
+def _start_thread(target, pool):
+    t = threading.Thread(target=target, args=(pool,))
+    t.start()
+    return t
+
+def _kill_process_pool(pp):
+    """
+    https://stackoverflow.com/questions/42782953/python-concurrent-futures-how-to-make-it-cancelable/45515052#45515052
+    """
+    pp.close()
+    pp.terminate()
+    pp.join()
+
+def _shutdown_executor(executor):
+    if sys.version_info >= (3, 9):
+        # Drop the jobs that did not start yet
+        executor.shutdown(wait=True, cancel_futures=True)
+    else: # pragma: no cover
+        executor.shutdown(wait=True)
@@ -12,6 +12,9 @@ class PoolJobWaiting:
 class MaxPrioJobWaiting(PoolJobWaiting):
     pass
 
+class MinPrioJobWaiting(PoolJobWaiting):
+    pass
+
 class ProductionJobWaiting(PoolJobWaiting):
     def __init__(self, sender_address, qi, prod_idx, action_priority, fp):
         super().__init__(sender_address)
@@ -34,9 +37,16 @@ class PoolJobWorking(object):
 
     A working job paired with a token from a PoolWaitingRoom can be fed to a PoolWorkingRoom to
     compute things on the wrapped thread/process pool.
+
+    The optional `affinity` (like the path of the file read by the job) allows the PoolWorkingRoom
+    to run the jobs that share it on the same worker.
     """
-    __slots__ = ['sender_address', 'func']
+    __slots__ = ['sender_address', 'func', 'affinity']
 
-    def __init__(self, sender_address, func):
+    def __init__(self, sender_address, func, affinity=None):
         self.sender_address = sender_address
         self.func = func
+        self.affinity = affinity
+
+    def discard(self):
+        """The job finished after being cancelled, its result will not be collected"""
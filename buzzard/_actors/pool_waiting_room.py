@@ -1,29 +1,42 @@
 from typing import Set, Dict, Tuple
+import collections
 import itertools
 import operator
 import functools
 import logging
+import time
 import uuid # For mypy
 
-import sortedcontainers
 import numpy as np
 
 from buzzard._footprint import Footprint # For mypy
-from buzzard._actors.message import Msg
+from buzzard._tools import IndexedHeap
+from buzzard._actors.message import Msg, BouncingMsg
+from buzzard._actors.pool_adapter import pool_adapter
 from buzzard._actors.pool_job import PoolJobWaiting, MaxPrioJobWaiting, ProductionJobWaiting, CacheJobWaiting
+from buzzard._actors.pool_job import MinPrioJobWaiting
 from buzzard._actors.priorities import dummy_priorities, Priorities
 from buzzard._actors.cached.query_infos import CachedQueryInfos
 
 LOGGER = logging.getLogger(__name__)
+
+# Default bounds of the number of tokens of a pool of `n` workers: `1` and
+# `n * MAX_TOKENS_PER_WORKER + OVERLOAD`. A pool starts with `n + OVERLOAD` tokens.
 OVERLOAD = 2
+MAX_TOKENS_PER_WORKER = 2
+
+# Target number of jobs queued inside a pool (i.e. launched but waiting for a worker)
+QUEUED_JOBS_LOW = 1
+QUEUED_JOBS_HIGH = 3
 
 class ActorPoolWaitingRoom(object):
     """Actor that takes care of prioritizing jobs waiting for spots in a thread/process pool.
 
-    It gives out tokens to allow jobs to enter the `ActorPoolWorkingRoom`. There are as many tokens
-    as spots in the underlying thread/process pool.
+    It gives out tokens to allow jobs to enter the `ActorPoolWorkingRoom`. The number of tokens is
+    tuned from the response times of the jobs, between the bounds set with
+    `Dataset.pools.set_token_bounds`, see `_TokenCountController`.
 
-    It accepts 3 types of `PoolJobWaiting`
+    It accepts 4 types of `PoolJobWaiting`
     - `MaxPrioJobWaiting`
       - Rank 0 job, has priority over the other jobs.
       - Stored in a set
@@ -36,16 +49,34 @@ class ActorPoolWaitingRoom(object):
       - Rank 1 job
       - Stored in many data structures
       - Used by `cached.Merger`, `cached.Writer`
+    - `MinPrioJobWaiting`
+      - Rank 2 job, only granted when no other job waits
+      - Stored in an OrderedDict, granted in FIFO order
+      - Used by `cached.FileChecker` for the background checks
+
+    The rank 1 jobs are stored in an `IndexedHeap`, an update of the priorities of a query or of a
+    cache tile moves its waiting jobs in the heap in O(log n) each.
 
     """
 
-    def __init__(self, pool):
+    def __init__(self, pool, debug_mngr, token_bounds):
         """
         Parameters
         ----------
-        pool: multiprocessing.pool.Pool (or the multiprocessing.pool.ThreadPool subclass)
+        pool: multiprocessing.pool.Pool (or the multiprocessing.pool.ThreadPool subclass) or
+              concurrent.futures.ThreadPoolExecutor or concurrent.futures.ProcessPoolExecutor
+        debug_mngr: DebugObserversManager
+            Debug observers of the Dataset's scheduler
+        token_bounds: callable returning (None or int, None or int)
+            Getter of the bounds of the token count set by the user
         """
         self._alive = True
+        self._debug_mngr = debug_mngr
+        self._watch_tokens = debug_mngr.is_observed('pool_tokens_update')
+        self._watch_jobs = any(
+            debug_mngr.is_observed(ename)
+            for ename in ['pool_job_waiting', 'pool_job_granted', 'pool_job_unscheduled']
+        )
 
         # `global_priorities` contains all the methods necessary to establish the priority of a
         # `prod_job` or a `cache_job`. This object is updated by
@@ -55,14 +86,19 @@ class ActorPoolWaitingRoom(object):
         # Tokens *****************************************************
         pool_id = id(pool)
         self._pool_id = pool_id
-        self._token_count = pool._processes + OVERLOAD
+        self._worker_count = pool_adapter(pool).worker_count
+        self._token_bounds = token_bounds
+        self._token_count = self._clamp_token_count(self._worker_count + OVERLOAD)
+        self._token_controller = _TokenCountController(self._token_count)
+
+        # This has no particular meaning, the only hard requirement is just to have
+        # different tokens in a pool.
         short_id = short_id_of_id(pool_id)
-        self._tokens = {
-            # This has no particular meaning, the only hard requirement is just to have
-            # different tokens in a pool.
+        self._token_ids = (
             _PoolToken(short_id * 1000 + i)
-            for i in range(self._token_count)
-        }
+            for i in itertools.count()
+        )
+        self._tokens = set(itertools.islice(self._token_ids, self._token_count))
         self._all_tokens = set(self._tokens)
 
         # Rank 0 jobs ************************************************
@@ -73,20 +109,19 @@ class ActorPoolWaitingRoom(object):
         self._jobs_prod = set() # type: Set[ProductionJobWaiting]
         self._jobs_cache = set() # type: Set[CacheJobWaiting]
 
-        self._dict_of_prio_per_r1job = {} # type: Dict[PoolJobWaiting, Tuple[int, ...]]
-        self._sset_of_prios = sortedcontainers.SortedSet()
-        self._dict_of_r1jobs_per_prio = {} # type: Dict[Tuple[int], Set[PoolJobWaiting]]
+        self._heap_of_r1jobs = IndexedHeap() # Of PoolJobWaiting, by priority
 
         self._prod_jobs_of_query = {} # type: Dict[CachedQueryInfos, Set[ProductionJobWaiting]]
         self._cache_jobs_of_cache_fp = {} # type: Dict[Tuple[uuid.UUID, Footprint], Set[CacheJobWaiting]]
 
+        # Rank 2 jobs ************************************************
+        self._jobs_minprio = collections.OrderedDict() # type: Dict[MinPrioJobWaiting, None]
+
         # Shortcuts **************************************************
         # For fast iteration / cleanup
-        self._job_sets = [self._jobs_maxprio, self._jobs_prod, self._jobs_cache]
+        self._job_sets = [self._jobs_maxprio, self._jobs_prod, self._jobs_cache, self._jobs_minprio]
         self._data_structures = self._job_sets + [
-            self._dict_of_prio_per_r1job,
-            self._sset_of_prios,
-            self._dict_of_r1jobs_per_prio,
+            self._heap_of_r1jobs,
             self._prod_jobs_of_query,
             self._cache_jobs_of_cache_fp,
         ]
@@ -104,16 +139,19 @@ class ActorPoolWaitingRoom(object):
         ----------
         job: _actors.pool_job.PoolJobWaiting
         """
+        if self._watch_jobs:
+            self._debug_mngr.event('pool_job_waiting', self._pool_id, job)
         if len(self._tokens) != 0:
             # If job can be started straight away, do so.
             assert self._job_count == 0
-            return [
-                Msg(job.sender_address, 'token_to_working_room', job, self._tokens.pop())
-            ]
+            msgs = [self._token_msg(job, self._tokens.pop())]
         else:
             # Store job for later invocation
             self._store_job(job)
-        return []
+            msgs = []
+        if self._watch_tokens:
+            self._notify_tokens_update()
+        return msgs
 
     def receive_unschedule_job(self, job):
         """Receive message: Forget about this waiting job
@@ -122,7 +160,15 @@ class ActorPoolWaitingRoom(object):
         ----------
         job: _actors.pool_job.PoolJobWaiting
         """
+        if (job not in self._jobs_maxprio and job not in self._heap_of_r1jobs and
+            job not in self._jobs_minprio):
+            # The token was already sent to that job (multi-shard scheduler), it will be salvaged
+            return []
         self._unstore_job(job)
+        if self._watch_jobs:
+            self._debug_mngr.event('pool_job_unscheduled', self._pool_id, job)
+        if self._watch_tokens:
+            self._notify_tokens_update()
         return []
 
     def receive_global_priorities_update(self, global_priorities, query_updates, cache_tile_updates):
@@ -139,45 +185,53 @@ class ActorPoolWaitingRoom(object):
 
         # Update the production jobs
         for qi in query_updates & self._prod_jobs_of_query.keys():
-            for job in list(self._prod_jobs_of_query[qi]):
-                # Update priority
-                self._unstore_job(job)
-                self._store_job(job)
+            for job in self._prod_jobs_of_query[qi]:
+                self._heap_of_r1jobs.update(job, self._prio_of_r1job(job))
 
         # Update the cache jobs
-        for raster_uid, cache_fp in cache_tile_updates & self._cache_jobs_of_cache_fp.keys():
-            key = (raster_uid, cache_fp)
-            for job in list(self._cache_jobs_of_cache_fp[key]):
-                # Update priority
-                self._unstore_job(job)
-                self._store_job(job)
+        for key in cache_tile_updates & self._cache_jobs_of_cache_fp.keys():
+            for job in self._cache_jobs_of_cache_fp[key]:
+                self._heap_of_r1jobs.update(job, self._prio_of_r1job(job))
 
         return []
 
-    def receive_salvage_token(self, token):
+    def receive_salvage_token(self, token, response_time=None, service_time=None):
         """Receive message: A Job is done/cancelled, allow some other jobs
 
         Parameters
         ----------
         token: _PoolToken
+        response_time: None or float
+            If the job ran in the pool, time between its launch and its end
+        service_time: None or float
+            If the job ran in the pool, time spent by a worker on it
         """
         assert token in self._all_tokens, 'Received a token that is not owned by this waiting room'
         assert token not in self._tokens, 'Received a token that is already here'
         self._tokens.add(token)
 
-        job_count = self._job_count
-        if job_count == 0:
-            return []
-        else:
-            token_count = len(self._tokens)
-            assert token_count == 1, """The way this class is designed, this point in code should only
-            reached if token_count == 1"""
-
+        if response_time is not None:
+            self._token_count = self._clamp_token_count(
+                self._token_controller.update(response_time, service_time)
+            )
+            self._token_controller.count = self._token_count
+
+        # Create or retire tokens to reach the token count
+        while len(self._all_tokens) > self._token_count and self._tokens:
+            self._all_tokens.remove(self._tokens.pop())
+        while len(self._all_tokens) < self._token_count:
+            new_token = next(self._token_ids)
+            self._all_tokens.add(new_token)
+            self._tokens.add(new_token)
+
+        msgs = []
+        while self._tokens and self._job_count:
             job = self._unstore_most_urgent_job()
+            msgs += [self._token_msg(job, self._tokens.pop())]
 
-        return [Msg(
-            job.sender_address, 'token_to_working_room', job, self._tokens.pop()
-        )]
+        if self._watch_tokens:
+            self._notify_tokens_update()
+        return msgs
 
     def receive_die(self):
         """Receive message: The wrapped pool is no longer used"""
@@ -201,6 +255,31 @@ class ActorPoolWaitingRoom(object):
     def _job_count(self):
         return sum(map(len, self._job_sets))
 
+    def _notify_tokens_update(self):
+        self._debug_mngr.event(
+            'pool_tokens_update',
+            self._pool_id, len(self._all_tokens) - len(self._tokens), self._token_count,
+            self._job_count,
+        )
+
+    def _clamp_token_count(self, count):
+        min_count, max_count = self._token_bounds()
+        if min_count is None:
+            min_count = 1
+        if max_count is None:
+            max_count = max(self._worker_count * MAX_TOKENS_PER_WORKER + OVERLOAD, min_count)
+        return min(max(count, min_count), max_count)
+
+    def _token_msg(self, job, token):
+        """Create the message that grants a token to a job. If the sender of that job died in the
+        meantime, the token comes back here."""
+        if self._watch_jobs:
+            self._debug_mngr.event('pool_job_granted', self._pool_id, job)
+        return BouncingMsg(
+            job.sender_address, 'token_to_working_room', job, token,
+            bounce_msg=Msg(self.address, 'salvage_token', token),
+        )
+
     # Job storage operations ***************************************************
     def _store_job(self, job):
         """Compute the priority of a job and register it in the right objects"""
@@ -210,15 +289,14 @@ class ActorPoolWaitingRoom(object):
         )
         if isinstance(job, MaxPrioJobWaiting):
             self._jobs_maxprio.add(job)
+        elif isinstance(job, MinPrioJobWaiting):
+            self._jobs_minprio[job] = None
         else:
             if isinstance(job, ProductionJobWaiting):
                 self._jobs_prod.add(job)
                 if job.qi not in self._prod_jobs_of_query:
                     self._prod_jobs_of_query[job.qi] = set()
                 self._prod_jobs_of_query[job.qi].add(job)
-                prio = self._global_priorities.prio_of_prod_tile(job.qi, job.prod_idx)
-                cx, cy = job.fp.c
-                prio += (-cy, +cx, job.action_priority,)
 
             elif isinstance(job, CacheJobWaiting):
                 self._jobs_cache.add(job)
@@ -226,24 +304,18 @@ class ActorPoolWaitingRoom(object):
                 if key not in self._cache_jobs_of_cache_fp:
                     self._cache_jobs_of_cache_fp[key] = set()
                 self._cache_jobs_of_cache_fp[key].add(job)
-                prio = self._global_priorities.prio_of_cache_tile(job.raster_uid, job.cache_fp)
-                cx, cy = job.fp.c
-                prio += (-cy, +cx, job.action_priority,)
 
             else: # pragma: no cover
                 assert False
 
-            self._dict_of_prio_per_r1job[job] = prio
-            if prio in self._dict_of_r1jobs_per_prio:
-                self._dict_of_r1jobs_per_prio[prio].add(job)
-            else:
-                self._dict_of_r1jobs_per_prio[prio] = {job}
-                self._sset_of_prios.add(prio)
+            self._heap_of_r1jobs.push(job, self._prio_of_r1job(job))
 
     def _unstore_job(self, job):
         """Unregister a job from the right objects"""
         if isinstance(job, MaxPrioJobWaiting):
             self._jobs_maxprio.remove(job)
+        elif isinstance(job, MinPrioJobWaiting):
+            del self._jobs_minprio[job]
         else:
             if isinstance(job, ProductionJobWaiting):
                 self._jobs_prod.remove(job)
@@ -260,11 +332,7 @@ class ActorPoolWaitingRoom(object):
             else: # pragma: no cover
                 assert False
 
-            prio = self._dict_of_prio_per_r1job.pop(job)
-            self._dict_of_r1jobs_per_prio[prio].remove(job)
-            if len(self._dict_of_r1jobs_per_prio[prio]) == 0:
-                del self._dict_of_r1jobs_per_prio[prio]
-                self._sset_of_prios.remove(prio)
+            self._heap_of_r1jobs.remove(job)
 
     def _unstore_most_urgent_job(self):
         assert self._job_count > 0
@@ -274,14 +342,71 @@ class ActorPoolWaitingRoom(object):
             return self._jobs_maxprio.pop() # Pop an arbitrary one
 
         # Unstore a rank 1 job
-        prio = self._sset_of_prios[0]
-        job = next(iter(self._dict_of_r1jobs_per_prio[prio])) # Pop an arbitrary one
+        if len(self._heap_of_r1jobs) > 0:
+            job = self._heap_of_r1jobs.peek()
+            self._unstore_job(job)
+            return job
 
-        self._unstore_job(job)
+        # Unstore a rank 2 job
+        job, _ = self._jobs_minprio.popitem(last=False)
         return job
 
+    def _prio_of_r1job(self, job):
+        if isinstance(job, ProductionJobWaiting):
+            prio = self._global_priorities.prio_of_prod_tile(job.qi, job.prod_idx)
+        else:
+            prio = self._global_priorities.prio_of_cache_tile(job.raster_uid, job.cache_fp)
+        cx, cy = job.fp.c
+        return prio + (-cy, +cx, job.action_priority,)
+
     # ******************************************************************************************* **
 
+class _TokenCountController(object):
+    """Tuner of the number of tokens of a pool, from the timings of the jobs.
+
+    The response time of a job is measured from its launch in the pool to its end, the service time
+    is measured by the worker. Their difference is the time spent by the job waiting for a worker
+    inside the pool. For each window of `count` jobs, the number of jobs waiting inside the pool is
+    estimated with Little's law:
+        queued = throughput * mean(response_time - service_time)
+
+    - When `queued < QUEUED_JOBS_LOW` the workers starve while the tokens travel through the
+      scheduler (typically with short jobs), the token count is increased by one.
+    - When `queued > QUEUED_JOBS_HIGH` the jobs are committed to the pool too early, their priority
+      can't change anymore, the token count is decreased by one.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self._reset_window(None)
+
+    def update(self, response_time, service_time):
+        """Record the timings of a job, return the new token count"""
+        now = time.perf_counter()
+        if self._window_start is None:
+            self._window_start = now - response_time
+        self._window_job_count += 1
+        self._window_queueing_time += max(response_time - service_time, 0.)
+
+        if self._window_job_count < self.count:
+            return self.count
+
+        elapsed = now - self._window_start
+        if elapsed > 0:
+            # Little's law: mean number of jobs queued = arrival rate * mean queueing time
+            queued = self._window_queueing_time / elapsed
+            if queued < QUEUED_JOBS_LOW:
+                self.count += 1
+            elif queued > QUEUED_JOBS_HIGH:
+                self.count -= 1
+        self._reset_window(now)
+        return self.count
+
+    def _reset_window(self, now):
+        self._window_start = now
+        self._window_job_count = 0
+        self._window_queueing_time = 0.
+
 class _PoolToken(int):
     pass
 
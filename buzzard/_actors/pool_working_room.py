@@ -1,22 +1,72 @@
 import logging
+import collections
+import functools
+import time
 
 from buzzard._actors.message import Msg
+from buzzard._actors.pool_adapter import pool_adapter
 
 LOGGER = logging.getLogger(__name__)
 
+# Names of the actors whose jobs are small enough to be packed several per task
+BATCHABLE_JOB_SENDERS = frozenset(['Reader', 'FileChecker', 'Resampler'])
+
 class ActorPoolWorkingRoom(object):
-    """Actor that takes care of starting/collecting jobs on/off a thread/process pool"""
+    """Actor that takes care of starting/collecting jobs on/off a thread/process pool
+
+    The futures are never polled, the completion callbacks (or done-callbacks) of the pool push
+    the finished tasks to a thread-safe queue that is drained by `ext_receive_nothing`. The cost
+    of a call to `ext_receive_nothing` is then proportional to the number of tasks that finished
+    since the previous call, and not to the number of ongoing jobs.
+
+    A task sent to the pool contains one or more jobs. The small jobs (see
+    `BATCHABLE_JOB_SENDERS`) are held here until `ext_receive_nothing`, then each one of them is
+    sent alone to a free worker, and those that would wait in the pool's queue anyway are packed
+    by kind in tasks of up to `max_batch_size` jobs. This saves the per-task overhead of process
+    pools. A job held for less than `latency_budget` seconds may stay held until a worker is free
+    or until the batch is full.
 
-    def __init__(self, pool):
+    The pools can't send a task to a chosen worker, the held jobs that share an `affinity` (i.e.
+    that read the same file) are then packed in the same task, to run on the same worker. This
+    improves the reuse of the files kept open by the workers of process pools (see
+    `_worker_activation_pool`) and the locality of the page cache.
+    """
+
+    def __init__(self, pool, wakeup, debug_mngr, batching):
         """
-        Parameter
-        ---------
-        pool: multiprocessing.pool.Pool (or the multiprocessing.pool.ThreadPool subclass)
+        Parameters
+        ----------
+        pool: multiprocessing.pool.Pool (or the multiprocessing.pool.ThreadPool subclass) or
+              concurrent.futures.ThreadPoolExecutor or concurrent.futures.ProcessPoolExecutor
+        wakeup: threading.Event
+            Event to set to wake the scheduler up when a job is done
+        debug_mngr: DebugObserversManager
+            Debug observers of the Dataset's scheduler
+        batching: callable returning (int, float)
+            Getter of the `max_batch_size` and `latency_budget` of the pool
         """
-        self._pool = pool
+        self._pool = pool_adapter(pool)
+        self._pool_id = id(pool)
+        self._worker_count = self._pool.worker_count
+        self._wakeup = wakeup
+        self._debug_mngr = debug_mngr
+        self._watch_jobs = any(
+            debug_mngr.is_observed(ename)
+            for ename in ['pool_job_working', 'pool_job_done', 'pool_job_cancelled']
+        )
+        self._batching = batching
+
+        # Per job: its task (None while held), its token and its launch time
         self._jobs = {}
+        self._task_count = 0
+        self._held_jobs_per_kind = collections.OrderedDict()
+
+        # Tasks are appended from the pool's result handler threads, and popped from the
+        # scheduler thread. A deque is thread-safe for those two operations.
+        self._finished_tasks = collections.deque()
+
         self._alive = True
-        self.address = '/Pool{}/WorkingRoom'.format(id(self._pool))
+        self.address = '/Pool{}/WorkingRoom'.format(self._pool_id)
 
     @property
     def alive(self):
@@ -33,8 +83,19 @@ class ActorPoolWorkingRoom(object):
         """
         assert job not in self._jobs
 
-        future = self._pool.apply_async(job.func)
-        self._jobs[job] = (future, token)
+        self._jobs[job] = (None, token, time.perf_counter())
+        if self._watch_jobs:
+            self._debug_mngr.event('pool_job_working', self._pool_id, job)
+
+        kind = job.sender_address.rsplit('/', 1)[-1]
+        max_batch_size, _ = self._batching()
+        if kind in BATCHABLE_JOB_SENDERS and max_batch_size > 1:
+            # Hold the job until `ext_receive_nothing`
+            if kind not in self._held_jobs_per_kind:
+                self._held_jobs_per_kind[kind] = []
+            self._held_jobs_per_kind[kind].append(job)
+        else:
+            self._submit([job])
 
         return []
 
@@ -55,28 +116,47 @@ class ActorPoolWorkingRoom(object):
         ----------
         job: _actors.pool_job.PoolJobWorking
         """
-        _, token = self._jobs.pop(job)
+        if job not in self._jobs:
+            # The job was done before the cancellation arrived (multi-shard scheduler)
+            return []
+        task, token, _ = self._jobs.pop(job)
+        if task is None:
+            # The job was held, it never reached the pool
+            kind = job.sender_address.rsplit('/', 1)[-1]
+            self._held_jobs_per_kind[kind].remove(job)
+            job.discard()
+        if self._watch_jobs:
+            self._debug_mngr.event('pool_job_cancelled', self._pool_id, job)
         return [Msg('WaitingRoom', 'salvage_token', token)]
 
     def ext_receive_nothing(self):
         """Receive message sent by something else than an actor, still treated synchronously: What's
         up?
-        Did a Job finished? Check all futures
+        Did a Task finished? Drain the queue of finished tasks
+        Are there held jobs? Send them to the pool
         """
         msgs = []
 
-        finished_jobs = [
-            job
-            for job, (future, _) in self._jobs.items()
-            if future.ready()
-        ]
-        for job in finished_jobs:
-            future, token = self._jobs.pop(job)
-            res = future.get()
-            msgs += [
-                Msg(job.sender_address, 'job_done', job, res),
-                Msg('WaitingRoom', 'salvage_token', token),
-            ]
+        # Only pop the tasks that are already there, the queue may grow while iterating
+        for _ in range(len(self._finished_tasks)):
+            task, end_time = self._finished_tasks.popleft()
+            self._task_count -= 1
+            timings_and_results = self._pool.result(task.future)
+            for job, (service_time, res) in zip(task.jobs, timings_and_results):
+                if job not in self._jobs:
+                    # Job was cancelled while it was running
+                    job.discard()
+                    continue
+                _, token, launch_time = self._jobs.pop(job)
+                if self._watch_jobs:
+                    self._debug_mngr.event('pool_job_done', self._pool_id, job)
+                msgs += [
+                    Msg(job.sender_address, 'job_done', job, res),
+                    Msg('WaitingRoom', 'salvage_token', token, end_time - launch_time, service_time),
+                ]
+
+        if self._held_jobs_per_kind:
+            self._submit_held_jobs()
 
         return msgs
 
@@ -89,10 +169,95 @@ class ActorPoolWorkingRoom(object):
                 len(self._jobs)
             ))
 
+        # The results of the held and ongoing jobs will never be collected
+        for job in self._jobs:
+            job.discard()
+
         # Clear attributes *****************************************************
         self._jobs.clear()
+        self._held_jobs_per_kind.clear()
+        self._finished_tasks.clear()
         self._pool = None
 
         return []
 
     # ******************************************************************************************* **
+    def _submit(self, jobs):
+        task = _Task(jobs)
+        for job in jobs:
+            _, token, launch_time = self._jobs[job]
+            self._jobs[job] = (task, token, launch_time)
+        on_task_done = functools.partial(self._on_task_done, task)
+        task.future = self._pool.submit(
+            functools.partial(_timed_calls, [job.func for job in jobs]), on_task_done,
+        )
+        self._task_count += 1
+
+    def _submit_held_jobs(self):
+        max_batch_size, latency_budget = self._batching()
+        now = time.perf_counter()
+
+        # The jobs that can start right away are sent alone (or with the jobs of the same
+        # affinity), in the order of arrival
+        for jobs in self._held_jobs_per_kind.values():
+            if self._task_count >= self._worker_count:
+                break
+            groups = _groups_of_affinity(jobs, max_batch_size)
+            while groups and self._task_count < self._worker_count:
+                self._submit(groups.pop(0))
+            jobs[:] = [job for group in groups for job in group]
+
+        # The other jobs will wait in the pool's queue, they are packed
+        for kind, jobs in list(self._held_jobs_per_kind.items()):
+            if len(jobs) > 1:
+                jobs[:] = [job for group in _groups_of_affinity(jobs, len(jobs)) for job in group]
+            while jobs and (
+                    len(jobs) >= max_batch_size or
+                    now - self._jobs[jobs[0]][2] >= latency_budget
+            ):
+                self._submit(jobs[:max_batch_size])
+                del jobs[:max_batch_size]
+            if not jobs:
+                del self._held_jobs_per_kind[kind]
+
+    def _on_task_done(self, task, _):
+        """Called from the pool's result handler thread, or from the thread of the task"""
+        self._finished_tasks.append((task, time.perf_counter()))
+        self._wakeup.set()
+
+    # ******************************************************************************************* **
+
+class _Task(object):
+    """One or more jobs sent together to the pool"""
+    __slots__ = ['jobs', 'future']
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+        self.future = None
+
+def _groups_of_affinity(jobs, max_size):
+    """Group the jobs that share an affinity in lists of up to `max_size` jobs, in the order of
+    their first job"""
+    groups = []
+    open_group_of_affinity = {}
+    for job in jobs:
+        group = None
+        if job.affinity is not None:
+            group = open_group_of_affinity.get(job.affinity)
+        if group is None or len(group) >= max_size:
+            group = []
+            groups.append(group)
+            if job.affinity is not None:
+                open_group_of_affinity[job.affinity] = group
+        group.append(job)
+    return groups
+
+def _timed_calls(funcs):
+    """Run the jobs of a task in a worker, return the time spent by the worker on each job and
+    their results"""
+    timings_and_results = []
+    for func in funcs:
+        start = time.perf_counter()
+        res = func()
+        timings_and_results.append((time.perf_counter() - start, res))
+    return timings_and_results
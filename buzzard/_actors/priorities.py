@@ -12,14 +12,14 @@ class Priorities(object):
 
     def prio_of_prod_tile(self, qi, prod_idx):
         if self._prio_actor is None:
-            return (prod_idx,)
+            return (0, prod_idx)
         else:
             assert self._db_version == self._prio_actor.db_version, 'Failed to fetch latest priorities object'
             return self._prio_actor.prio_of_prod_tile(qi, prod_idx)
 
     def prio_of_cache_tile(self, raster_uid, cache_fp):
         if self._prio_actor is None:
-            return (0,)
+            return (0, 0)
         else:
             assert self._db_version == self._prio_actor.db_version, 'Failed to fetch latest priorities object'
             return self._prio_actor.prio_of_cache_tile(raster_uid, cache_fp)
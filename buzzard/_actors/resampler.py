@@ -1,13 +1,13 @@
 import functools
 import collections
-import multiprocessing as mp
-import multiprocessing.pool
 
 import numpy as np
 
 from buzzard._actors.message import Msg
+from buzzard._actors.pool_adapter import pool_adapter
 from buzzard._actors.pool_job import ProductionJobWaiting, PoolJobWorking
 from buzzard._a_source_raster_remap import ABackSourceRasterRemapMixin
+from buzzard._shared_memory_arena import SharedArray
 
 class ActorResampler(object):
     """Actor that takes care of resampling sample tiles, and wait for all
@@ -17,16 +17,14 @@ class ActorResampler(object):
     def __init__(self, raster):
         self._raster = raster
         self._alive = True
+        self._arena = None
         resample_pool = raster.resample_pool
         if resample_pool is not None:
             self._waiting_room_address = '/Pool{}/WaitingRoom'.format(id(resample_pool))
             self._working_room_address = '/Pool{}/WorkingRoom'.format(id(resample_pool))
-            if isinstance(resample_pool, mp.pool.ThreadPool):
-                self._same_address_space = True
-            elif isinstance(resample_pool, mp.pool.Pool):
-                self._same_address_space = False
-            else: # pragma: no cover
-                assert False, 'Type should be checked in facade'
+            self._same_address_space = pool_adapter(resample_pool).same_address_space
+            if not self._same_address_space:
+                self._arena = raster.back_ds.shared_memory_arena
         self._waiting_jobs = set()
         self._working_jobs = set()
 
@@ -144,6 +142,9 @@ class ActorResampler(object):
 
     def receive_token_to_working_room(self, job, token):
         """Receive message: Waiting job can proceed to the working room"""
+        if job not in self._waiting_jobs:
+            # The job was unscheduled while the token was on its way (multi-shard scheduler)
+            return [Msg(self._working_room_address, 'salvage_token', token)]
         self._waiting_jobs.remove(job)
 
         work = self._create_interpolation_work_job(
@@ -156,6 +157,10 @@ class ActorResampler(object):
         ]
 
     def receive_job_done(self, job, result):
+        if job not in self._working_jobs:
+            # The job was cancelled while the result was on its way (multi-shard scheduler)
+            job.discard()
+            return []
         self._working_jobs.remove(job)
         self._commit_interpolation_work_result(job, result)
         return self._push_if_done(job.qi, job.prod_idx)
@@ -235,10 +240,13 @@ class ActorResampler(object):
 
         pr.commit(resample_fp)
 
-        if self._raster.resample_pool is not None and not self._same_address_space:
-            work_job.dst_array_slice[:] = res
-        else:
+        if self._raster.resample_pool is None or self._same_address_space:
+            assert res is None
+        elif work_job.shared_array is not None:
             assert res is None
+            self._arena.take_back(work_job.shared_array, work_job.dst_array_slice)
+        else:
+            work_job.dst_array_slice[:] = res
 
     def _push_if_done(self, qi, prod_idx):
         msgs = []
@@ -300,6 +308,7 @@ class Work(PoolJobWorking):
         produce_fp = qi.prod[prod_idx].fp
 
         dst_array_slice = dst_array[resample_fp.slice_in(produce_fp)]
+        self.shared_array = None
 
         if actor._raster.resample_pool is None or actor._same_address_space:
             func = functools.partial(
@@ -310,16 +319,24 @@ class Work(PoolJobWorking):
             )
         else:
             self.dst_array_slice = dst_array_slice
+            if actor._arena is not None:
+                # Write the result to shared memory instead of returning it through the pool
+                self._arena = actor._arena
+                self.shared_array = self._arena.lend(dst_array_slice.shape, dst_array_slice.dtype)
             func = functools.partial(
                 _resample_subsample_array,
                 sample_fp, resample_fp, subsample_array,
                 actor._raster.nodata, qi.dst_nodata,
-                qi.interpolation, None,
+                qi.interpolation, self.shared_array,
             )
         actor._raster.debug_mngr.event('object_allocated', func)
 
         super().__init__(actor.address, func)
 
+    def discard(self):
+        if self.shared_array is not None:
+            self._arena.release(self.shared_array)
+
 def _resample_subsample_array(sample_fp, resample_fp, subsample_array, src_nodata, dst_nodata, interpolation, dst_opt):
     """
     Parameters
@@ -333,7 +350,7 @@ def _resample_subsample_array(sample_fp, resample_fp, subsample_array, src_nodat
     src_nodata: None or nbr
     dst_nodata: nbr
     interpolation: str
-    dst_opt: None or np.ndarray
+    dst_opt: None or np.ndarray or SharedArray
         optional destination for resample
 
     Returns
@@ -347,6 +364,8 @@ def _resample_subsample_array(sample_fp, resample_fp, subsample_array, src_nodat
         src_nodata=src_nodata, dst_nodata=dst_nodata,
         mask_mode='dilate', interpolation=interpolation,
     )
+    if isinstance(dst_opt, SharedArray):
+        dst_opt = dst_opt.attach()
     if dst_opt is not None:
         dst_opt[:] = res
         return None
@@ -1,4 +1,5 @@
 import collections
+import functools
 
 from buzzard._actors.message import Msg
 from buzzard._actors.pool_waiting_room import ActorPoolWaitingRoom
@@ -15,7 +16,17 @@ class ActorTopLevel(object):
     as stopping the scheduler's loop. If a destruction is ever needed, call a die method from
     the scheduler using the `top_level_actor` variable.
     """
-    def __init__(self):
+    def __init__(self, wakeup, debug_mngr):
+        """
+        Parameter
+        ---------
+        wakeup: threading.Event
+            Event to set to wake the scheduler up, see `BackDatasetSchedulerMixin.scheduler_wakeup`
+        debug_mngr: DebugObserversManager
+            Debug observers of the Dataset's scheduler
+        """
+        self._wakeup = wakeup
+        self._debug_mngr = debug_mngr
         self._rasters = set()
         self._rasters_per_pool = collections.defaultdict(list)
 
@@ -76,8 +87,14 @@ class ActorTopLevel(object):
         for pool_id, pool in pools.items():
             if pool_id not in self._rasters_per_pool:
                 actors = [
-                    ActorPoolWaitingRoom(pool),
-                    ActorPoolWorkingRoom(pool),
+                    ActorPoolWaitingRoom(
+                        pool, self._debug_mngr,
+                        functools.partial(raster.back_ds.pools_container._token_bounds_of, pool),
+                    ),
+                    ActorPoolWorkingRoom(
+                        pool, self._wakeup, self._debug_mngr,
+                        functools.partial(raster.back_ds.pools_container._batching_of, pool),
+                    ),
                 ]
                 msgs += actors
 
@@ -134,6 +151,9 @@ class ActorTopLevel(object):
                 ]
                 del self._actor_addresses_of_pool[pool_id]
 
+        # Kept by `ABackAsyncRaster.close` until the actors of the raster are created
+        del raster.back_ds
+
         return msgs
 
     # ******************************************************************************************* **
@@ -0,0 +1,124 @@
+"""Checksums of the cache files of the cached raster recipes. The name of a cache file ends with its
+checksum, it is verified before the file is first read.
+
+The hashers share the `update(bytes)` / `hexdigest()` interface of `hashlib`, they can be fed while
+a file is produced.
+"""
+
+import hashlib
+import zlib
+
+import numpy as np
+
+try:
+    import xxhash
+except ImportError: # pragma: no cover
+    xxhash = None
+
+CHECKSUM_ALGORITHMS = ('sum64', 'crc32', 'blake2b', 'xxh3')
+
+_MASK64 = 2 ** 64 - 1
+
+class _Sum64(object):
+    """Sum of the bytes read as uint64, modulo 2**64. The trailing bytes are padded with zeros.
+
+    https://github.com/earthcube-lab/buzzard/pull/39/#discussion_r239071556
+    """
+
+    def __init__(self):
+        self._acc = 0
+        self._pending = b''
+
+    def update(self, data):
+        data = memoryview(data).cast('B')
+        if self._pending:
+            missing = 8 - len(self._pending)
+            self._pending += data[:missing].tobytes()
+            data = data[missing:]
+            if len(self._pending) < 8:
+                return
+            self._add(self._pending)
+            self._pending = b''
+        aligned_size = len(data) // 8 * 8
+        self._add(data[:aligned_size])
+        self._pending = data[aligned_size:].tobytes()
+
+    def hexdigest(self):
+        acc = self._acc
+        if self._pending:
+            tail = self._pending + b'\0' * (8 - len(self._pending))
+            acc = (acc + int(np.frombuffer(tail, 'uint64')[0])) & _MASK64
+        return '{:016x}'.format(acc)
+
+    def _add(self, data):
+        # The reduction of an array wraps around silently, on the contrary of the scalar operations
+        s = np.add.reduce(np.frombuffer(data, 'uint64'), dtype='uint64')
+        self._acc = (self._acc + int(s)) & _MASK64
+
+class _Crc32(object):
+    """CRC-32 of zlib"""
+
+    def __init__(self):
+        self._acc = 0
+
+    def update(self, data):
+        self._acc = zlib.crc32(data, self._acc)
+
+    def hexdigest(self):
+        return '{:08x}'.format(self._acc)
+
+def checksum_hasher(algorithm):
+    """Create a hasher
+
+    Parameters
+    ----------
+    algorithm: str
+        One of `CHECKSUM_ALGORITHMS`
+        - 'sum64': sum of the uint64 words of the file, the fastest and the weakest
+        - 'crc32': CRC-32 of zlib
+        - 'blake2b': 64 bits BLAKE2b of hashlib, the strongest
+        - 'xxh3': 64 bits XXH3 of the `xxhash` package (optional dependency), strong and fast
+    """
+    if algorithm == 'sum64':
+        return _Sum64()
+    if algorithm == 'crc32':
+        return _Crc32()
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=8)
+    if algorithm == 'xxh3':
+        if xxhash is None: # pragma: no cover
+            raise ImportError("The 'xxh3' checksum requires the `xxhash` package")
+        return xxhash.xxh3_64()
+    raise ValueError('Unknown checksum algorithm `{}`, should be one of {}'.format(
+        algorithm, CHECKSUM_ALGORITHMS,
+    ))
+
+def checksum_of_bytes(data, algorithm):
+    """Checksum of a bytes-like object"""
+    hasher = checksum_hasher(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest()
+
+def checksum_of_file(path, algorithm, buffer_size=512 * 1024):
+    """Checksum of a file, read in chunks"""
+    hasher = checksum_hasher(algorithm)
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as stream:
+        while True:
+            size = stream.readinto(buf)
+            if not size:
+                break
+            hasher.update(view[:size])
+    return hasher.hexdigest()
+
+class HashingStream(object):
+    """File-like object that feeds a hasher with the bytes written to a binary stream"""
+
+    def __init__(self, stream, hasher):
+        self._stream = stream
+        self._hasher = hasher
+
+    def write(self, data):
+        self._hasher.update(data)
+        return self._stream.write(data)
@@ -0,0 +1,169 @@
+"""Lock files of the cache tiles being computed, to share a `cache_dir` between processes"""
+
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+LOGGER = logging.getLogger(__name__)
+
+LOCK_FILE_EXTENSION = '.lock'
+
+# Subdirectory of `cache_dir` where the lock files are created. The directory of the cache files is
+# left untouched so that its manifest stays newer than it, see `_cache_manifest.CacheManifest`.
+LOCK_DIRNAME = '.locks'
+
+class CacheTileLocks(object):
+    """Claims of this process on the cache tiles of a directory.
+
+    A claim is a `<tile prefix>.lock` file created atomically in the directory of the locks, it
+    records its owner and the time at which it expires:
+        {"owner": "host:pid:uuid", "expiry": 1700000000.0}
+
+    The owner renews its claims while computing the tiles and removes them once the cache files
+    are written. A claim that expired is taken over by the next process that needs the tile, its
+    lock file is first moved away so that a single process can break it. The expiry is a wall clock
+    time, the clocks of the hosts sharing the directory should be synchronized.
+
+    Only the scheduler thread of a raster uses an instance.
+    """
+
+    def __init__(self, dir_path, lease):
+        """
+        Parameters
+        ----------
+        dir_path: str
+            Directory of the lock files, it should exist
+        lease: float
+            Duration in seconds of a claim, it is renewed when half of it elapsed
+        """
+        self._dir_path = dir_path
+        self.lease = lease
+        self.poll_interval = min(1., lease / 4)
+        self._owner = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4())
+        self._expiry_of_prefix = {}
+
+    def claim(self, prefix):
+        """Try to claim a cache tile, return False if another process holds a claim on it"""
+        path = self._path(prefix)
+        try:
+            expiry = self._create(path)
+        except FileExistsError:
+            if self._expiry_of_lock(path) > time.time():
+                return False
+            if not self._break(path):
+                return False
+            try:
+                expiry = self._create(path)
+            except FileExistsError:
+                return False
+        self._expiry_of_prefix[prefix] = expiry
+        return True
+
+    def claimed_by_another(self, prefix):
+        """Whether another process holds a claim on a cache tile that did not expire"""
+        path = self._path(prefix)
+        owner = self._owner_of_lock(path)
+        if owner is None or owner == self._owner:
+            return False
+        return self._expiry_of_lock(path) > time.time()
+
+    def renew(self):
+        """Extend the claims of this process that are past half of their lease"""
+        now = time.time()
+        for prefix, expiry in list(self._expiry_of_prefix.items()):
+            if expiry - now > self.lease / 2:
+                continue
+            path = self._path(prefix)
+            if self._owner_of_lock(path) != self._owner:
+                LOGGER.warning('The claim on {} expired and was taken over'.format(path))
+                del self._expiry_of_prefix[prefix]
+                continue
+            tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4())
+            with open(tmp_path, 'w') as stream:
+                expiry = self._dump(stream)
+            os.replace(tmp_path, path)
+            self._expiry_of_prefix[prefix] = expiry
+
+    def release(self, prefix):
+        """Remove the claim of this process on a cache tile"""
+        if self._expiry_of_prefix.pop(prefix, None) is None:
+            return
+        path = self._path(prefix)
+        if self._owner_of_lock(path) == self._owner:
+            try:
+                os.remove(path)
+            except FileNotFoundError: # pragma: no cover
+                pass
+
+    def release_all(self):
+        for prefix in list(self._expiry_of_prefix.keys()):
+            self.release(prefix)
+
+    def __contains__(self, prefix):
+        return prefix in self._expiry_of_prefix
+
+    # ******************************************************************************************* **
+    def _path(self, prefix):
+        return os.path.join(self._dir_path, prefix + LOCK_FILE_EXTENSION)
+
+    def _dump(self, stream):
+        expiry = time.time() + self.lease
+        json.dump({'owner': self._owner, 'expiry': expiry}, stream)
+        return expiry
+
+    def _create(self, path):
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        with os.fdopen(fd, 'w') as stream:
+            return self._dump(stream)
+
+    @staticmethod
+    def _read(path):
+        """Read a lock file, `None` if it does not exist, `{}` if it is being written"""
+        try:
+            with open(path) as stream:
+                return json.load(stream)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return {}
+
+    def _owner_of_lock(self, path):
+        content = self._read(path)
+        if content is None:
+            return None
+        return content.get('owner', '')
+
+    def _expiry_of_lock(self, path):
+        content = self._read(path)
+        if content is None:
+            return 0.
+        if 'expiry' in content:
+            return content['expiry']
+        # A lock file left empty by a process that died while creating it
+        try:
+            return os.stat(path).st_mtime + self.lease
+        except FileNotFoundError:
+            return 0.
+
+    def _break(self, path):
+        """Move away an expired lock file, return False if another process was faster"""
+        stale_path = '{}.{}.stale'.format(path, uuid.uuid4())
+        try:
+            os.rename(path, stale_path)
+        except FileNotFoundError:
+            # Broken by another process
+            return True
+        if self._expiry_of_lock(stale_path) > time.time():
+            # It was renewed or claimed again in the meantime, put it back
+            try:
+                os.link(stale_path, path)
+            except FileExistsError: # pragma: no cover
+                pass
+            os.remove(stale_path)
+            return False
+        LOGGER.info('Taking over the expired claim {}'.format(path))
+        os.remove(stale_path)
+        return True
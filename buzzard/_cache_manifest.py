@@ -0,0 +1,150 @@
+import collections
+import logging
+import os
+import threading
+import uuid
+
+LOGGER = logging.getLogger(__name__)
+
+_HEADER = '# buzzard cache manifest v1\n'
+
+class CacheManifest(object):
+    """Append-only log of the cache files of a directory, with their size and modification time
+    (their checksum is in their name).
+
+    Listing the cache files of a tile used to be a `glob` over the whole directory, once per tile.
+    The manifest is read in one pass instead. Each line records either a written file or a
+    removed file:
+        +<tab>filename<tab>size<tab>mtime_ns
+        -<tab>filename
+
+    The manifest is trusted only if it was modified strictly after the directory (manifest mtime
+    newer than the directory's). Otherwise a file may have been added or removed by something
+    else, possibly within the same tick of a coarse file system clock. The directory is then
+    listed once, the files still there keep their recorded size and mtime, the new ones get
+    unknown ones, and the manifest is rewritten. A file of the manifest that does not exist
+    anymore is seen as corrupted by the FileChecker and recomputed.
+
+    The methods may be called from several threads at once.
+    """
+
+    FILENAME = 'buzz_cache_manifest.log'
+
+    def __init__(self, dir_path, is_cache_filename):
+        """
+        Parameters
+        ----------
+        dir_path: str
+        is_cache_filename: callable
+            Predicate on the file names of `dir_path` to select the cache files
+        """
+        self._dir_path = dir_path
+        self._path = os.path.join(dir_path, self.FILENAME)
+        self._is_cache_filename = is_cache_filename
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Read the cache files of the directory, from the manifest if it is up to date or from a
+        single listing of the directory otherwise.
+
+        Returns
+        -------
+        dict of str to None or (int, int)
+            The size and mtime in ns of each cache file name, `None` if the file was found by
+            listing the directory and is not in the manifest
+        """
+        with self._lock:
+            return self._load()
+
+    def add(self, path):
+        """Record a cache file that was just written"""
+        st = os.stat(path)
+        self._append('+\t{}\t{}\t{}\n'.format(os.path.basename(path), st.st_size, st.st_mtime_ns))
+
+    def remove(self, path):
+        """Record a cache file that was just removed"""
+        self._append('-\t{}\n'.format(os.path.basename(path)))
+
+    def clear(self):
+        """Forget all files, after they were removed"""
+        with self._lock:
+            self._rewrite({})
+
+    def forget_stats(self):
+        """Record an unknown size and mtime for all files, so that none of them is trusted without
+        being checked"""
+        with self._lock:
+            files = self._load()
+            self._rewrite(collections.OrderedDict((name, None) for name in files))
+
+    def _append(self, line):
+        with self._lock:
+            if not os.path.isfile(self._path):
+                # Without its first lines, the manifest would be trusted while incomplete
+                return
+            with open(self._path, 'a') as stream:
+                stream.write(line)
+
+    def _load(self):
+        files, up_to_date = self._read()
+        if not up_to_date:
+            # The stats recorded are only compared to the ones of the files, keeping them is safe
+            recorded = files or {}
+            files = collections.OrderedDict(
+                (entry.name, recorded.get(entry.name))
+                for entry in os.scandir(self._dir_path)
+                if entry.is_file() and self._is_cache_filename(entry.name)
+            )
+            LOGGER.info('Listed {} cache files in {}, rewriting its manifest'.format(
+                len(files), self._dir_path,
+            ))
+            self._rewrite(files)
+        return files
+
+    def _read(self):
+        """Read the manifest, returns the files recorded (`None` if it is missing or unreadable)
+        and whether it is newer than the directory"""
+        try:
+            st = os.stat(self._path)
+            dir_st = os.stat(self._dir_path)
+        except OSError:
+            return None, False
+        up_to_date = st.st_mtime_ns > dir_st.st_mtime_ns
+
+        files = collections.OrderedDict()
+        removed_count = 0
+        with open(self._path) as stream:
+            if stream.readline() != _HEADER:
+                return None, False
+            for line in stream:
+                if not line.endswith('\n'):
+                    # Interrupted while appending
+                    break
+                fields = line[:-1].split('\t')
+                if fields[0] == '+' and len(fields) == 4:
+                    stat = (int(fields[2]), int(fields[3]))
+                    files[fields[1]] = None if stat[0] < 0 else stat
+                elif fields[0] == '-' and len(fields) == 2:
+                    files.pop(fields[1], None)
+                    removed_count += 1
+                else:
+                    return None, False
+
+        if up_to_date and removed_count > len(files):
+            # Compact
+            self._rewrite(files)
+        return files, up_to_date
+
+    def _rewrite(self, files):
+        tmp_path = os.path.join(self._dir_path, 'tmp_' + str(uuid.uuid4()) + '.log')
+        with open(tmp_path, 'w') as stream:
+            stream.write(_HEADER)
+            for name, stat in files.items():
+                if stat is None:
+                    # Found by listing the directory, not stat'd to keep a single pass on network
+                    # file systems. Recorded with an unknown size and mtime.
+                    stat = (-1, -1)
+                stream.write('+\t{}\t{}\t{}\n'.format(name, *stat))
+        os.replace(tmp_path, self._path)
+        # The renaming modified the directory, the manifest must stay newer
+        os.utime(self._path)
@@ -0,0 +1,99 @@
+import threading
+import time
+
+from buzzard._actors.message import DroppableMsg
+
+WARM_CACHE_PRIORITIES = ('low', 'normal')
+
+class CacheWarmup(object):
+    """Progress of a call to :py:meth:`CachedRasterRecipe.warm_cache`. The missing cache files of
+    the cache tiles are computed and written by the Dataset's scheduler, in the background.
+
+    The properties may be read from any thread. A cache tile is `done` as soon as its cache file is
+    ready to be read, either because it was computed or because it was found valid in `cache_dir`.
+
+    >>> warmup = raster.warm_cache()
+    ... while not warmup.wait(timeout=60):
+    ...     print('{}/{} cache tiles, {:.0f}s left'.format(warmup.done, warmup.total, warmup.eta))
+
+    """
+
+    def __init__(self, back_raster, total):
+        self._back_raster = back_raster
+        self._total = total
+        self._done = 0
+        self._cancelled = False
+        self._lock = threading.Lock()
+        self._finished_event = threading.Event()
+        self._start_time = time.monotonic()
+        self._end_time = None
+
+    @property
+    def total(self):
+        """Number of cache tiles to warm"""
+        return self._total
+
+    @property
+    def done(self):
+        """Number of cache tiles ready to be read"""
+        with self._lock:
+            return self._done
+
+    @property
+    def finished(self):
+        """Whether all the cache tiles are done, or the warmup was cancelled"""
+        return self._finished_event.is_set()
+
+    @property
+    def cancelled(self):
+        """Whether the warmup was cancelled before the end, by `cancel` or by closing the raster"""
+        with self._lock:
+            return self._cancelled
+
+    @property
+    def eta(self):
+        """Estimated number of seconds left, from the mean rate since the start, or None if no cache
+        tile was done yet"""
+        with self._lock:
+            if self._end_time is not None:
+                return 0.
+            if self._done == 0:
+                return None
+            elapsed = time.monotonic() - self._start_time
+            return elapsed / self._done * (self._total - self._done)
+
+    def wait(self, timeout=None):
+        """Block until the warmup is finished, return False if it timed out"""
+        return self._finished_event.wait(timeout)
+
+    def cancel(self):
+        """Stop computing the cache tiles that are not done yet. The ones being computed may still
+        be written."""
+        with self._lock:
+            if self._end_time is not None:
+                return
+        self._back_raster.back_ds.put_message(DroppableMsg(
+            '/Raster{}/CacheSupervisor'.format(self._back_raster.uid),
+            'cancel_warm_cache', self,
+        ))
+
+    def __repr__(self):
+        if self.cancelled:
+            status = 'cancelled'
+        elif self.finished:
+            status = 'finished'
+        else:
+            status = 'running'
+        return '<{} {}/{} {}>'.format(self.__class__.__name__, self.done, self.total, status)
+
+    # Called from the scheduler ***************************************************************** **
+    def _tiles_done(self, count):
+        with self._lock:
+            self._done += count
+            assert self._done <= self._total
+
+    def _finish(self, cancelled):
+        with self._lock:
+            self._cancelled = cancelled
+            self._end_time = time.monotonic()
+        self._finished_event.set()
@@ -1,13 +1,19 @@
 import collections
+import hashlib
 import weakref
-import glob
 import os
+import json
+import uuid
+import re
 
 import numpy as np
 import rtree.index
 
 from buzzard._actors.message import Msg
 from buzzard._a_raster_recipe import ARasterRecipe, ABackRasterRecipe
+from buzzard._cache_manifest import CacheManifest
+from buzzard._cache_warmup import CacheWarmup, WARM_CACHE_PRIORITIES
+from buzzard._footprint import Footprint
 
 from buzzard._actors.cached.cache_extractor import ActorCacheExtractor
 from buzzard._actors.cached.cache_supervisor import ActorCacheSupervisor
@@ -24,6 +30,62 @@ from buzzard._actors.computer import ActorComputer
 from buzzard._actors.production_gate import ActorProductionGate
 from buzzard._actors.resampler import ActorResampler
 
+# Cache file formats, and the extensions of their files
+CACHE_FILE_EXTENSION_OF_FORMAT = {
+    # Tiled GeoTIFF, read with GDAL
+    'GTiff': '.tif',
+    # Raw numpy array of shape (Y, X, C) in C order, memory-mapped to be read
+    'npy': '.npy',
+}
+
+# GDAL creation options of the 'GTiff' cache files, the `cache_options` given by the user override
+# them key by key
+DEFAULT_GTIFF_CACHE_OPTIONS = (
+    'TILED=YES',
+    'BLOCKXSIZE=256', 'BLOCKYSIZE=256',
+    'SPARSE_OK=TRUE',
+)
+
+# Name of the file of `cache_dir` that records how the cache files are encoded
+CACHE_ENCODING_FILENAME = 'buzz_cache_encoding.json'
+
+# How the cache files found in `cache_dir` are checked before being read, see
+# `Dataset.create_cached_raster_recipe`
+CACHE_VALIDATION_POLICIES = ('full', 'stat', 'lazy', 'none')
+
+CACHE_EVICTION_POLICIES = ('lru', 'lfu')
+
+# Name of a cache file: the prefix of its tile, the fingerprint of its footprint if in 'npy', the
+# fingerprint of its recipe if versioned, its checksum and its extension
+CACHE_FILENAME_PATTERN = re.compile(
+    r'^(buzz_x\d+-y\d+_x\d+-y\d+)(?:_f([0-9a-f]+))?(?:_v([0-9a-f]+))?_([0-9a-f]+)(' +
+    '|'.join(re.escape(ext) for ext in sorted(set(CACHE_FILE_EXTENSION_OF_FORMAT.values()))) +
+    r')$'
+)
+
+def recipe_fingerprint(recipe_version, fp, dtype, channel_count):
+    """Fingerprint of the cache files of a recipe, that changes with `recipe_version` or with the
+    properties of the raster"""
+    if recipe_version is None:
+        return None
+    desc = json.dumps({
+        'recipe_version': recipe_version,
+        'gt': fp.gt.tolist(),
+        'rsize': fp.rsize.tolist(),
+        'dtype': str(np.dtype(dtype)),
+        'channel_count': channel_count,
+    }, sort_keys=True)
+    return hashlib.sha1(desc.encode()).hexdigest()[:16]
+
+def footprint_fingerprint(fp):
+    """Fingerprint of the footprint of a cache file, written in its name when the format of the
+    file does not store it"""
+    desc = json.dumps({
+        'gt': fp.gt.tolist(),
+        'rsize': fp.rsize.tolist(),
+    }, sort_keys=True)
+    return hashlib.sha1(desc.encode()).hexdigest()[:8]
+
 class CachedRasterRecipe(ARasterRecipe):
     """Concrete class defining the behavior of a raster computed on the fly and fills a cache to
     avoid subsequent computations.
@@ -35,7 +97,8 @@ class CachedRasterRecipe(ARasterRecipe):
         self, ds,
         fp, dtype, channel_count, channels_schema, sr,
         compute_array, merge_arrays,
-        cache_dir, overwrite,
+        cache_dir, overwrite, cache_format, cache_options, cache_checksum, cache_validation,
+        max_cache_bytes, max_cache_tiles, cache_eviction, cache_lock_lease, recipe_version,
         primitives_back, primitives_kwargs, convert_footprint_per_primitive,
         computation_pool, merge_pool, io_pool, resample_pool,
         cache_tiles, computation_tiles,
@@ -47,7 +110,8 @@ class CachedRasterRecipe(ARasterRecipe):
             weakref.proxy(self),
             fp, dtype, channel_count, channels_schema, sr,
             compute_array, merge_arrays,
-            cache_dir, overwrite,
+            cache_dir, overwrite, cache_format, cache_options, cache_checksum, cache_validation,
+            max_cache_bytes, max_cache_tiles, cache_eviction, cache_lock_lease, recipe_version,
             primitives_back, primitives_kwargs, convert_footprint_per_primitive,
             computation_pool, merge_pool, io_pool, resample_pool,
             cache_tiles, computation_tiles,
@@ -66,6 +130,134 @@ class CachedRasterRecipe(ARasterRecipe):
         """Cache directory path provided at construction"""
         return self._back.cache_dir
 
+    @property
+    def cache_format(self):
+        """Format of the cache files provided at construction"""
+        return self._back.cache_format
+
+    @property
+    def cache_options(self):
+        """GDAL creation options of the cache files, with the defaults"""
+        return list(self._back.cache_options)
+
+    @property
+    def cache_checksum(self):
+        """Checksum algorithm of the cache files provided at construction"""
+        return self._back.cache_checksum
+
+    @property
+    def cache_validation(self):
+        """Validation policy of the cache files provided at construction"""
+        return self._back.cache_validation
+
+    @property
+    def max_cache_bytes(self):
+        """Size budget of the cache files provided at construction, or None"""
+        return self._back.max_cache_bytes
+
+    @property
+    def max_cache_tiles(self):
+        """Count budget of the cache files provided at construction, or None"""
+        return self._back.max_cache_tiles
+
+    @property
+    def cache_eviction(self):
+        """Eviction policy of the cache files provided at construction"""
+        return self._back.cache_eviction
+
+    @property
+    def cache_lock_lease(self):
+        """Lease in seconds of the claims on the cache tiles provided at construction, or None"""
+        return self._back.cache_lock_lease
+
+    @property
+    def recipe_version(self):
+        """Version of the recipe provided at construction, or None"""
+        return self._back.recipe_version
+
+    def warm_cache(self, fps=None, priority='low'):
+        """Compute and write the missing cache files of some cache tiles in the background, without
+        producing any array.
+
+        The cache tiles are computed in the order of `fps`, by the same pools as the queries.
+
+        Parameters
+        ----------
+        fps: None or Footprint or sequence of Footprint
+            The cache tiles that intersect those Footprints are warmed. If None, all the cache
+            tiles are warmed.
+        priority: str
+            - `'low'`: The work of the queries (e.g. `get_data`) goes first.
+            - `'normal'`: The first cache tiles compete with the arrays needed first by the queries.
+
+        Returns
+        -------
+        CacheWarmup
+            Progress handle with `done`, `total`, `eta`, `wait` and `cancel`.
+
+        Example
+        -------
+        >>> warmup = ds.slopes.warm_cache()
+        ... # Later
+        ... warmup.wait()
+
+        """
+        if priority not in WARM_CACHE_PRIORITIES:
+            raise ValueError('`priority` should be one of {}'.format(WARM_CACHE_PRIORITIES))
+        if fps is None:
+            cache_fps = list(self._back.cache_fps.flat)
+        else:
+            cache_fps = self._cache_fps_of_fps(fps)
+        return self._back.warm_cache(cache_fps, priority)
+
+    def invalidate_cache(self, fps):
+        """Remove the cache files of some cache tiles, they will be computed again when needed.
+        To be called after the data that the recipe depends on changed over an area.
+
+        It returns at once, the invalidation is performed later by the Dataset's scheduler. It is
+        ordered with the other calls on the rasters of the Dataset: the queries and warmups started
+        after this call returns, from any thread, never read the invalidated cache files, and a
+        `close` that follows it is performed after it. A warmup started after this call may be
+        waited on to know when the invalidation was performed.
+
+        It is safe to call while queries are ongoing:
+        - The arrays of the ongoing queries that already started reading an invalidated cache
+          file are produced from it. The file is removed once read for all of them.
+        - Their other arrays wait for the new cache files.
+        - The cache tiles being computed may use the data that changed. Their cache files are
+          removed once written, without being read, and they are computed again if needed.
+
+        Parameters
+        ----------
+        fps: Footprint or sequence of Footprint
+            The cache tiles that intersect those Footprints are invalidated.
+
+        Example
+        -------
+        >>> ds.slopes.invalidate_cache(ds.dem.fp.clip(0, 0, 1000, 1000))
+
+        """
+        cache_fps = self._cache_fps_of_fps(fps)
+        if cache_fps:
+            self._back.invalidate_cache(cache_fps)
+
+    def _cache_fps_of_fps(self, fps):
+        if isinstance(fps, Footprint):
+            fps = [fps]
+        cache_fps = []
+        seen = set()
+        for fp in fps:
+            if not isinstance(fp, Footprint):
+                msg = 'element of `fps` parameter should be a Footprint (not {})'.format(fp) # pragma: no cover
+                raise ValueError(msg)
+            if not fp.share_area(self.fp):
+                continue
+            for cache_fp in self._back.cache_fps_of_fp(self.fp & fp):
+                if cache_fp not in seen:
+                    seen.add(cache_fp)
+                    cache_fps.append(cache_fp)
+        return cache_fps
+
 class BackCachedRasterRecipe(ABackRasterRecipe):
     """Implementation of CachedRasterRecipe's specifications"""
 
@@ -73,7 +265,8 @@ class BackCachedRasterRecipe(ABackRasterRecipe):
         self, back_ds, facade_proxy,
         fp, dtype, channel_count, channels_schema, sr,
         compute_array, merge_arrays,
-        cache_dir, overwrite,
+        cache_dir, overwrite, cache_format, cache_options, cache_checksum, cache_validation,
+        max_cache_bytes, max_cache_tiles, cache_eviction, cache_lock_lease, recipe_version,
         primitives_back, primitives_kwargs, convert_footprint_per_primitive,
         computation_pool, merge_pool, io_pool, resample_pool,
         cache_tiles, computation_tiles,
@@ -110,6 +303,32 @@ class BackCachedRasterRecipe(ABackRasterRecipe):
         self.cache_fps = cache_tiles
         self.cache_dir = cache_dir
         self.overwrite = overwrite
+        self.cache_format = cache_format
+        self.cache_file_extension = CACHE_FILE_EXTENSION_OF_FORMAT[cache_format]
+        if cache_format == 'GTiff':
+            self.cache_options = merge_gdal_options(DEFAULT_GTIFF_CACHE_OPTIONS, cache_options)
+        else:
+            self.cache_options = []
+        self.cache_checksum = cache_checksum
+        self.cache_validation = cache_validation
+        self.max_cache_bytes = max_cache_bytes
+        self.max_cache_tiles = max_cache_tiles
+        self.cache_eviction = cache_eviction
+        self.cache_lock_lease = cache_lock_lease
+        self.recipe_version = recipe_version
+        self.recipe_fingerprint = recipe_fingerprint(recipe_version, fp, dtype, channel_count)
+        # Decoding can also use several threads
+        self.cache_open_options = [
+            opt
+            for opt in self.cache_options
+            if opt.partition('=')[0].upper() == 'NUM_THREADS'
+        ]
+        self.cache_manifest = CacheManifest(
+            cache_dir, lambda name: CACHE_FILENAME_PATTERN.match(name) is not None,
+        )
+        self._cache_paths_of_prefix = None
+        self._cache_stat_of_path = None
+        self.stale_cache_paths = None
 
         # Tilings shortcuts ****************************************************
         self._cache_footprint_index = self._build_cache_fps_index(
@@ -152,18 +371,134 @@ class BackCachedRasterRecipe(ABackRasterRecipe):
         ]
         return "buzz_x{:03d}-y{:03d}_x{:05d}-y{:05d}".format(*params)
 
+    def fname_stem_of_cache_fp(self, cache_fp):
+        """Name of the cache file of a cache tile, without its checksum and its extension"""
+        stem = self.fname_prefix_of_cache_fp(cache_fp)
+        if self.cache_format == 'npy':
+            stem = '{}_f{}'.format(stem, footprint_fingerprint(cache_fp))
+        if self.recipe_fingerprint is not None:
+            stem = '{}_v{}'.format(stem, self.recipe_fingerprint)
+        return stem
+
+    def load_cache_manifest(self):
+        """Index the cache files of `cache_dir` in the format of this raster, from its manifest.
+        The ones with another recipe fingerprint are listed in `stale_cache_paths`."""
+        self._cache_paths_of_prefix = collections.defaultdict(list)
+        self._cache_stat_of_path = {}
+        self.stale_cache_paths = []
+        for name, stat in self.cache_manifest.load().items():
+            prefix, _, fingerprint, _, ext = CACHE_FILENAME_PATTERN.match(name).groups()
+            if ext == self.cache_file_extension:
+                path = os.path.join(self.cache_dir, name)
+                if fingerprint != self.recipe_fingerprint:
+                    self.stale_cache_paths.append(path)
+                    continue
+                self._cache_paths_of_prefix[prefix].append(path)
+                self._cache_stat_of_path[path] = stat
+
+    def cache_file_matches_manifest(self, path):
+        """Whether the size and the modification time of a cache file are the ones recorded in the
+        manifest of `cache_dir` when it was loaded"""
+        stat = self._cache_stat_of_path.get(path)
+        if stat is None:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == stat
+
+    def cache_file_size(self, path):
+        """Size of a cache file, from the manifest of `cache_dir` when possible"""
+        stat = self._cache_stat_of_path.get(path)
+        if stat is not None:
+            return stat[0]
+        return os.stat(path).st_size
+
+    def scan_cache_path_candidates(self, cache_fps):
+        """List the cache files of some cache tiles in the format of this raster, from a listing of
+        `cache_dir` to find the ones written by other processes since `load_cache_manifest`
+
+        Returns
+        -------
+        dict of Footprint to list of str
+        """
+        cache_fp_of_prefix = {
+            self.fname_prefix_of_cache_fp(cache_fp): cache_fp
+            for cache_fp in cache_fps
+        }
+        paths_of_cache_fp = collections.defaultdict(list)
+        for entry in os.scandir(self.cache_dir):
+            match = CACHE_FILENAME_PATTERN.match(entry.name)
+            if match is None:
+                continue
+            prefix, _, fingerprint, _, ext = match.groups()
+            if (ext == self.cache_file_extension and fingerprint == self.recipe_fingerprint and
+                    prefix in cache_fp_of_prefix):
+                paths_of_cache_fp[cache_fp_of_prefix[prefix]].append(entry.path)
+        return paths_of_cache_fp
+
     def list_cache_path_candidates(self, cache_fp=None):
+        """List the cache files of a cache tile in the format of this raster, as indexed by
+        `load_cache_manifest`, or all the cache files of `cache_dir` in any format"""
         if cache_fp is not None:
+            if self._cache_paths_of_prefix is None:
+                self.load_cache_manifest()
             prefix = self.fname_prefix_of_cache_fp(cache_fp)
-            s = os.path.join(self.cache_dir, prefix + '_[0123456789abcdef]*.tif') # TODO: Use regex
-            return glob.glob(s)
+            return list(self._cache_paths_of_prefix.get(prefix, []))
         else:
-            s = os.path.join(
-                self.cache_dir,
-                 # TODO: Use regex
-                'buzz_x[0-9]*-y[0-9]*_x[0-9]*-y[0-9]*_[0123456789abcdef]*.tif',
-            )
-            return glob.glob(s)
+            return [
+                entry.path
+                for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and CACHE_FILENAME_PATTERN.match(entry.name)
+            ]
+
+    @property
+    def cache_encoding(self):
+        """How the cache files are encoded, as recorded in `CACHE_ENCODING_FILENAME`"""
+        return {
+            'cache_format': self.cache_format,
+            'cache_options': self.cache_options,
+            'cache_checksum': self.cache_checksum,
+        }
+
+    def read_cache_encoding(self):
+        """Read the encoding recorded in `cache_dir`, or None"""
+        path = os.path.join(self.cache_dir, CACHE_ENCODING_FILENAME)
+        try:
+            with open(path) as stream:
+                return json.load(stream)
+        except (OSError, ValueError):
+            return None
+
+    def write_cache_encoding(self):
+        """Record the encoding of the cache files of this raster in `cache_dir`"""
+        path = os.path.join(self.cache_dir, CACHE_ENCODING_FILENAME)
+        tmp_path = os.path.join(self.cache_dir, 'tmp_' + str(uuid.uuid4()) + '.json')
+        with open(tmp_path, 'w') as stream:
+            json.dump(self.cache_encoding, stream, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def warm_cache(self, cache_fps, priority):
+        warmup = CacheWarmup(self, len(cache_fps))
+        if len(cache_fps) == 0:
+            warmup._finish(cancelled=False)
+        else:
+            self.back_ds.put_message(Msg(
+                '/Raster{}/CacheSupervisor'.format(self.uid),
+                'warm_cache', warmup, cache_fps, priority,
+            ))
+        return warmup
+
+    def invalidate_cache(self, cache_fps):
+        self.back_ds.put_message(Msg(
+            '/Raster{}/CacheSupervisor'.format(self.uid),
+            'invalidate_cache', cache_fps,
+        ))
+
+    def close(self):
+        self.back_ds.tile_memory_cache.discard_raster(self.uid)
+        super().close()
 
     def create_actors(self):
         actors = [
@@ -200,3 +535,11 @@ class BackCachedRasterRecipe(ABackRasterRecipe):
             bounds = np.r_[rtl, rtl + fp.rsize] + bounds_inset
             idx.insert(i, bounds)
         return idx
+
+def merge_gdal_options(defaults, options):
+    """Merge two sequences of GDAL options of the form `KEY=VALUE`, `options` overrides `defaults`"""
+    merged = collections.OrderedDict()
+    for opt in list(defaults) + list(options):
+        key, _, _ = opt.partition('=')
+        merged[key.upper()] = opt
+    return list(merged.values())
@@ -23,7 +23,9 @@ from buzzard._gdal_mem_raster import GDALMemRaster
 from buzzard._gdal_memory_vector import GDALMemoryVector
 from buzzard._dataset_register import DatasetRegisterMixin
 from buzzard._numpy_raster import NumpyRaster
-from buzzard._cached_raster_recipe import CachedRasterRecipe
+from buzzard._cached_raster_recipe import CachedRasterRecipe, CACHE_FILE_EXTENSION_OF_FORMAT
+from buzzard._cached_raster_recipe import CACHE_VALIDATION_POLICIES, CACHE_EVICTION_POLICIES
+from buzzard._cache_checksum import CHECKSUM_ALGORITHMS, checksum_hasher
 from buzzard._a_pooled_emissary import APooledEmissary
 import buzzard.utils
 
@@ -89,6 +91,25 @@ class Dataset(DatasetRegisterMixin):
         (see :ref:`Sources activation / deactivation` below)
     debug_observers: sequence of object
         Entry points to observe what is happening in the Dataset's sheduler.
+    scheduler_shard_count: int >= 1
+        Number of threads used by the Dataset's scheduler. With `1` a single thread runs all the
+        actors. With `n > 1` the first thread runs the actors that manage the pools and the
+        priorities, and the actors of each async raster are run by one of the `n - 1` other
+        threads. Using several threads is only useful when many async rasters are queried at the
+        same time.
+    scheduler_profiling: bool
+        Whether or not to aggregate statistics about the Dataset's scheduler, see
+        :py:meth:`Dataset.scheduler_stats`. Timing the actors has a small cost.
+    shared_memory_transport: bool
+        Whether or not the arrays produced on process pools by the async rasters (reads of cache
+        files, results of `compute_array` and resamplings) are sent back to the scheduler through
+        shared memory instead of being pickled. Requires python 3.8, ignored otherwise.
+    tile_memory_cache_bytes: int >= 0
+        Byte budget of an in-RAM tier in front of the cache files of the cached raster recipes,
+        `0` to disable it. The cache tiles written or read are kept in memory, the least recently
+        used ones are evicted. A read of a tile in memory does not go through the `io_pool`, see
+        :py:meth:`Dataset.tile_memory_cache_stats`. When enabled, the cache files are always read
+        whole.
 
     Examples
     --------
@@ -172,6 +193,10 @@ class Dataset(DatasetRegisterMixin):
     ensure that no more than `max_active` driver objects are active at the same time, by
     deactivating the LRU ones.
 
+    The cache files of the async rasters are read by the workers of the `io_pool`. When it is a
+    process pool, each worker process keeps the last 16 cache files it opened, outside of the
+    `max_active` limit. Those are dropped when one of the Dataset's async rasters is closed.
+
     .. _On the fly re-projections in buzzard:
     On the fly re-projections in buzzard
     ------------------------------------
@@ -298,6 +323,10 @@ class Dataset(DatasetRegisterMixin):
                  allow_interpolation=False,
                  max_active=np.inf,
                  debug_observers=(),
+                 scheduler_shard_count=1,
+                 scheduler_profiling=False,
+                 shared_memory_transport=True,
+                 tile_memory_cache_bytes=0,
                  **kwargs):
         sr_fallback, kwargs = deprecation_pool.handle_param_renaming_with_kwargs(
             new_name='sr_fallback', old_names={'sr_implicit': '0.4.4'}, context='Dataset.__init__',
@@ -365,6 +394,12 @@ class Dataset(DatasetRegisterMixin):
 
         if max_active < 1: # pragma: no cover
             raise ValueError('`max_active` should be greater than 1')
+        if int(scheduler_shard_count) != scheduler_shard_count or scheduler_shard_count < 1: # pragma: no cover
+            raise ValueError('`scheduler_shard_count` should be an integer of at least 1')
+        scheduler_shard_count = int(scheduler_shard_count)
+        if int(tile_memory_cache_bytes) != tile_memory_cache_bytes or tile_memory_cache_bytes < 0: # pragma: no cover
+            raise ValueError('`tile_memory_cache_bytes` should be a non-negative integer')
+        tile_memory_cache_bytes = int(tile_memory_cache_bytes)
 
         allow_interpolation = bool(allow_interpolation)
         allow_none_geometry = bool(allow_none_geometry)
@@ -380,6 +415,10 @@ class Dataset(DatasetRegisterMixin):
             max_active=max_active,
             ds_id=id(self),
             debug_observers=debug_observers,
+            scheduler_shard_count=scheduler_shard_count,
+            scheduler_profiling=bool(scheduler_profiling),
+            shared_memory_transport=bool(shared_memory_transport),
+            tile_memory_cache_bytes=tile_memory_cache_bytes,
         )
         super(Dataset, self).__init__()
 
@@ -993,6 +1032,10 @@ class Dataset(DatasetRegisterMixin):
         - A *multiprocessing.pool.ThreadPool*, should be the default choice.
         - A *multiprocessing.pool.Pool*, a process pool. Useful for computations that requires the
           GIL or that leaks memory.
+        - A *concurrent.futures.ThreadPoolExecutor* or a *concurrent.futures.ProcessPoolExecutor*,
+          the counterparts of the two above. Useful to share the executors of an application with
+          buzzard. The `initializer` and `max_tasks_per_child` parameters of the executors are
+          supported.
         - `None`, to request the scheduler thread to perform the tasks itself. Should be used when
           the computation is very light.
         - A *hashable* (like a *string*), that will map to a pool registered in the *Dataset*. If
@@ -1019,7 +1062,10 @@ class Dataset(DatasetRegisterMixin):
             compute_array=None, merge_arrays=buzzard.utils.concat_arrays,
 
             # filesystem
-            cache_dir=None, ow=False,
+            cache_dir=None, ow=False, cache_format='GTiff', cache_options=(), cache_checksum='sum64',
+            cache_validation='full',
+            max_cache_bytes=None, max_cache_tiles=None, cache_eviction='lru',
+            cache_lock_lease=None, recipe_version=None,
 
             # primitives
             queue_data_per_primitive=MappingProxyType({}), convert_footprint_per_primitive=None,
@@ -1037,8 +1083,10 @@ class Dataset(DatasetRegisterMixin):
         twice. Cache files are used to store and reuse pixels from computations. The cache can even
         be reused between python sessions.
 
-        If you are familiar with `create_raster_recipe` four parameters are new here: `io_pool`,
-        `cache_tiles`, `cache_dir` and `ow`. They are all related to file system operations.
+        If you are familiar with `create_raster_recipe` thirteen parameters are new here: `io_pool`,
+        `cache_tiles`, `cache_dir`, `ow`, `cache_format`, `cache_options`, `cache_checksum`,
+        `cache_validation`, `max_cache_bytes`, `max_cache_tiles`, `cache_eviction`,
+        `cache_lock_lease` and `recipe_version`. They are all related to the cache files.
 
         See `create_raster_recipe` method, since it shares most of the features:
 
@@ -1073,6 +1121,91 @@ class Dataset(DatasetRegisterMixin):
                 not only the tiles needed (hence computed) but all buzzard cache files in
                 `cache_dir` will be deleted.
 
+        cache_format: str
+            Format of the cache files.
+
+            - `'GTiff'`: Tiled GeoTIFF files, with the footprint, the spatial reference and the
+              channels schema of the raster. They are read with GDAL.
+            - `'npy'`: Raw numpy arrays of shape `(Y, X, C)` in `.npy` files, their footprint is
+              given by their name, with a fingerprint of its geotransform and size. They are
+              memory-mapped to be read, this saves the overhead of GDAL, which is worthwhile when
+              the cache files are read many times.
+
+            The cache files in the other format present in `cache_dir` are ignored.
+
+        cache_options: sequence of str
+            GDAL creation options of the `'GTiff'` cache files, they override the default ones
+            (`TILED=YES`, `BLOCKXSIZE=256`, `BLOCKYSIZE=256` and `SPARSE_OK=TRUE`) key by key. For
+            example `['COMPRESS=ZSTD', 'ZSTD_LEVEL=9', 'PREDICTOR=3', 'NUM_THREADS=4']` to
+            compress floating point cache files. `NUM_THREADS` is also used to decode the files.
+
+            The format and the options are recorded in a `buzz_cache_encoding.json` file in
+            `cache_dir`. The compression and the block size of a cache file are compared to the
+            options whenever it is checked, a file that differs is deleted and recomputed.
+
+        cache_checksum: str
+            Checksum algorithm of the cache files, the name of a cache file ends with its
+            checksum. It is computed while the file is written and verified before the file is
+            first read.
+
+            - `'sum64'`: Sum of the file's bytes as uint64 words, the fastest and the weakest.
+            - `'crc32'`: CRC-32 of zlib.
+            - `'blake2b'`: 64 bits BLAKE2b, the strongest.
+            - `'xxh3'`: 64 bits XXH3, strong and fast, requires the `xxhash` package.
+
+            Changing it invalidates the cache files written with another one.
+
+        cache_validation: str
+            How the cache files found in `cache_dir` are checked before being first read.
+
+            - `'full'`: Their checksum, footprint, dtype and channel count are checked.
+            - `'stat'`: The ones whose size and modification time are the ones recorded in the
+              manifest of `cache_dir` when they were written or last checked are trusted, the
+              others are fully checked.
+            - `'lazy'`: They are trusted and read right away, they are fully checked in the
+              background when the `io_pool` has nothing else to do. A corrupted file is recomputed
+              for the next queries and then removed, the queries that already read it are not
+              protected.
+            - `'none'`: They are trusted.
+
+            When the encoding of `cache_dir` changed, the cache files are fully checked in that
+            session and the ones not read are checked following `cache_validation` in the next
+            sessions as if their stats were unknown, `'none'` still trusts them.
+
+        max_cache_bytes: None or int
+            Size budget of the cache files of this raster in `cache_dir`, `None` for no limit.
+            When it is exceeded, cache files are removed following `cache_eviction`, they will be
+            computed again if needed. The cache tiles of the queries alive are not removed
+            until they are read for all the arrays needing them, the budget may be exceeded
+            meanwhile.
+        max_cache_tiles: None or int
+            Count budget of the cache files of this raster in `cache_dir`, `None` for no limit.
+            It is enforced like `max_cache_bytes`.
+        cache_eviction: str
+            Which cache files are removed first when a budget is exceeded.
+
+            - `'lru'`: The least recently used.
+            - `'lfu'`: The least frequently used, then the least recently used.
+
+            The cache files found in `cache_dir` and not used since are removed first.
+        cache_lock_lease: None or float
+            To share `cache_dir` between several processes or hosts building the same raster,
+            duration in seconds of the claims on the cache tiles being computed, `None` to
+            disable the claims.
+
+            Before computing a missing cache tile, this raster claims it with a lock file in the
+            `.locks` subdirectory of `cache_dir`, renewed while the tile is computed. The cache
+            tiles claimed by other processes are not computed, `cache_dir` is polled until their
+            cache files appear.
+            If a claim expires before, because its process died, the cache tile is claimed and
+            computed by this raster. It should be larger than the duration of a computation.
+        recipe_version: None or str or int
+            Version of `compute_array` and `merge_arrays`, to be changed when they produce
+            different arrays. A fingerprint of `recipe_version`, `fp`, `dtype` and
+            `channel_count` is written in the name of each cache file, the cache files of
+            `cache_dir` with another fingerprint are removed and computed again.
+            If None, the cache files are not fingerprinted.
+
         queue_data_per_primitive:
             see :py:meth:`Dataset.create_raster_recipe` method
         convert_footprint_per_primitive:
@@ -1224,13 +1357,44 @@ class Dataset(DatasetRegisterMixin):
         cache_dir = str(cache_dir)
         overwrite = bool(ow)
         del ow
+        if cache_format not in CACHE_FILE_EXTENSION_OF_FORMAT:
+            raise ValueError('`cache_format` should be one of {}'.format(
+                sorted(CACHE_FILE_EXTENSION_OF_FORMAT.keys())
+            ))
+        cache_options = [str(arg) for arg in cache_options]
+        if cache_format != 'GTiff' and cache_options:
+            raise ValueError('`cache_options` is only supported with `cache_format=\'GTiff\'`')
+        if cache_checksum not in CHECKSUM_ALGORITHMS:
+            raise ValueError('`cache_checksum` should be one of {}'.format(CHECKSUM_ALGORITHMS))
+        checksum_hasher(cache_checksum) # This may raise ImportError
+        if cache_validation not in CACHE_VALIDATION_POLICIES:
+            raise ValueError('`cache_validation` should be one of {}'.format(
+                CACHE_VALIDATION_POLICIES
+            ))
+        for name, budget in [('max_cache_bytes', max_cache_bytes),
+                             ('max_cache_tiles', max_cache_tiles)]:
+            if budget is not None and (int(budget) != budget or budget < 0):
+                raise ValueError('`{}` should be None or a non-negative integer'.format(name))
+        if max_cache_bytes is not None:
+            max_cache_bytes = int(max_cache_bytes)
+        if max_cache_tiles is not None:
+            max_cache_tiles = int(max_cache_tiles)
+        if cache_eviction not in CACHE_EVICTION_POLICIES:
+            raise ValueError('`cache_eviction` should be one of {}'.format(CACHE_EVICTION_POLICIES))
+        if cache_lock_lease is not None:
+            cache_lock_lease = float(cache_lock_lease)
+            if not cache_lock_lease > 0:
+                raise ValueError('`cache_lock_lease` should be None or a positive number')
+        if recipe_version is not None and not isinstance(recipe_version, (str, int)):
+            raise TypeError('`recipe_version` should be None, a str or an int')
 
         # Construction *********************************************************
         prox = CachedRasterRecipe(
             self,
             fp, dtype, channel_count, channels_schema, wkt,
             compute_array, merge_arrays,
-            cache_dir, overwrite,
+            cache_dir, overwrite, cache_format, cache_options, cache_checksum, cache_validation,
+            max_cache_bytes, max_cache_tiles, cache_eviction, cache_lock_lease, recipe_version,
             primitives_back, primitives_kwargs, convert_footprint_per_primitive,
             computation_pool, merge_pool, io_pool, resample_pool,
             cache_tiles, computation_tiles,
@@ -1255,7 +1419,10 @@ class Dataset(DatasetRegisterMixin):
             compute_array=None, merge_arrays=buzzard.utils.concat_arrays,
 
             # filesystem
-            cache_dir=None, ow=False,
+            cache_dir=None, ow=False, cache_format='GTiff', cache_options=(), cache_checksum='sum64',
+            cache_validation='full',
+            max_cache_bytes=None, max_cache_tiles=None, cache_eviction='lru',
+            cache_lock_lease=None, recipe_version=None,
 
             # primitives
             queue_data_per_primitive=MappingProxyType({}), convert_footprint_per_primitive=None,
@@ -1281,7 +1448,8 @@ class Dataset(DatasetRegisterMixin):
             _AnonymousSentry(),
             fp, dtype, channel_count, channels_schema, sr,
             compute_array, merge_arrays,
-            cache_dir, ow,
+            cache_dir, ow, cache_format, cache_options, cache_checksum, cache_validation,
+            max_cache_bytes, max_cache_tiles, cache_eviction, cache_lock_lease, recipe_version,
             queue_data_per_primitive, convert_footprint_per_primitive,
             computation_pool, merge_pool, io_pool, resample_pool,
             cache_tiles, computation_tiles, max_resampling_size,
@@ -1574,6 +1742,7 @@ class Dataset(DatasetRegisterMixin):
 
         - Stopping the scheduler
         - Joining the mp.Pool that have been automatically allocated
+        - Destroying the shared memory used to transport arrays from the process pools
         - Closing all sources
 
         Examples
@@ -1617,6 +1786,8 @@ class Dataset(DatasetRegisterMixin):
 
             # Safely release all resources
             self._back.pools_container._close()
+            if self._back.shared_memory_arena is not None:
+                self._back.shared_memory_arena.close()
             for source in list(self._keys_of_source.keys()):
                 source.close()
 
@@ -1720,6 +1891,59 @@ class Dataset(DatasetRegisterMixin):
         """
         return self._back.pools_container
 
+    def scheduler_stats(self):
+        """Get a snapshot of the statistics of the Dataset's scheduler. Only available when the
+        Dataset was created with `scheduler_profiling=True`.
+
+        It can be used to find which actor bounds the throughput of the async rasters.
+
+        Returns
+        -------
+        dict with the following keys
+            'actors': dict of str to dict
+                Per actor class name: 'count', 'total_time', 'max_time' and 'histogram'.
+                'histogram' maps the (exclusive) upper bound of a latency bucket, in seconds, to a
+                count. The buckets are powers of two, starting at 1 microsecond.
+            'messages': dict of (str, str) to dict
+                Same as 'actors' but per (actor class name, message title).
+            'mailboxes': dict of int to dict
+                Per scheduler thread index: 'depth' and 'max_depth' of the queue of incoming
+                messages. The thread `0` receives the messages sent from outside of the scheduler.
+            'pools': dict of int to dict
+                Per `id(pool)`: 'token_count', 'max_token_count', 'used_tokens',
+                'max_used_tokens', 'waiting_jobs' and 'max_waiting_jobs'. The number of tokens of
+                a pool is tuned by the scheduler, see `PoolsContainer.set_token_bounds`.
+
+        Example
+        -------
+        >>> stats = ds.scheduler_stats()
+        ... slowest = max(stats['actors'].items(), key=lambda kv: kv[1]['total_time'])
+
+        """
+        return self._back.scheduler_stats()
+
+    def tile_memory_cache_stats(self):
+        """Get a snapshot of the counters of the in-RAM tier in front of the cache files of the
+        cached raster recipes, see the `tile_memory_cache_bytes` parameter of `Dataset`.
+
+        Returns
+        -------
+        dict with the following keys
+            'hits': int
+                Number of reads of cache tiles found in memory
+            'misses': int
+                Number of reads of cache tiles not found in memory, read from disk
+            'evictions': int
+                Number of cache tiles evicted to stay below the byte budget
+            'tile_count': int
+                Number of cache tiles in memory
+            'bytes': int
+                Size of those cache tiles
+            'max_bytes': int
+                Byte budget
+        """
+        return self._back.tile_memory_cache.stats()
+
     # Deprecation ******************************************************************************* **
     open_araster = deprecation_pool.wrap_method(
         aopen_raster,
@@ -3,6 +3,8 @@ from buzzard._dataset_back_conversions import BackDatasetConversionsMixin
 from buzzard._dataset_back_activation_pool import BackDatasetActivationPoolMixin
 from buzzard._dataset_back_scheduler import BackDatasetSchedulerMixin
 from buzzard._dataset_pools_container import PoolsContainer
+from buzzard._shared_memory_arena import SharedMemoryArena
+from buzzard._tile_memory_cache import TileMemoryCache
 
 class BackDataset(BackDatasetConversionsMixin,
                      BackDatasetActivationPoolMixin,
@@ -10,8 +12,14 @@ class BackDataset(BackDatasetConversionsMixin,
     """Backend of the Dataset, referenced by backend proxies
     Implements activation (pooling) and conversion methods"""
 
-    def __init__(self, allow_none_geometry, allow_interpolation, **kwargs):
+    def __init__(self, allow_none_geometry, allow_interpolation, shared_memory_transport,
+                 tile_memory_cache_bytes, **kwargs):
         self.allow_interpolation = allow_interpolation
         self.allow_none_geometry = allow_none_geometry
         self.pools_container = PoolsContainer()
+        if shared_memory_transport and SharedMemoryArena.available:
+            self.shared_memory_arena = SharedMemoryArena()
+        else:
+            self.shared_memory_arena = None
+        self.tile_memory_cache = TileMemoryCache(tile_memory_cache_bytes)
         super(BackDataset, self).__init__(**kwargs)
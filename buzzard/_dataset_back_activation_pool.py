@@ -1,6 +1,7 @@
 import collections
 import threading
 import contextlib
+import uuid
 
 from buzzard._tools import MultiOrderedDict
 
@@ -16,6 +17,8 @@ class BackDatasetActivationPoolMixin(object):
         self._ap_lock = threading.Lock()
         self._ap_idle = MultiOrderedDict()
         self._ap_used = collections.Counter()
+        self._ap_workers_key = uuid.uuid4().hex
+        self._ap_workers_generation = 0
         super(BackDatasetActivationPoolMixin, self).__init__(**kwargs)
 
     def activate(self, uid, allocator):
@@ -47,6 +50,29 @@ class BackDatasetActivationPoolMixin(object):
             for uid in idle:
                 self._ap_idle.pop_all_occurrences(uid)
 
+    def deactivate_many_idle(self, uid_set):
+        """Flush all occurrences of the uids of uid_set from _ap_idle. The driver objects currently
+        used are left alone, they are pushed to _ap_idle once released
+        """
+        if len(uid_set) == 0:
+            return
+        with self._ap_lock:
+            idle = self._ap_idle & uid_set
+            for uid in idle:
+                self._ap_idle.pop_all_occurrences(uid)
+
+    @property
+    def workers_activation_key(self):
+        """Key that the jobs running on process pools give to `_worker_activation_pool`, it
+        changes when the driver objects idle in the workers should be dropped"""
+        return (self._ap_workers_key, self._ap_workers_generation)
+
+    def deactivate_all_in_workers(self):
+        """Flush the driver objects idle in the workers of the process pools, when they will
+        receive their next job"""
+        with self._ap_lock:
+            self._ap_workers_generation += 1
+
     def used_count(self, uid=None):
         """Count how many driver objects exist for uid"""
         with self._ap_lock:
@@ -1,20 +1,42 @@
 import collections
-import time
 import threading
-import datetime
+import itertools
+import operator
+import time
 
 from buzzard._actors.top_level import ActorTopLevel
-from buzzard._actors.message import Msg, DroppableMsg, AgingMsg
+from buzzard._actors.message import Msg, DroppableMsg, AgingMsg, BouncingMsg
 from buzzard._debug_observers_manager import DebugObserversManager
+from buzzard._scheduler_profiler import SchedulerProfiler
 
 VERBOSE = 0
 
-class BackDatasetSchedulerMixin(object):
-    """TODO: docstring"""
+# Maximum time spent by the scheduler waiting for a wakeup signal. Most of the events that the
+# scheduler is interested in are signaled through `_SchedulerShard.wakeup_event`, this timeout is
+# only a safety net for the events that are not (yet) signaled.
+MAX_IDLE_SLEEP = 1 / 20
 
-    def __init__(self, ds_id, debug_observers, **kwargs):
-        self._ext_message_to_scheduler_queue = []
-        self._thread = None
+class BackDatasetSchedulerMixin(object):
+    """Private mixin for the Dataset class containing the scheduler of the async rasters.
+
+    The scheduler is made of one or more threads called shards. The first shard hosts the
+    `/Global/` and the `/Pool*/` actors and receives all the messages sent from outside of the
+    scheduler. The actors of a raster (a `/Raster*/` group) all live in the same shard, the rasters
+    are spread over the other shards. The shards communicate through their mailboxes.
+    """
+
+    def __init__(self, ds_id, debug_observers, scheduler_shard_count, scheduler_profiling,
+                 **kwargs):
+        if scheduler_profiling:
+            self._profiler = SchedulerProfiler()
+            debug_observers = list(debug_observers) + [self._profiler]
+        else:
+            self._profiler = None
+        self._shards = [_SchedulerShard(i) for i in range(scheduler_shard_count)]
+        self._shard_of_raster_group = {}
+        self._shard_of_raster_group_lock = threading.Lock()
+        self._raster_shards_cycle = itertools.cycle(self._shards[1:])
+        self._threads = None
         self._thread_exn = None
         self._ds_id = ds_id
         self._stop = False
@@ -23,19 +45,26 @@ class BackDatasetSchedulerMixin(object):
 
     # Public methods **************************************************************************** **
     def ensure_scheduler_living(self):
-        if self._thread is None:
-            self._thread = threading.Thread(
-                target=self._exception_catcher,
-                name='Dataset{:#x}Scheduler'.format(self._ds_id),
-                daemon=True,
-            )
-            self._thread.start()
-            self._debug_mngr.event('object_allocated', self._thread)
+        if self._threads is None:
+            self._threads = [
+                threading.Thread(
+                    target=self._exception_catcher,
+                    args=(shard,),
+                    name='Dataset{:#x}Scheduler{}'.format(
+                        self._ds_id, '' if shard.idx == 0 else shard.idx
+                    ),
+                    daemon=True,
+                )
+                for shard in self._shards
+            ]
+            for thread in self._threads:
+                thread.start()
+                self._debug_mngr.event('object_allocated', thread)
         else:
             self.ensure_scheduler_still_alive()
 
     def ensure_scheduler_still_alive(self):
-        if not self._thread.isAlive():
+        if not all(thread.is_alive() for thread in self._threads):
             if isinstance(self._thread_exn, Exception):
                 raise self._thread_exn
             else:
@@ -47,59 +76,142 @@ class BackDatasetSchedulerMixin(object):
         if check_scheduler_status:
             self.ensure_scheduler_living()
 
-        # a list is thread-safe: https://stackoverflow.com/a/6319267/4952173
-        self._ext_message_to_scheduler_queue.append(msg)
+        # All external messages go through the first shard, this way they are received in the
+        # order they were sent.
+        self._shards[0].post('ext_receive_', msg, None)
+
+    def scheduler_wakeup(self, address='/Global/TopLevel'):
+        """Object with a thread-safe `set` method that wakes up the scheduler's thread hosting
+        the actor at `address` if it is idle.
+
+        It should be triggered by anything that may give some work to the scheduler (e.g. a pool
+        job completed, an output queue was pulled or collected).
+        """
+        return self._shard_of_group(address.split('/')[1]).wakeup_event
+
+    def scheduler_stats(self):
+        if self._profiler is None:
+            raise RuntimeError(
+                'Scheduler profiling is disabled, pass `scheduler_profiling=True` to the Dataset'
+            )
+        return self._profiler.snapshot()
 
     def stop_scheduler(self):
         self._stop = True
-        if self._thread is not None:
-            self._thread.join()
+        for shard in self._shards:
+            shard.wakeup_event.set()
+        if self._threads is not None:
+            for thread in self._threads:
+                thread.join()
 
     # Private methods *************************************************************************** **
-    def _exception_catcher(self):
+    def _shard_of_group(self, grp_name, assign=True):
+        """Retrieve the shard hosting a group of actors. A raster group is assigned to a shard the
+        first time it is needed and stays there until the last of its actors dies. If `assign` is
+        False, None is returned for a raster group that is not assigned.
+        """
+        if len(self._shards) == 1 or not grp_name.startswith('Raster'):
+            return self._shards[0]
+        shard = self._shard_of_raster_group.get(grp_name)
+        if shard is None and assign:
+            with self._shard_of_raster_group_lock:
+                if grp_name not in self._shard_of_raster_group:
+                    self._shard_of_raster_group[grp_name] = next(self._raster_shards_cycle)
+                shard = self._shard_of_raster_group[grp_name]
+        return shard
+
+    def _forget_shard_of_group(self, grp_name):
+        """The last actor of a raster group died in its shard"""
+        if len(self._shards) == 1 or not grp_name.startswith('Raster'):
+            return
+        with self._shard_of_raster_group_lock:
+            del self._shard_of_raster_group[grp_name]
+
+    def _exception_catcher(self, shard):
         try:
             self._debug_mngr.event('scheduler_starting')
             self._debug_mngr.event('scheduler_activity_update', True)
-            self._scheduler_loop_until_dataset_close()
+            self._scheduler_loop_until_dataset_close(shard)
             self._debug_mngr.event('scheduler_activity_update', False)
             self._debug_mngr.event('scheduler_stopping')
         except Exception as e:
-            self._thread_exn = e
+            if self._thread_exn is None:
+                self._thread_exn = e
+
+            # Bring the other shards down too
+            self._stop = True
+            for other_shard in self._shards:
+                other_shard.wakeup_event.set()
             raise
 
-    def _scheduler_loop_until_dataset_close(self):
-        """This is the entry point of a Dataset's scheduler.
+    def _scheduler_loop_until_dataset_close(self, shard):
+        """This is the entry point of a Dataset's scheduler shard.
         The design of this method would be much better with recursive calls, but much slower too. (maybe)
 
         TODO: Improve main loop perfs
         """
 
         def _register_actor(a):
-            if hasattr(a, 'ext_receive_nothing'):
-                keep_alive_actors.append(a)
-
             address = a.address
 
             _, grp_name, name = address.split('/')
+            owner = self._shard_of_group(grp_name)
+            if owner is not shard:
+                # This actor was instanciated here but lives in another shard
+                owner.post(None, a, shard)
+                return
+
+            if hasattr(a, 'ext_receive_nothing'):
+                keep_alive_actors.append(a)
+
             assert name not in actors[grp_name]
             actors[grp_name][name] = a
 
+            cls = a.__class__
+            if cls not in dispatch_table_per_class:
+                dispatch_table_per_class[cls] = _build_dispatch_table(cls)
+            routes.clear()
+
         def _find_actors(address, relative_actor):
+            # Resolution of addresses is cached, the cache is flushed when the set of actors
+            # changes. A missing actor is not cached, it may be on its way from another shard.
+            if address[0] == '/':
+                key = address
+            else:
+                key = (relative_actor.address, address)
+            dst_actors = routes.get(key)
+            if dst_actors is None:
+                dst_actors = _resolve_address(address, relative_actor)
+                if dst_actors and None not in dst_actors:
+                    routes[key] = dst_actors
+            return dst_actors
+
+        def _resolve_address(address, relative_actor):
             names = address.split('/')
             if len(names) == 3:
-                if names[1] == 'Pool*':
+                grp_name = names[1]
+                if grp_name == 'Pool*':
+                    if shard.idx != 0:
+                        return [self._shards[0]]
                     return [
                         v[names[2]]
                         for k, v in actors.items()
                         if k.startswith('Pool')
                     ]
-                else:
-                    return [actors[names[1]].get(names[2])]
+                owner = self._shard_of_group(grp_name, assign=False)
+                if owner is None:
+                    # The last actor of this raster group died in another shard, the messages
+                    # still on their way to it are dropped. (A raster group is assigned when its
+                    # actors are instanciated, before any message is sent to them)
+                    return []
+                if owner is not shard:
+                    return [owner]
             elif len(names) == 1:
+                # A relative address always designates an actor of the same shard
                 grp_name = relative_actor.address.split('/')[1]
-                return [actors[grp_name].get(names[0])]
             else: # pragma: no cover
                 assert False
+            return [actors[grp_name].get(names[-1]) if grp_name in actors else None]
 
         def _unregister_actor(a):
             address = a.address
@@ -107,45 +219,69 @@ class BackDatasetSchedulerMixin(object):
             del actors[grp_name][name]
             if not actors[grp_name]:
                 del actors[grp_name]
+                self._forget_shard_of_group(grp_name)
             if hasattr(a, 'ext_receive_nothing'):
                 keep_alive_actors.remove(a)
+            routes.clear()
 
         # Dicts of actors
         actors = collections.defaultdict(dict) # type: Mapping[str, Mapping[str, Actor]]
 
+        # Cache of `_find_actors` results
+        routes = {} # type: Mapping[Union[str, Tuple[str, str]], List[Union[None, Actor, _SchedulerShard]]]
+
+        # Methods of actors, per class, per title prefix, per message title
+        dispatch_table_per_class = {} # type: Mapping[type, Mapping[str, Mapping[str, Callable]]]
+
+        # Timing the actors is costly, it is only performed if someone is listening
+        timed = self._debug_mngr.is_observed('message_passed')
+        watch_mailbox = self._debug_mngr.is_observed('mailbox_update')
+
         # List of actors that need to be kept alive with calls to `ext_receive_nothing`
         # `keep_alive_iterator` should never be iterated if `keep_alive_actors` is empty
         keep_alive_actors = []
         keep_alive_iterator = _cycle_list(keep_alive_actors)
 
-        # Stack of pending messages
-        piles_of_msgs = [] # type: List[Tuple[Actor, List[Union[Msg, Actor]]]]
-
-        # Instantiate and register the top level actor
-        top_level_actor = ActorTopLevel()
-        _register_actor(top_level_actor)
-        piles_of_msgs.append(
-            (top_level_actor, 'ext_receive_', top_level_actor.ext_receive_prime()),
-        )
+        # Stack of pending messages, a pile is consumed through an iterator. The source of a pile
+        # is the actor that sent those messages, the shard that posted them, or None if they come
+        # from outside of the scheduler.
+        piles_of_msgs = [] # type: List[Tuple[Union[None, Actor, _SchedulerShard], str, Iterator[Union[Msg, Actor]]]]
+
+        # Structures that track stale messages, they are updated incrementally and flushed each
+        # time all messages on flight have been processed.
+        # - The creation index of each pending `AgingMsg`, it grows with the creation order
+        # - The index of the last `AgingMsg` processed for each method call
+        idx_per_msg = {} # type: Mapping[AgingMsg, int]
+        msgidx_of_prev_methodcall = {} # type: Mapping[Tuple[Actor, Callable, Tuple], int]
+        msg_counter = itertools.count()
+
+        def _index_aging_msgs(msgs):
+            for msg in msgs:
+                if isinstance(msg, AgingMsg):
+                    idx_per_msg[msg] = next(msg_counter)
+
+        if shard.idx == 0:
+            # Instantiate and register the top level actor
+            top_level_actor = ActorTopLevel(shard.wakeup_event, self._debug_mngr)
+            _register_actor(top_level_actor)
+            msgs = top_level_actor.ext_receive_prime()
+            _index_aging_msgs(msgs)
+            piles_of_msgs.append(
+                (top_level_actor, 'ext_receive_', iter(msgs)),
+            )
 
         while True:
-            # Step 0: Init stuctures that track stale messages
-            idx_per_msg = {}
-            msgidx_of_prev_methodcall = {}
-            for _, _, msgs in piles_of_msgs:
-                for msg in msgs:
-                    if isinstance(msg, AgingMsg):
-                        idx_per_msg[msg] = len(idx_per_msg)
-
             # Step 1: Process all messages on flight
             while piles_of_msgs:
                 src_actor, title_prefix, msgs = piles_of_msgs[-1]
-                if not msgs:
+                msg = next(msgs, None)
+                if msg is None:
                     del piles_of_msgs[-1]
                     continue
-                msg = msgs.pop(0)
                 if isinstance(msg, Msg):
                     is_aging = isinstance(msg, AgingMsg)
+                    if is_aging:
+                        msg_idx = idx_per_msg.pop(msg)
                     if VERBOSE:
                         print('{} {}'.format(
                             ' '.join(['|'] * (len(piles_of_msgs))),
@@ -154,28 +290,43 @@ class BackDatasetSchedulerMixin(object):
 
                     for dst_actor in _find_actors(msg.address, src_actor):
                         if dst_actor is None:
-                            # This message may be discadted if DroppableMsg
-                            assert isinstance(msg, DroppableMsg), '\ndst_actor: {}\n      msg: {}\n'.format(dst_actor, msg)
+                            if isinstance(msg, BouncingMsg):
+                                # The content of this message should not be lost
+                                piles_of_msgs.append((
+                                    src_actor, title_prefix, iter([msg.bounce_msg])
+                                ))
+                                continue
+                            # This message may be discadted if DroppableMsg, or if it was posted
+                            # by another shard. (The order of the messages is not guaranteed
+                            # between two shards)
+                            assert (
+                                isinstance(msg, DroppableMsg) or
+                                (src_actor.__class__ is _SchedulerShard and src_actor is not shard)
+                            ), '\ndst_actor: {}\n      msg: {}\n'.format(dst_actor, msg)
+                        elif dst_actor.__class__ is _SchedulerShard:
+                            # This message should be processed by another shard
+                            dst_actor.post(title_prefix, msg, shard)
                         else:
-                            a = datetime.datetime.now()
-                            met = getattr(dst_actor, title_prefix + msg.title)
+                            if timed:
+                                a = time.perf_counter()
+                            met = dispatch_table_per_class[dst_actor.__class__][title_prefix][msg.title]
 
                             # Check if stale message
                             if is_aging:
-                                msg_idx = idx_per_msg[msg]
-                                if (met, msg.id_args) in msgidx_of_prev_methodcall:
-                                    prev_msg_idx = msgidx_of_prev_methodcall[(met, msg.id_args)]
+                                key = (dst_actor, met, msg.id_args)
+                                if key in msgidx_of_prev_methodcall:
+                                    prev_msg_idx = msgidx_of_prev_methodcall[key]
                                     if prev_msg_idx > msg_idx:
                                         if VERBOSE:
                                             print('    Skipping stale message')
                                         continue
-                                msgidx_of_prev_methodcall[(met, msg.id_args)] = msg_idx
+                                msgidx_of_prev_methodcall[key] = msg_idx
 
                             # Dispatch message and retrieve new ones
-                            new_msgs = met(*msg.args)
-                            b = datetime.datetime.now()
-                            delta = (b - a).total_seconds()
-                            self._debug_mngr.event('message_passed', dst_actor.__class__.__name__, msg.title, delta)
+                            new_msgs = met(dst_actor, *msg.args)
+                            if timed:
+                                delta = time.perf_counter() - a
+                                self._debug_mngr.event('message_passed', dst_actor.__class__.__name__, msg.title, delta)
                             if self._stop:
                                 # Dataset is closing. This is the same as `step 5`. (optimisation purposes)
                                 return
@@ -186,11 +337,11 @@ class BackDatasetSchedulerMixin(object):
                                 # Update stale messages index
                                 for new_msg in new_msgs:
                                     if isinstance(new_msg, AgingMsg):
-                                        idx_per_msg[new_msg] = len(idx_per_msg)
+                                        idx_per_msg[new_msg] = next(msg_counter)
 
                                 # Message need to be sent
                                 piles_of_msgs.append((
-                                    dst_actor, 'receive_', new_msgs
+                                    dst_actor, 'receive_', iter(new_msgs)
                                 ))
                 else:
                     _register_actor(msg)
@@ -200,16 +351,38 @@ class BackDatasetSchedulerMixin(object):
             msg = None
             dst_actor = None
             new_msgs = None
-
-            # Step 2: Receive external messages
-            # a list is thread-safe: https://stackoverflow.com/a/6319267/4952173
-            if self._ext_message_to_scheduler_queue:
-                msg = self._ext_message_to_scheduler_queue.pop(0)
-                dst_actor, = _find_actors(msg.address, None)
-                piles_of_msgs.append((
-                    dst_actor, 'ext_receive_', [msg]
-                ))
-                msg = None
+            new_msg = None
+            idx_per_msg.clear()
+            msgidx_of_prev_methodcall.clear()
+
+            # Step 2: Receive messages from outside of this shard
+            # The wakeup event is cleared before probing the sources of work (steps 2 and 3), this
+            # way a signal emitted after those probes will prevent the sleep of step 4.
+            shard.wakeup_event.clear()
+
+            # All the messages already in the mailbox are received at once, and processed in
+            # order. Consecutive messages sharing the same title prefix and source share a pile.
+            mailbox_size = len(shard.mailbox)
+            if mailbox_size:
+                if watch_mailbox:
+                    self._debug_mngr.event('mailbox_update', shard.idx, mailbox_size)
+                batch = [shard.mailbox.popleft() for _ in range(mailbox_size)]
+                groups = [
+                    (title_prefix, src_shard, [msg for _, msg, _ in group])
+                    for (title_prefix, src_shard), group in itertools.groupby(
+                        batch, operator.itemgetter(0, 2)
+                    )
+                ]
+                for _, _, msgs in groups:
+                    _index_aging_msgs(msgs)
+                for title_prefix, src_shard, msgs in reversed(groups):
+                    piles_of_msgs.append((
+                        src_shard, title_prefix, iter(msgs)
+                    ))
+                src_shard = None
+                batch = None
+                groups = None
+                msgs = None
 
             # Step 3: If no messages from phase 2 and some `keep_alive_actors`
             #   Find "keep alive" actors that need to be closed
@@ -219,11 +392,12 @@ class BackDatasetSchedulerMixin(object):
                 for actor, _ in zip(keep_alive_iterator, range(len(keep_alive_actors))):
                     # Iter at most once on each "keep alive" actor
 
-                    a = datetime.datetime.now()
+                    if timed:
+                        a = time.perf_counter()
                     new_msgs = actor.ext_receive_nothing()
-                    b = datetime.datetime.now()
-                    delta = (b - a).total_seconds()
-                    self._debug_mngr.event('message_passed', actor.__class__.__name__, 'nothing', delta)
+                    if timed:
+                        delta = time.perf_counter() - a
+                        self._debug_mngr.event('message_passed', actor.__class__.__name__, 'nothing', delta)
 
                     if self._stop:
                         # Dataset is closing. This is the same as `step 5`. (optimisation purposes)
@@ -236,8 +410,9 @@ class BackDatasetSchedulerMixin(object):
                         if VERBOSE:
                             print(Msg(actor.address, 'receive_nothing'))
 
+                        _index_aging_msgs(new_msgs)
                         piles_of_msgs.append((
-                            actor, 'receive_', new_msgs
+                            actor, 'receive_', iter(new_msgs)
                         ))
                         break
                 for actor in actors_to_remove:
@@ -247,16 +422,46 @@ class BackDatasetSchedulerMixin(object):
                 actor = None
 
             # Step 4: If no messages from phase 2 nor from phase 3
-            #   Sleep
+            #   Sleep until something happens
             if not piles_of_msgs:
                 self._debug_mngr.event('scheduler_activity_update', False)
-                time.sleep(1 / 20) # TODO: Set a better sleep time / make it parameterizable
+                shard.wakeup_event.wait(MAX_IDLE_SLEEP)
                 self._debug_mngr.event('scheduler_activity_update', True)
 
             # Step 5: Check if Dataset was collected
             if self._stop:
                 return
 
+class _SchedulerShard(object):
+    """One of the threads of a Dataset's scheduler, as seen by the other threads"""
+
+    def __init__(self, idx):
+        self.idx = idx
+
+        # Queue of `(title_prefix, msg, src_shard)` to be processed by this shard. `title_prefix` is
+        # None when `msg` is an actor to register. `src_shard` is the shard that posted `msg`, or
+        # None if it comes from outside of the scheduler. A deque is thread-safe for `append` and
+        # `popleft`.
+        self.mailbox = collections.deque()
+
+        # Set when this shard may have some work to do
+        self.wakeup_event = threading.Event()
+
+    def post(self, title_prefix, msg, src_shard):
+        self.mailbox.append((title_prefix, msg, src_shard))
+        self.wakeup_event.set()
+
+def _build_dispatch_table(cls):
+    """Map the title prefixes and the message titles to the unbound methods of an actor class"""
+    table = {'receive_': {}, 'ext_receive_': {}}
+    for attr in dir(cls):
+        for prefix, d in table.items():
+            if attr.startswith(prefix):
+                met = getattr(cls, attr)
+                if callable(met):
+                    d[attr[len(prefix):]] = met
+    return table
+
 def _cycle_list(l):
     """Loop in a list forever, even if its size changes. Error if empty."""
     i = -1
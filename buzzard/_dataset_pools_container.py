@@ -3,6 +3,11 @@ import collections
 import multiprocessing as mp
 import multiprocessing.pool
 
+from buzzard._actors.pool_adapter import is_pool, pool_adapter
+
+# Default `max_batch_size` of the process pools, see `PoolsContainer.set_batching`
+DEFAULT_PROCESS_POOL_BATCH_SIZE = 8
+
 class PoolsContainer(object):
     """Manages thread/process pools and aliases for a Dataset"""
 
@@ -10,6 +15,8 @@ class PoolsContainer(object):
         self._aliases_per_pool = collections.defaultdict(set)
         self._aliases = {}
         self._managed_pools = set()
+        self._token_bounds = {}
+        self._batching = {}
         self._lock = threading.Lock()
 
     def alias(self, key, pool_or_none):
@@ -20,7 +27,9 @@ class PoolsContainer(object):
         ----------
         key: hashable (like a string)
             ..
-        pool_or_none: multiprocessing.pool.Pool or multiprocessing.pool.ThreadPool or None
+        pool_or_none: multiprocessing.pool.Pool or multiprocessing.pool.ThreadPool or
+                      concurrent.futures.ThreadPoolExecutor or
+                      concurrent.futures.ProcessPoolExecutor or None
             ..
         """
         with self._lock:
@@ -36,15 +45,77 @@ class PoolsContainer(object):
 
         Parameters
         ----------
-        pool: multiprocessing.pool.Pool or multiprocessing.pool.ThreadPool
+        pool: multiprocessing.pool.Pool or multiprocessing.pool.ThreadPool or
+              concurrent.futures.ThreadPoolExecutor or concurrent.futures.ProcessPoolExecutor
             ..
 
         """
-        if not isinstance(pool, (mp.pool.Pool, mp.pool.ThreadPool)): # pragma: no cover
+        if not is_pool(pool): # pragma: no cover
             raise TypeError('Can only manage pools')
         with self._lock:
             self._managed_pools.add(pool)
 
+    def set_token_bounds(self, pool_or_key, min_tokens=None, max_tokens=None):
+        """Set the bounds of the number of jobs that the scheduler sends to a pool at the same
+        time. That number is tuned by the scheduler from the response times of the jobs: it grows
+        until a few jobs wait for a worker inside the pool, and it shrinks when the response time
+        grows with the number of jobs (e.g. a saturated file system).
+
+        By default a pool of `n` workers starts with `n + 2` tokens and is bounded by `1` and
+        `2 * n + 2`. Pass the same value to both bounds for a fixed number of tokens.
+
+        Parameters
+        ----------
+        pool_or_key: pool or hashable
+            A pool or a key registered with `alias`
+        min_tokens: None or int >= 1
+            None for the default
+        max_tokens: None or int >= 1
+            None for the default
+        """
+        pool = self._pool_of_pool_or_key(pool_or_key)
+        for name, v in [('min_tokens', min_tokens), ('max_tokens', max_tokens)]:
+            if v is not None and (int(v) != v or v < 1): # pragma: no cover
+                raise ValueError('`{}` should be None or an integer of at least 1'.format(name))
+        if min_tokens is not None and max_tokens is not None and min_tokens > max_tokens: # pragma: no cover
+            raise ValueError('`min_tokens` should not be greater than `max_tokens`')
+        with self._lock:
+            self._token_bounds[pool] = (
+                None if min_tokens is None else int(min_tokens),
+                None if max_tokens is None else int(max_tokens),
+            )
+
+    def set_batching(self, pool_or_key, max_batch_size=None, latency_budget=None):
+        """Set how the small jobs of the async rasters (reading a cache tile, checking a cache
+        file, resampling) are packed in tasks sent to a pool.
+
+        The jobs that can start right away on a free worker are sent alone, the others are packed
+        by kind in tasks of up to `max_batch_size` jobs. This saves the per-task overhead of the
+        process pools (pickling and inter-process communications).
+
+        By default the process pools pack up to 8 jobs per task and the thread pools don't pack.
+
+        Parameters
+        ----------
+        pool_or_key: pool or hashable
+            A pool or a key registered with `alias`
+        max_batch_size: None or int >= 1
+            None for the default, 1 to disable the batching
+        latency_budget: None or float >= 0
+            Time in seconds that a job may be held back to fill a batch while no worker is free.
+            None for the default of `0`.
+        """
+        pool = self._pool_of_pool_or_key(pool_or_key)
+        if max_batch_size is not None and (int(max_batch_size) != max_batch_size or max_batch_size < 1): # pragma: no cover
+            raise ValueError('`max_batch_size` should be None or an integer of at least 1')
+        if latency_budget is not None and not latency_budget >= 0: # pragma: no cover
+            raise ValueError('`latency_budget` should be None or a positive number')
+        with self._lock:
+            self._batching[pool] = (
+                None if max_batch_size is None else int(max_batch_size),
+                None if latency_budget is None else float(latency_budget),
+            )
+
     def __len__(self):
         """Number of pools registered in this Dataset"""
         with self._lock:
@@ -70,22 +141,44 @@ class PoolsContainer(object):
             return obj in self._aliases or obj in self._aliases_per_pool
 
     # Private interface with Dataset ********************************************************* **
-    def _close(self):
-        things_to_join = []
-        for pool in self._managed_pools:
-            if isinstance(pool, mp.pool.ThreadPool):
-                pool.terminate()
-                things_to_join.append(pool)
+    def _token_bounds_of(self, pool):
+        """Called from the scheduler"""
+        return self._token_bounds.get(pool, (None, None))
+
+    def _batching_of(self, pool):
+        """Called from the scheduler"""
+        max_batch_size, latency_budget = self._batching.get(pool, (None, None))
+        if max_batch_size is None:
+            if pool_adapter(pool).same_address_space:
+                max_batch_size = 1
             else:
-                things_to_join.append(_create_process_pool_killer(pool))
+                max_batch_size = DEFAULT_PROCESS_POOL_BATCH_SIZE
+        if latency_budget is None:
+            latency_budget = 0.
+        return max_batch_size, latency_budget
+
+    def _pool_of_pool_or_key(self, pool_or_key):
+        if is_pool(pool_or_key):
+            return pool_or_key
+        if is_pool(self._aliases.get(pool_or_key)):
+            return self._aliases[pool_or_key]
+        raise TypeError('`pool_or_key` should be a pool or the key of a pool') # pragma: no cover
+
+    def _close(self):
+        things_to_join = [
+            pool_adapter(pool).terminate()
+            for pool in self._managed_pools
+        ]
         for joinable in things_to_join:
             joinable.join()
         self._aliases.clear()
         self._aliases_per_pool.clear()
         self._managed_pools.clear()
+        self._token_bounds.clear()
+        self._batching.clear()
 
     def _normalize_pool_parameter(self, pool_param, param_name):
-        if isinstance(pool_param, (mp.pool.Pool, mp.pool.ThreadPool)):
+        if is_pool(pool_param):
             return pool_param
         if pool_param is None:
             return None
@@ -93,6 +186,8 @@ class PoolsContainer(object):
             types = [
                 'multiprocessing.pool.Pool',
                 'multiprocessing.pool.ThreadPool',
+                'concurrent.futures.ThreadPoolExecutor',
+                'concurrent.futures.ProcessPoolExecutor',
                 'None', 'hashable',
             ]
             raise TypeError('`{}` parameter should be one of {}'.format(
@@ -105,15 +200,3 @@ class PoolsContainer(object):
                 self._aliases_per_pool[p] = [pool_param]
                 self._managed_pools.add(p)
         return self._aliases[pool_param]
-
-def _create_process_pool_killer(pp):
-    """
-    https://stackoverflow.com/questions/42782953/python-concurrent-futures-how-to-make-it-cancelable/45515052#45515052
-    """
-    def kill_process_pool_from_thread():
-        pp.close()
-        pp.terminate()
-        pp.join()
-    t = threading.Thread(target=kill_process_pool_from_thread)
-    t.start()
-    return t
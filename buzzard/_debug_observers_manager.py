@@ -11,14 +11,21 @@ class DebugObserversManager(object):
         for method in self._to_call_per_ename[ename]:
             method(*args)
 
+    def is_observed(self, ename):
+        """Is there at least one observer for that event. Useful to skip the preparation of costly
+        event parameters."""
+        return len(self._to_call_per_ename[ename]) > 0
+
 class _ToCallPerEventName(dict):
     def __init__(self, debug_observers):
         self._obs = debug_observers
 
     def __missing__(self, ename):
         method_name = 'on_{}'.format(ename)
-        return [
+        methods = [
             getattr(o, method_name)
             for o in self._obs
             if hasattr(o, method_name)
         ]
+        self[ename] = methods
+        return methods
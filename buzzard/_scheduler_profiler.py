@@ -0,0 +1,144 @@
+import collections
+import threading
+import math
+
+# Latency histograms have log2 buckets, the first bucket is for durations below 1 microsecond and
+# the last one for durations of more than ~1 hour.
+HISTOGRAM_BUCKET_COUNT = 33
+HISTOGRAM_BASE_DURATION = 1e-6
+
+class SchedulerProfiler(object):
+    """Debug observer that aggregates the events of a Dataset's scheduler.
+
+    It is instantiated by the Dataset when `scheduler_profiling=True`, see `Dataset.scheduler_stats`.
+
+    Observed events
+    ---------------
+    - `message_passed`: Time spent in each actor's method, per actor class and per message title.
+    - `mailbox_update`: Number of messages waiting in the mailbox of a scheduler's shard. The first
+      shard's mailbox receives all the messages sent from outside of the scheduler.
+    - `pool_tokens_update`: Occupancy of a pool, tokens in use and jobs waiting for a token.
+
+    The callbacks may be called from several threads at once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._per_actor = collections.defaultdict(_LatencyStats)
+        self._per_message = collections.defaultdict(_LatencyStats)
+        self._per_mailbox = collections.defaultdict(_GaugeStats)
+        self._tokens_per_pool = collections.defaultdict(_GaugeStats)
+        self._jobs_per_pool = collections.defaultdict(_GaugeStats)
+        self._token_count_per_pool = collections.defaultdict(_GaugeStats)
+
+    # Observer's callbacks ********************************************************************** **
+    def on_message_passed(self, actor_class, title, delta):
+        bucket = _bucket_of_duration(delta)
+        with self._lock:
+            self._per_actor[actor_class].update(delta, bucket)
+            self._per_message[(actor_class, title)].update(delta, bucket)
+
+    def on_mailbox_update(self, shard_idx, depth):
+        with self._lock:
+            self._per_mailbox[shard_idx].update(depth)
+
+    def on_pool_tokens_update(self, pool_id, used_token_count, token_count, waiting_job_count):
+        with self._lock:
+            self._token_count_per_pool[pool_id].update(token_count)
+            self._tokens_per_pool[pool_id].update(used_token_count)
+            self._jobs_per_pool[pool_id].update(waiting_job_count)
+
+    # Snapshot ********************************************************************************** **
+    def snapshot(self):
+        """Copy the current statistics in a dict of builtin types
+
+        Returns
+        -------
+        dict with the following keys
+            'actors': dict of str to dict
+                Per actor class name: 'count', 'total_time', 'max_time' and 'histogram'.
+                'histogram' maps the (exclusive) upper bound of a latency bucket, in seconds, to a
+                count.
+            'messages': dict of (str, str) to dict
+                Same as 'actors' but per (actor class name, message title). The `ext_receive_nothing`
+                calls are reported with the 'nothing' title.
+            'mailboxes': dict of int to dict
+                Per scheduler shard index: 'depth' and 'max_depth'
+            'pools': dict of int to dict
+                Per `id(pool)`: 'token_count', 'max_token_count', 'used_tokens',
+                'max_used_tokens', 'waiting_jobs' and 'max_waiting_jobs'
+        """
+        with self._lock:
+            return {
+                'actors': {
+                    k: v.to_dict()
+                    for k, v in self._per_actor.items()
+                },
+                'messages': {
+                    k: v.to_dict()
+                    for k, v in self._per_message.items()
+                },
+                'mailboxes': {
+                    k: dict(depth=v.value, max_depth=v.max_value)
+                    for k, v in self._per_mailbox.items()
+                },
+                'pools': {
+                    k: dict(
+                        token_count=self._token_count_per_pool[k].value,
+                        max_token_count=self._token_count_per_pool[k].max_value,
+                        used_tokens=v.value,
+                        max_used_tokens=v.max_value,
+                        waiting_jobs=self._jobs_per_pool[k].value,
+                        max_waiting_jobs=self._jobs_per_pool[k].max_value,
+                    )
+                    for k, v in self._tokens_per_pool.items()
+                },
+            }
+
+class _LatencyStats(object):
+    __slots__ = ['count', 'total_time', 'max_time', 'histogram']
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.
+        self.max_time = 0.
+        self.histogram = [0] * HISTOGRAM_BUCKET_COUNT
+
+    def update(self, delta, bucket):
+        self.count += 1
+        self.total_time += delta
+        if delta > self.max_time:
+            self.max_time = delta
+        self.histogram[bucket] += 1
+
+    def to_dict(self):
+        return dict(
+            count=self.count,
+            total_time=self.total_time,
+            max_time=self.max_time,
+            histogram={
+                HISTOGRAM_BASE_DURATION * 2 ** i: count
+                for i, count in enumerate(self.histogram)
+                if count
+            },
+        )
+
+class _GaugeStats(object):
+    __slots__ = ['value', 'max_value']
+
+    def __init__(self):
+        self.value = 0
+        self.max_value = 0
+
+    def update(self, value):
+        self.value = value
+        if value > self.max_value:
+            self.max_value = value
+
+def _bucket_of_duration(delta):
+    """Index of the histogram bucket of `delta`. Bucket `i` holds the durations strictly lower
+    than `HISTOGRAM_BASE_DURATION * 2 ** i`, and greater than those of bucket `i - 1`."""
+    if delta < HISTOGRAM_BASE_DURATION:
+        return 0
+    _, exponent = math.frexp(delta / HISTOGRAM_BASE_DURATION)
+    return min(exponent, HISTOGRAM_BUCKET_COUNT - 1)
@@ -0,0 +1,187 @@
+import collections
+import sys
+import threading
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError: # pragma: no cover
+    # python < 3.8
+    shared_memory = None
+
+# Maximum number of bytes kept in the free blocks of an arena, the blocks that do not fit are
+# destroyed when given back.
+MAX_FREE_BYTES = 256 * 1024 ** 2
+
+# Maximum number of blocks kept attached in a process that uses the blocks of an arena
+MAX_ATTACHED_BLOCKS = 64
+
+class SharedMemoryArena(object):
+    """Blocks of shared memory lent to the jobs running on process pools.
+
+    A job that produces an array on a process pool receives a `SharedArray` allocated in the
+    scheduler's process, it writes the array there and returns nothing. The scheduler then copies
+    the array to its destination and gives the block back to the arena. This replaces the pickling
+    of the array, its transfer through the result pipe of the pool and its unpickling.
+
+    Blocks are reused, their size is rounded up to a size class.
+
+    The methods may be called from several threads at once.
+    """
+
+    available = shared_memory is not None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._free_blocks_per_size = collections.defaultdict(list)
+        self._free_bytes = 0
+        self._lent_blocks = {}
+        self._closed = False
+
+    def lend(self, shape, dtype):
+        """Lend a block large enough to store an array
+
+        Parameters
+        ----------
+        shape: sequence of int
+        dtype: np.dtype
+
+        Returns
+        -------
+        SharedArray
+        """
+        shape = tuple(int(v) for v in shape)
+        dtype = np.dtype(dtype)
+        size = _size_class_of_nbytes(int(np.prod(shape)) * dtype.itemsize)
+        with self._lock:
+            if self._closed: # pragma: no cover
+                raise RuntimeError('The shared memory arena is closed')
+            free_blocks = self._free_blocks_per_size[size]
+            if free_blocks:
+                shm = free_blocks.pop()
+                self._free_bytes -= size
+            else:
+                shm = None
+        if shm is None:
+            shm = shared_memory.SharedMemory(create=True, size=size)
+        with self._lock:
+            self._lent_blocks[shm.name] = (shm, size)
+        return SharedArray(shm.name, shape, dtype)
+
+    def take_back(self, shared_array, out=None):
+        """Copy the array of a lent block and take the block back
+
+        Parameters
+        ----------
+        shared_array: SharedArray
+        out: None or np.ndarray
+            Where to copy the array, a new array is allocated if None
+
+        Returns
+        -------
+        np.ndarray
+        """
+        with self._lock:
+            shm, _ = self._lent_blocks[shared_array.name]
+        src = np.ndarray(shared_array.shape, shared_array.dtype, buffer=shm.buf)
+        if out is None:
+            out = src.copy()
+        else:
+            out[...] = src
+        del src
+        self.release(shared_array)
+        return out
+
+    def release(self, shared_array):
+        """Take back a lent block without reading it"""
+        with self._lock:
+            shm, size = self._lent_blocks.pop(shared_array.name)
+            closed = self._closed
+            if not closed and self._free_bytes + size <= MAX_FREE_BYTES:
+                self._free_blocks_per_size[size].append(shm)
+                self._free_bytes += size
+                return
+        if closed:
+            # Already unlinked by `close`
+            shm.close()
+        else:
+            _destroy_block(shm)
+
+    def close(self):
+        """Destroy the blocks. The lent blocks are unlinked but stay mapped until they are given
+        back, a job may still be writing to them."""
+        with self._lock:
+            self._closed = True
+            free_blocks = [
+                shm
+                for blocks in self._free_blocks_per_size.values()
+                for shm in blocks
+            ]
+            lent_blocks = [shm for shm, _ in self._lent_blocks.values()]
+            self._free_blocks_per_size.clear()
+            self._free_bytes = 0
+        for shm in free_blocks:
+            _destroy_block(shm)
+        for shm in lent_blocks:
+            shm.unlink()
+
+class SharedArray(object):
+    """Picklable reference to an array stored in a block lent by a `SharedMemoryArena`"""
+
+    __slots__ = ['name', 'shape', 'dtype']
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+
+    def attach(self):
+        """Get the array from a process that is not the one of the arena (i.e. a pool's worker)
+
+        Returns
+        -------
+        np.ndarray
+        """
+        shm = _attach_block(self.name)
+        return np.ndarray(self.shape, self.dtype, buffer=shm.buf)
+
+def _size_class_of_nbytes(nbytes):
+    """Round up `nbytes` to a multiple of 1/8 of its power of two, or to a page"""
+    if nbytes <= 4096:
+        return 4096
+    step = max(1 << (nbytes.bit_length() - 4), 4096)
+    return -(-nbytes // step) * step
+
+def _destroy_block(shm):
+    shm.close()
+    shm.unlink()
+
+# The blocks attached in this process, from the least recently used
+_attached_blocks = collections.OrderedDict()
+_attached_blocks_lock = threading.Lock()
+
+def _attach_block(name):
+    with _attached_blocks_lock:
+        shm = _attached_blocks.pop(name, None)
+        if shm is None:
+            while len(_attached_blocks) >= MAX_ATTACHED_BLOCKS:
+                _, old_shm = _attached_blocks.popitem(last=False)
+                old_shm.close()
+            shm = _open_block_untracked(name)
+        _attached_blocks[name] = shm
+    return shm
+
+def _open_block_untracked(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+
+    # Before python 3.13, opening a block registers it to the resource tracker of the current
+    # process, that would destroy the block when the process exits.
+    # https://github.com/python/cpython/issues/82300
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name)
+    finally:
+        resource_tracker.register = register
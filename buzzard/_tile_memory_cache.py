@@ -0,0 +1,98 @@
+import collections
+import threading
+
+class TileMemoryCache(object):
+    """In-RAM tier in front of the cache files of the cached raster recipes of a Dataset.
+
+    It maps `(raster uid, cache_fp)` to the full array of a cache tile, of shape (Y, X, C). It is
+    filled by the `Writer` and `Reader` actors, and looked up by the `CacheExtractor` actor
+    before reading a cache file from an io pool. The least recently used tiles are evicted to
+    stay below `max_bytes`.
+
+    The methods may be called from several scheduler threads at once.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Parameters
+        ----------
+        max_bytes: int
+            Byte budget of the arrays, `0` to disable the tier
+        """
+        self.max_bytes = max_bytes
+        self._arrays = collections.OrderedDict() # LRU first
+        self._keys_of_raster = collections.defaultdict(set)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def accepts(self, nbytes):
+        """Whether a tile of `nbytes` bytes can fit in the tier"""
+        return 0 < nbytes <= self.max_bytes
+
+    def get(self, raster_uid, cache_fp):
+        """Get the array of a cache tile, or None"""
+        if not self.enabled:
+            return None
+        key = (raster_uid, cache_fp)
+        with self._lock:
+            arr = self._arrays.get(key)
+            if arr is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+                self._arrays.move_to_end(key)
+            return arr
+
+    def put(self, raster_uid, cache_fp, arr):
+        """Insert the array of a cache tile, it should not be modified afterward"""
+        if not self.accepts(arr.nbytes):
+            return
+        key = (raster_uid, cache_fp)
+        with self._lock:
+            self._discard(key)
+            self._arrays[key] = arr
+            self._keys_of_raster[raster_uid].add(key)
+            self._bytes += arr.nbytes
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._arrays)))
+                self._evictions += 1
+
+    def discard(self, raster_uid, cache_fp):
+        """Forget a cache tile, if present"""
+        with self._lock:
+            self._discard((raster_uid, cache_fp))
+
+    def discard_raster(self, raster_uid):
+        """Forget all the cache tiles of a raster"""
+        with self._lock:
+            for key in list(self._keys_of_raster.get(raster_uid, ())):
+                self._discard(key)
+
+    def stats(self):
+        """Snapshot of the counters, see `Dataset.tile_memory_cache_stats`"""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'tile_count': len(self._arrays),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _discard(self, key):
+        arr = self._arrays.pop(key, None)
+        if arr is None:
+            return
+        self._bytes -= arr.nbytes
+        keys = self._keys_of_raster[key[0]]
+        keys.remove(key)
+        if not keys:
+            del self._keys_of_raster[key[0]]
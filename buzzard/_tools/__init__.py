@@ -6,4 +6,5 @@ from .parameters import *
 from .helper_classes import *
 from .rect import *
 from .multi_ordered_dict import *
+from .indexed_heap import *
 from .slices_of_matrix import *
@@ -0,0 +1,111 @@
+import itertools
+
+class IndexedHeap(object):
+    """Binary min-heap of unique hashable items with priorities, that knows the position of each
+    item. Changing the priority of an item or removing an item anywhere in the heap is O(log n).
+
+    Items with equal priorities are popped in the order of insertion.
+    """
+
+    def __init__(self):
+        self._entries = [] # List of (priority, sequence number, item)
+        self._index_of_item = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, item):
+        return item in self._index_of_item
+
+    def __iter__(self):
+        """Iterate over the items in an arbitrary order"""
+        return iter(self._index_of_item)
+
+    def clear(self):
+        self._entries.clear()
+        self._index_of_item.clear()
+
+    def prio_of(self, item):
+        return self._entries[self._index_of_item[item]][0]
+
+    def push(self, item, prio):
+        if item in self._index_of_item: # pragma: no cover
+            raise KeyError('{} already in IndexedHeap'.format(item))
+        i = len(self._entries)
+        self._entries.append((prio, next(self._counter), item))
+        self._index_of_item[item] = i
+        self._sift_up(i)
+
+    def update(self, item, prio):
+        """Change the priority of an item, it keeps its rank among items of equal priority"""
+        i = self._index_of_item[item]
+        old_prio, seq, _ = self._entries[i]
+        self._entries[i] = (prio, seq, item)
+        if prio < old_prio:
+            self._sift_up(i)
+        elif old_prio < prio:
+            self._sift_down(i)
+
+    def peek(self):
+        """Return the item with the lowest priority"""
+        return self._entries[0][2]
+
+    def pop(self):
+        """Remove and return the item with the lowest priority"""
+        item = self._entries[0][2]
+        self.remove(item)
+        return item
+
+    def remove(self, item):
+        i = self._index_of_item.pop(item)
+        last = self._entries.pop()
+        if i == len(self._entries):
+            return
+        self._entries[i] = last
+        self._index_of_item[last[2]] = i
+        if i > 0 and last[:2] < self._entries[(i - 1) >> 1][:2]:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def _sift_up(self, i):
+        entries = self._entries
+        index_of_item = self._index_of_item
+        entry = entries[i]
+        key = entry[:2]
+        while i > 0:
+            parent_i = (i - 1) >> 1
+            parent = entries[parent_i]
+            if not key < parent[:2]:
+                break
+            entries[i] = parent
+            index_of_item[parent[2]] = i
+            i = parent_i
+        entries[i] = entry
+        index_of_item[entry[2]] = i
+
+    def _sift_down(self, i):
+        entries = self._entries
+        index_of_item = self._index_of_item
+        count = len(entries)
+        entry = entries[i]
+        key = entry[:2]
+        while True:
+            child_i = 2 * i + 1
+            if child_i >= count:
+                break
+            child_key = entries[child_i][:2]
+            right_i = child_i + 1
+            if right_i < count:
+                right_key = entries[right_i][:2]
+                if right_key < child_key:
+                    child_i, child_key = right_i, right_key
+            if not child_key < key:
+                break
+            child = entries[child_i]
+            entries[i] = child
+            index_of_item[child[2]] = i
+            i = child_i
+        entries[i] = entry
+        index_of_item[entry[2]] = i
@@ -0,0 +1,80 @@
+"""Activation pool of the driver objects opened by the jobs running on the workers of a process pool
+
+The driver objects of the `Dataset`'s activation pool can't be shared with other processes, a job
+running on a process pool used to open the cache file it works on, and close it at the end. This
+module keeps the last driver objects opened in the current process, from one job to the next.
+
+A driver object is reused only if its file did not change on disk since it was opened (same
+inode, size and modification time), a cache file removed or rewritten by any process is then
+reopened. All the driver objects of a Dataset are dropped when one of its async rasters is closed,
+the jobs carry the `activation_key` of their Dataset, that changes on each closing.
+"""
+
+import collections
+import contextlib
+import os
+import threading
+
+# Maximum number of idle driver objects kept in a process
+MAX_IDLE = 16
+
+# The idle driver objects of this process, from the least recently used
+# path -> (dataset key, file signature, driver object)
+_idle = collections.OrderedDict()
+
+# dataset key -> latest generation seen in this process
+_generation_of_dataset = {}
+
+_lock = threading.Lock()
+
+def acquire_driver_object(path, allocator, activation_key):
+    """Return a context manager to acquire a driver object of the file at `path`
+
+    Parameters
+    ----------
+    path: str
+    allocator: callable
+        Function that opens a new driver object
+    activation_key: (str, int)
+        The `workers_activation_key` of the Dataset of the job
+    """
+    @contextlib.contextmanager
+    def _acquire():
+        ds_key, generation = activation_key
+        signature = _signature_of_file(path)
+        with _lock:
+            if generation > _generation_of_dataset.get(ds_key, -1):
+                # An async raster of that Dataset was closed
+                _generation_of_dataset[ds_key] = generation
+                for k in [k for k, v in _idle.items() if v[0] == ds_key]:
+                    del _idle[k]
+            item = _idle.pop(path, None)
+
+        if item is None or item[1] != signature or signature is None:
+            del item
+            obj = allocator()
+        else:
+            obj = item[2]
+            del item
+
+        yield obj
+
+        with _lock:
+            if path not in _idle:
+                while len(_idle) >= MAX_IDLE:
+                    _idle.popitem(last=False)
+                _idle[path] = (ds_key, signature, obj)
+
+    return _acquire()
+
+def deactivate(path):
+    """Drop the idle driver object of `path` in this process"""
+    with _lock:
+        _idle.pop(path, None)
+
+def _signature_of_file(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
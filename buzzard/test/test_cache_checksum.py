@@ -0,0 +1,62 @@
+"""Tests for the checksums of the cache files"""
+
+# pylint: disable=redefined-outer-name
+
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from buzzard._cache_checksum import (
+    CHECKSUM_ALGORITHMS, checksum_hasher, checksum_of_bytes, checksum_of_file, HashingStream,
+    xxhash,
+)
+
+def _legacy_sum64(data):
+    """The checksum of the first cache files, the whole file summed at once"""
+    tail_size = len(data) % 8
+    if tail_size:
+        data = data + b'\0' * (8 - tail_size)
+    acc = np.add.reduce(np.frombuffer(data, 'uint64'), dtype='uint64')
+    return '{:016x}'.format(int(acc))
+
+@pytest.fixture(params=CHECKSUM_ALGORITHMS)
+def algorithm(request):
+    if request.param == 'xxh3' and xxhash is None:
+        pytest.skip('xxhash not installed')
+    return request.param
+
+@pytest.mark.parametrize('size', [0, 1, 7, 8, 9, 1000, 512 * 1024 + 3])
+def test_streaming(algorithm, size):
+    rng = np.random.RandomState(size)
+    data = rng.randint(0, 256, size, dtype='uint8').tobytes()
+    digest = checksum_of_bytes(data, algorithm)
+
+    # Fed in chunks of random sizes
+    hasher = checksum_hasher(algorithm)
+    i = 0
+    while i < size:
+        j = i + rng.randint(1, 20)
+        hasher.update(data[i:j])
+        i = j
+    assert hasher.hexdigest() == digest
+
+    # Through a stream, and read back from disk
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        hasher = checksum_hasher(algorithm)
+        with open(path, 'wb') as stream:
+            HashingStream(stream, hasher).write(data)
+        assert hasher.hexdigest() == digest
+        assert checksum_of_file(path, algorithm, buffer_size=4096) == digest
+    finally:
+        os.remove(path)
+
+    if algorithm == 'sum64':
+        assert digest == _legacy_sum64(data)
+
+def test_unknown():
+    with pytest.raises(ValueError):
+        checksum_hasher('md5')
@@ -0,0 +1,76 @@
+"""Tests for the lock files of the cache tiles shared between processes"""
+
+import json
+import os
+import tempfile
+import time
+
+import pytest
+
+from buzzard._cache_lock import CacheTileLocks
+
+@pytest.fixture()
+def dir_path():
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+
+def test_exclusive(dir_path):
+    a = CacheTileLocks(dir_path, 60)
+    b = CacheTileLocks(dir_path, 60)
+    assert a.claim('tile')
+    assert 'tile' in a
+    assert not a.claimed_by_another('tile')
+    assert not b.claim('tile')
+    assert 'tile' not in b
+    assert b.claimed_by_another('tile')
+
+    # Only the owner removes the lock file
+    b.release('tile')
+    assert b.claimed_by_another('tile')
+    a.release('tile')
+    assert os.listdir(dir_path) == []
+    assert not b.claimed_by_another('tile')
+    assert b.claim('tile')
+    b.release_all()
+    assert os.listdir(dir_path) == []
+
+def test_expiry(dir_path):
+    a = CacheTileLocks(dir_path, 0.2)
+    b = CacheTileLocks(dir_path, 60)
+    assert a.claim('tile')
+    assert not b.claim('tile')
+    time.sleep(0.3)
+    assert not b.claimed_by_another('tile')
+    assert b.claim('tile')
+    assert os.listdir(dir_path) == ['tile.lock']
+
+    # The previous owner notices it lost its claim and leaves the new one alone
+    a.renew()
+    assert 'tile' not in a
+    a.release('tile')
+    assert a.claimed_by_another('tile')
+
+def test_renew(dir_path):
+    a = CacheTileLocks(dir_path, 0.4)
+    b = CacheTileLocks(dir_path, 60)
+    assert a.claim('tile')
+    for _ in range(4):
+        time.sleep(0.15)
+        a.renew()
+    assert b.claimed_by_another('tile')
+    assert not b.claim('tile')
+    assert os.listdir(dir_path) == ['tile.lock']
+
+def test_unreadable(dir_path):
+    a = CacheTileLocks(dir_path, 0.2)
+    path = os.path.join(dir_path, 'tile.lock')
+
+    # A lock file being created is live for a lease from its modification time
+    with open(path, 'w'):
+        pass
+    assert a.claimed_by_another('tile')
+    assert not a.claim('tile')
+    time.sleep(0.3)
+    assert a.claim('tile')
+    with open(path) as stream:
+        assert set(json.load(stream).keys()) == {'owner', 'expiry'}
@@ -0,0 +1,57 @@
+"""Tests for the manifest of the cache files of a directory"""
+
+import os
+import tempfile
+
+import pytest
+
+from buzzard._cache_manifest import CacheManifest
+
+@pytest.fixture()
+def dir_path():
+    with tempfile.TemporaryDirectory() as path:
+        yield path
+
+def _write(dir_path, name):
+    path = os.path.join(dir_path, name)
+    with open(path, 'wb') as stream:
+        stream.write(b'42')
+    return path
+
+def _set_dir_mtime(dir_path, mtime_ns):
+    st = os.stat(dir_path)
+    os.utime(dir_path, ns=(st.st_atime_ns, mtime_ns))
+
+def _open(dir_path):
+    return CacheManifest(dir_path, lambda name: name.endswith('.npy'))
+
+def test_trusted_if_newer(dir_path):
+    manifest = _open(dir_path)
+    paths = [_write(dir_path, name) for name in ['a.npy', 'b.npy', 'c.txt']]
+    assert manifest.load() == {'a.npy': None, 'b.npy': None}
+    manifest.add(paths[0])
+    st = os.stat(paths[0])
+
+    # Removed behind the back of the manifest, while it stays newer than the directory
+    os.remove(paths[1])
+    _set_dir_mtime(dir_path, os.stat(manifest._path).st_mtime_ns - 1)
+    assert _open(dir_path).load() == {'a.npy': (st.st_size, st.st_mtime_ns), 'b.npy': None}
+
+def test_listed_if_not_newer(dir_path):
+    manifest = _open(dir_path)
+    paths = [_write(dir_path, name) for name in ['a.npy', 'b.npy']]
+    manifest.load()
+    manifest.add(paths[0])
+    st = os.stat(paths[0])
+
+    # Modified by something else within the same tick as the last update of the manifest
+    os.remove(paths[1])
+    _write(dir_path, 'c.npy')
+    _set_dir_mtime(dir_path, os.stat(manifest._path).st_mtime_ns)
+    assert _open(dir_path).load() == {'a.npy': (st.st_size, st.st_mtime_ns), 'c.npy': None}
+
+    # All the stats are forgotten, including the ones of the files not in the manifest yet
+    _write(dir_path, 'd.npy')
+    _set_dir_mtime(dir_path, os.stat(manifest._path).st_mtime_ns)
+    manifest.forget_stats()
+    assert manifest.load() == {'a.npy': None, 'c.npy': None, 'd.npy': None}
@@ -1,5 +1,6 @@
 import multiprocessing as mp
 import multiprocessing.pool
+import concurrent.futures
 import shutil
 import uuid
 import tempfile
@@ -10,11 +11,15 @@ import time
 import gc
 import threading
 import itertools
+import asyncio
+import json
+import collections
 
 import numpy as np
 import pytest
 
 import buzzard as buzz
+from buzzard._actors.pool_working_room import ActorPoolWorkingRoom
 
 def pytest_generate_tests(metafunc):
     if 'pools' in metafunc.fixturenames:
@@ -24,6 +29,8 @@ def pytest_generate_tests(metafunc):
                 'lol',
                 mp.pool.ThreadPool(2),
                 mp.pool.Pool(2),
+                concurrent.futures.ThreadPoolExecutor(2),
+                concurrent.futures.ProcessPoolExecutor(2),
         ]:
             # TODO: test with different pools
             # TODO: test with spawn/forks
@@ -98,7 +105,9 @@ def test_(pools, test_prefix, cache_tiles, test_prefix2):
         tl=(1000, 1100),
     )
     compute_same_address_space = (
-        type(pools['computation']['computation_pool']) in {str, mp.pool.ThreadPool, type(None)}
+        type(pools['computation']['computation_pool']) in {
+            str, mp.pool.ThreadPool, concurrent.futures.ThreadPoolExecutor, type(None),
+        }
     )
 
     with buzz.Dataset(allow_interpolation=1).close as ds:
@@ -366,6 +375,1170 @@ def test_(pools, test_prefix, cache_tiles, test_prefix2):
         with pytest.raises(NecessaryCrash):
             r.get_data()
 
+def test_sharded_scheduler(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+
+    with buzz.Dataset(allow_interpolation=1, scheduler_shard_count=3).close as ds:
+        npr = ds.awrap_numpy_raster(fp, np.stack(fp.meshgrid_raster, axis=2).astype('float32'))
+        rasters = [
+            ds.acreate_cached_raster_recipe(
+                fp, 'float32', 2,
+                compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+                cache_dir=os.path.join(test_prefix, str(i)),
+                cache_tiles=(26, 26),
+                **kwargs
+            )
+            for i in range(4)
+        ]
+        fps = [fp, fp.erode(10), fp.move(fp.tl + fp.diagvec / 3)] * 2
+
+        # Query all the rasters at the same time, they are spread over several shards
+        iterators = [r.iter_data(band=-1, fps=fps) for r in rasters]
+        for tile, arrs in zip(fps, zip(*iterators)):
+            ref = npr.get_data(band=-1, fp=tile)
+            for arr in arrs:
+                assert np.allclose(arr, ref)
+
+        # Cache files are reused
+        for r in rasters:
+            for tile in fps:
+                assert np.allclose(r.get_data(band=-1, fp=tile), npr.get_data(band=-1, fp=tile))
+
+        # Close a raster while the others are being queried
+        it = rasters[1].iter_data(band=-1, fps=fps)
+        rasters[0].close()
+        assert len(list(it)) == len(fps)
+
+        # The shards of the closed rasters are forgotten
+        for r in rasters[1:]:
+            r.close()
+        t0 = time.time()
+        while ds._back._shard_of_raster_group and time.time() - t0 < 60:
+            time.sleep(1 / 100)
+        assert ds._back._shard_of_raster_group == {}
+
+def test_asyncio_queries(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    fps = [fp, fp.erode(10), fp.move(fp.tl + fp.diagvec / 3)] * 2
+
+    async def _iter_all(r):
+        arrs = []
+        async for arr in r.iter_data_async(fps, band=-1):
+            arrs.append(arr)
+        return arrs
+
+    async def _main(r):
+        # Many concurrent queries on a single thread
+        arrss = await asyncio.gather(*[_iter_all(r) for _ in range(10)])
+        arrs = await asyncio.gather(*[r.get_data_async(tile, band=-1) for tile in fps])
+        return arrss + [arrs]
+
+    with buzz.Dataset(allow_interpolation=1).close as ds:
+        npr = ds.awrap_numpy_raster(fp, np.stack(fp.meshgrid_raster, axis=2).astype('float32'))
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix,
+            cache_tiles=(26, 26),
+            **kwargs
+        )
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            arrss = loop.run_until_complete(_main(r))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        for arrs in arrss:
+            assert len(arrs) == len(fps)
+            for tile, arr in zip(fps, arrs):
+                assert np.allclose(arr, npr.get_data(band=-1, fp=tile))
+
+        # Iterator created outside of the event loop that consumes it
+        it = r.iter_data_async(fps, band=-1)
+        async def _consume():
+            return [await r.get_data_async(fps[1], band=-1)] + [arr async for arr in it]
+        arrs = asyncio.run(_consume())
+        for tile, arr in zip(fps[1:2] + fps, arrs):
+            assert np.allclose(arr, npr.get_data(band=-1, fp=tile))
+
+        # The blocks of shared memory lent to the concurrent computations were all given back
+        arena = ds._back.shared_memory_arena
+        assert arena is None or arena._lent_blocks == {}
+
+        # The scheduler's crash is reraised in the event loop
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=_please_crash,
+            cache_dir=test_prefix,
+            ow=True,
+            **kwargs
+        )
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            with pytest.raises(NecessaryCrash):
+                loop.run_until_complete(r.get_data_async())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+def test_scheduler_stats(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+
+    with buzz.Dataset().close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix,
+            cache_tiles=(26, 26),
+            **kwargs
+        )
+        r.get_data()
+        with pytest.raises(RuntimeError, match='scheduler_profiling'):
+            ds.scheduler_stats()
+
+    with buzz.Dataset(scheduler_profiling=True).close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix,
+            cache_tiles=(26, 26),
+            **kwargs
+        )
+        r.get_data()
+        stats = ds.scheduler_stats()
+
+        assert stats['actors']['ActorQueriesHandler']['count'] > 0
+        for s in stats['actors'].values():
+            assert s['count'] == sum(s['histogram'].values())
+            assert s['max_time'] <= s['total_time']
+            assert max(s['histogram']) > s['max_time']
+        assert stats['messages'][('ActorQueriesHandler', 'new_query')]['count'] == 1
+        assert stats['mailboxes'][0]['max_depth'] >= 0
+
+        if any(v is not None for v in kwargs.values()):
+            for s in stats['pools'].values():
+                assert 0 < s['max_used_tokens'] <= s['max_token_count']
+                assert 0 < s['token_count'] <= s['max_token_count']
+        else:
+            assert stats['pools'] == {}
+
+def test_pool_token_bounds(pools, test_prefix):
+    pool = pools['computation']['computation_pool']
+    if pool is None:
+        return
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    with buzz.Dataset(scheduler_profiling=True).close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix,
+            cache_tiles=(26, 26),
+            computation_pool=pool, merge_pool=pool, io_pool=pool, resample_pool=pool,
+        )
+        ds.pools.set_token_bounds(pool, 3, 3)
+        r.get_data()
+        stats = ds.scheduler_stats()
+
+        assert len(stats['pools']) == 1
+        for s in stats['pools'].values():
+            assert s['token_count'] == 3
+
+def test_pool_batching(pools, test_prefix, test_prefix2, monkeypatch):
+    pool = pools['computation']['computation_pool']
+    if pool is None:
+        return
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+
+    # Spy on the tasks sent to the pool
+    task_sizes = []
+    submit = ActorPoolWorkingRoom._submit
+    def _submit(self, jobs):
+        task_sizes.append(len(jobs))
+        return submit(self, jobs)
+    monkeypatch.setattr(ActorPoolWorkingRoom, '_submit', _submit)
+
+    arrays = []
+    with buzz.Dataset(allow_interpolation=1).close as ds:
+        for max_batch_size, latency_budget, cache_dir in [(1, 0, test_prefix), (4, 0.01, test_prefix2)]:
+            r = ds.acreate_cached_raster_recipe(
+                fp, 'float32', 2,
+                compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+                cache_dir=cache_dir,
+                cache_tiles=(10, 10),
+                computation_pool=pool, merge_pool=pool, io_pool=pool, resample_pool=pool,
+            )
+            ds.pools.set_batching(pool, max_batch_size, latency_budget)
+            r.get_data() # Fill the cache
+
+            # The 100 cache files are ready, their reads are held together
+            del task_sizes[:]
+            arrays.append(r.get_data(fp=fp.move(fp.tl + fp.diagvec / 3)))
+            job_count = sum(task_sizes)
+            if max_batch_size == 1:
+                assert set(task_sizes) == {1}
+            else:
+                assert 1 < max(task_sizes) <= max_batch_size
+                assert len(task_sizes) < job_count
+            r.close()
+    assert np.all(arrays[0] == arrays[1])
+
+def test_npy_cache_format(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    xref, yref = fp.meshgrid_raster
+
+    with buzz.Dataset().close as ds:
+        # Fill the cache
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix, cache_tiles=(26, 26), cache_format='npy',
+            **kwargs
+        )
+        assert r.cache_format == 'npy'
+        r.get_data()
+        r.close()
+        files = glob.glob(os.path.join(test_prefix, '*.npy'))
+        assert len(files) == 16
+        assert glob.glob(os.path.join(test_prefix, '*.tif')) == []
+        arr = np.load(files[0])
+        assert arr.shape[2] == 2 and arr.dtype == np.float32
+
+        # Read the cache, with channels out of order
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=_should_not_be_called,
+            cache_dir=test_prefix, cache_tiles=(26, 26), cache_format='npy',
+            **kwargs
+        )
+        arr = r.get_data(channels=[1, 0])
+        assert np.all(arr[..., 0] == yref)
+        assert np.all(arr[..., 1] == xref)
+        r.close()
+
+        # Recompute a corrupted cache file
+        with open(files[0], 'wb') as stream:
+            stream.write(b'42')
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix, cache_tiles=(26, 26), cache_format='npy',
+            **kwargs
+        )
+        arr = r.get_data(channels=None)
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+        r.close()
+
+    with buzz.Dataset().close as ds:
+        # The footprint of a cache file is recorded in its name
+        r = ds.acreate_cached_raster_recipe(
+            fp.move(fp.tl + 1), 'float32', 2,
+            compute_array=_should_not_be_called,
+            cache_dir=test_prefix, cache_tiles=(26, 26), cache_format='npy',
+            **kwargs
+        )
+        with pytest.raises(RuntimeError, match='invalid Footprint'):
+            r.get_data()
+
+    with buzz.Dataset().close as ds:
+        with pytest.raises(ValueError, match='cache_format'):
+            ds.acreate_cached_raster_recipe(
+                fp, 'float32', 2,
+                compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+                cache_dir=test_prefix, cache_format='png',
+            )
+
+def test_cache_options(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+
+    def _open(cache_format, cache_options):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix, cache_tiles=(50, 50),
+            cache_format=cache_format, cache_options=cache_options,
+            **kwargs
+        )
+
+    def _recorded_encoding():
+        with open(os.path.join(test_prefix, 'buzz_cache_encoding.json')) as stream:
+            return json.load(stream)
+
+    with buzz.Dataset().close as ds:
+        r = _open('npy', ())
+        r.get_data()
+        r.close()
+        assert _recorded_encoding() == {
+            'cache_format': 'npy', 'cache_options': [], 'cache_checksum': 'sum64',
+        }
+
+        r = _open('GTiff', ['COMPRESS=DEFLATE', 'PREDICTOR=3', 'BLOCKXSIZE=64', 'BLOCKYSIZE=64'])
+        assert 'COMPRESS=DEFLATE' in r.cache_options
+        assert 'TILED=YES' in r.cache_options
+        assert 'BLOCKXSIZE=64' in r.cache_options
+        assert 'BLOCKXSIZE=256' not in r.cache_options
+        r.close()
+
+        with pytest.raises(ValueError, match='cache_options'):
+            _open('npy', ['COMPRESS=ZSTD'])
+
+def test_cache_manifest(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    manifest_path = os.path.join(test_prefix, 'buzz_cache_manifest.log')
+
+    def _open(compute_array):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50),
+            **kwargs
+        )
+
+    def _manifest_files():
+        files = {}
+        with open(manifest_path) as stream:
+            for line in list(stream)[1:]:
+                fields = line.rstrip('\n').split('\t')
+                if fields[0] == '+':
+                    files[fields[1]] = None
+                else:
+                    del files[fields[1]]
+        return set(files)
+
+    def _disk_files():
+        return set(map(os.path.basename, glob.glob(os.path.join(test_prefix, '*.tif'))))
+
+    with buzz.Dataset().close as ds:
+        # Fill the cache, the written files are recorded
+        r = _open(functools.partial(_meshgrid_raster_in, reffp=fp))
+        r.get_data()
+        r.close()
+        assert len(_disk_files()) == 4
+        assert _manifest_files() == _disk_files()
+
+        # A file removed behind the back of the manifest is recomputed
+        path = sorted(glob.glob(os.path.join(test_prefix, '*.tif')))[0]
+        os.remove(path)
+        os.utime(manifest_path) # The manifest is still trusted
+        r = _open(functools.partial(_meshgrid_raster_in, reffp=fp))
+        arr = r.get_data(channels=None)
+        r.close()
+        assert len(_disk_files()) == 4
+        assert _manifest_files() == _disk_files()
+        xref, yref = fp.meshgrid_raster
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+
+        # Without manifest, the directory is listed
+        os.remove(manifest_path)
+        r = _open(_should_not_be_called)
+        arr = r.get_data(channels=None)
+        r.close()
+        assert _manifest_files() == _disk_files()
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+
+def test_cache_checksum(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+
+    def _open(compute_array, cache_checksum):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50), cache_checksum=cache_checksum,
+            **kwargs
+        )
+
+    def _checksums():
+        return {
+            os.path.basename(path).split('.')[0].split('_')[-1]
+            for path in glob.glob(os.path.join(test_prefix, '*.tif'))
+        }
+
+    with buzz.Dataset().close as ds:
+        r = _open(functools.partial(_meshgrid_raster_in, reffp=fp), 'crc32')
+        assert r.cache_checksum == 'crc32'
+        r.get_data()
+        r.close()
+        checksums0 = _checksums()
+        assert len(checksums0) == 4
+        assert all(len(checksum) == 8 for checksum in checksums0)
+
+        # Same checksum, the cache is reused
+        r = _open(_should_not_be_called, 'crc32')
+        r.get_data()
+        r.close()
+        assert _checksums() == checksums0
+
+        # New checksum, the cache files are recomputed
+        r = _open(functools.partial(_meshgrid_raster_in, reffp=fp), 'blake2b')
+        arr = r.get_data(channels=None)
+        r.close()
+        checksums1 = _checksums()
+        assert len(checksums1) == 4
+        assert all(len(checksum) == 16 for checksum in checksums1)
+        xref, yref = fp.meshgrid_raster
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+
+        with pytest.raises(ValueError, match='cache_checksum'):
+            _open(_should_not_be_called, 'md5')
+
+def test_cache_validation(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    xref, yref = fp.meshgrid_raster
+
+    class _Observer:
+        def __init__(self):
+            self.updates = []
+
+        def on_cache_file_update(self, raster, cache_fp, status):
+            self.updates.append((cache_fp, status))
+
+    def _open(compute_array, cache_validation):
+        obs = _Observer()
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50), cache_format='npy',
+            cache_validation=cache_validation, debug_observers=[obs],
+            **kwargs
+        )
+        return r, obs
+
+    def _check(arr):
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+
+    with buzz.Dataset().close as ds:
+        # Fill the cache, the size and mtime of the files are recorded
+        r, _ = _open(functools.partial(_meshgrid_raster_in, reffp=fp), 'full')
+        r.get_data()
+        r.close()
+        paths = sorted(glob.glob(os.path.join(test_prefix, '*.npy')))
+        assert len(paths) == 4
+
+        # All files are trusted
+        r, obs = _open(_should_not_be_called, 'stat')
+        _check(r.get_data(channels=None))
+        r.close()
+        assert {status for _, status in obs.updates} == {'ready'}
+
+        # A file modified since is checked, and then trusted
+        st = os.stat(paths[0])
+        os.utime(paths[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        r, obs = _open(_should_not_be_called, 'stat')
+        _check(r.get_data(channels=None))
+        r.close()
+        assert [status for _, status in obs.updates].count('unknown') == 1
+        r, obs = _open(_should_not_be_called, 'stat')
+        r.get_data()
+        r.close()
+        assert {status for _, status in obs.updates} == {'ready'}
+
+        # A corrupted file is read and then replaced
+        with open(paths[0], 'r+b') as stream:
+            stream.seek(-1, os.SEEK_END)
+            byte = stream.read(1)
+            stream.seek(-1, os.SEEK_END)
+            stream.write(bytes([byte[0] ^ 0xff]))
+        r, obs = _open(functools.partial(_meshgrid_raster_in, reffp=fp), 'lazy')
+        r.get_data()
+        for _ in range(200):
+            if 'absent' in {status for _, status in obs.updates}:
+                break
+            time.sleep(0.05)
+        assert [status for _, status in obs.updates].count('absent') == 1
+        _check(r.get_data(channels=None))
+        r.close()
+        # Computed again with the same checksum, so with the same name
+        assert sorted(glob.glob(os.path.join(test_prefix, '*.npy'))) == paths
+        with open(paths[0], 'rb') as stream:
+            stream.seek(-1, os.SEEK_END)
+            assert stream.read(1) == byte
+
+        with pytest.raises(ValueError, match='cache_validation'):
+            _open(_should_not_be_called, 'sometimes')
+
+def test_cache_budget(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    xref, yref = fp.meshgrid_raster
+
+    def _open(compute_array, **budget):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50), cache_format='npy',
+            **budget,
+            **kwargs
+        )
+
+    def _paths(count):
+        # The files are evicted once the scheduler learns that the query is done
+        for _ in range(200):
+            paths = glob.glob(os.path.join(test_prefix, '*.npy'))
+            if len(paths) == count:
+                break
+            time.sleep(0.05)
+        assert len(paths) == count
+        return paths
+
+    compute = functools.partial(_meshgrid_raster_in, reffp=fp)
+    with buzz.Dataset().close as ds:
+        # The tiles of a query are kept until they are sampled
+        r = _open(compute, max_cache_tiles=2)
+        arr = r.get_data(channels=None)
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+        _paths(2)
+
+        # The evicted tiles are computed again
+        arr = r.get_data(channels=None)
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+        _paths(2)
+        r.close()
+
+        # The files found on disk and not used since are evicted first
+        tile_nbytes = os.path.getsize(_paths(2)[0])
+        r = _open(compute, max_cache_bytes=tile_nbytes * 3)
+        r.get_data(fp=fp.clip(0, 0, 50, 50))
+        r.get_data(fp=fp.clip(50, 50, 100, 100))
+        r.get_data(fp=fp.clip(50, 0, 100, 50))
+        _paths(3)
+        r.get_data(fp=fp.clip(0, 50, 50, 100))
+        _paths(3)
+        r.close()
+
+        # Least recently used
+        r = _open(_should_not_be_called, max_cache_bytes=tile_nbytes * 3)
+        r.get_data(fp=fp.clip(50, 50, 100, 100))
+        r.get_data(fp=fp.clip(50, 0, 100, 50))
+        r.get_data(fp=fp.clip(0, 50, 50, 100))
+        r.close()
+        r = _open(compute, max_cache_bytes=tile_nbytes * 2, cache_eviction='lru')
+        r.get_data(fp=fp.clip(0, 50, 50, 100))
+        r.get_data(fp=fp.clip(50, 50, 100, 100))
+        r.get_data(fp=fp.clip(50, 50, 100, 100))
+        r.get_data(fp=fp.clip(50, 0, 100, 50))
+        _paths(2)
+        r.close()
+        r = _open(_should_not_be_called)
+        r.get_data(fp=fp.clip(50, 50, 100, 100))
+        r.get_data(fp=fp.clip(50, 0, 100, 50))
+        r.close()
+
+        # Least frequently used
+        r = _open(compute, max_cache_tiles=2, cache_eviction='lfu')
+        r.get_data(fp=fp.clip(50, 0, 100, 50))
+        r.get_data(fp=fp.clip(50, 0, 100, 50))
+        r.get_data(fp=fp.clip(50, 50, 100, 100))
+        r.get_data(fp=fp.clip(0, 0, 50, 50))
+        _paths(2)
+        r.close()
+        r = _open(_should_not_be_called)
+        r.get_data(fp=fp.clip(50, 0, 100, 50))
+        r.get_data(fp=fp.clip(0, 0, 50, 50))
+        r.close()
+
+        with pytest.raises(ValueError, match='max_cache_bytes'):
+            _open(_should_not_be_called, max_cache_bytes=-1)
+        with pytest.raises(ValueError, match='cache_eviction'):
+            _open(_should_not_be_called, cache_eviction='fifo')
+
+def test_cache_budget_unpin_sampled(test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    xref, yref = fp.meshgrid_raster
+    tiles = fp.tile((50, 50)).flatten()
+    last_tile_allowed = threading.Event()
+
+    def _compute(cache_fp, *args):
+        if cache_fp == tiles[-1]:
+            assert last_tile_allowed.wait(timeout=60)
+        return _meshgrid_raster_in(cache_fp, *args, reffp=fp)
+
+    def _paths():
+        return glob.glob(os.path.join(test_prefix, '*.npy'))
+
+    pool = mp.pool.ThreadPool(2)
+    with buzz.Dataset().close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=_compute,
+            cache_dir=test_prefix, cache_tiles=(50, 50), cache_format='npy', max_cache_tiles=1,
+            computation_pool=pool,
+        )
+        it = r.iter_data(tiles, channels=None)
+        for tile in tiles[:-1]:
+            arr = next(it)
+            assert np.all(arr[..., 0] == xref[tile.slice_in(fp)])
+
+        # The query is still waiting for its last tile, the sampled ones were evicted
+        for _ in range(200):
+            if len(_paths()) == 1:
+                break
+            time.sleep(0.05)
+        assert len(_paths()) == 1
+
+        last_tile_allowed.set()
+        arr = next(it)
+        assert np.all(arr[..., 1] == yref[tiles[-1].slice_in(fp)])
+        r.close()
+    pool.terminate()
+
+def test_warm_cache(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    xref, yref = fp.meshgrid_raster
+
+    def _open(compute_array):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50),
+            **kwargs
+        )
+
+    def _paths():
+        return glob.glob(os.path.join(test_prefix, '*.tif'))
+
+    compute = functools.partial(_meshgrid_raster_in, reffp=fp)
+    with buzz.Dataset().close as ds:
+        r = _open(compute)
+        warmup = r.warm_cache(fp.clip(0, 0, 60, 40))
+        assert warmup.wait(timeout=60)
+        assert not warmup.cancelled
+        assert (warmup.done, warmup.total) == (2, 2)
+        assert warmup.eta == 0
+        assert len(_paths()) == 2
+
+        # The cache files already written are done at once
+        warmup = r.warm_cache(priority='normal')
+        assert warmup.wait(timeout=60)
+        assert (warmup.done, warmup.total) == (4, 4)
+        assert len(_paths()) == 4
+        r.close()
+
+        r = _open(_should_not_be_called)
+        arr = r.get_data(channels=None)
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+        warmup = r.warm_cache([])
+        assert warmup.finished and warmup.total == 0
+        with pytest.raises(ValueError, match='priority'):
+            r.warm_cache(priority='high')
+        r.close()
+
+    # Cancelled, by the user or by closing the raster
+    def _check_cancelled(warmup):
+        assert warmup.wait(timeout=60)
+        if any(v is not None for v in kwargs.values()):
+            assert warmup.cancelled
+            assert warmup.done < warmup.total
+        else:
+            # Without pools, the scheduler computes all the cache tiles before the cancellation
+            assert not warmup.cancelled
+            assert warmup.done == warmup.total
+
+    shutil.rmtree(test_prefix)
+    with buzz.Dataset().close as ds:
+        r = _open(compute)
+        warmup = r.warm_cache()
+        warmup.cancel()
+        _check_cancelled(warmup)
+        r.close()
+
+    # Closed before its actors are started, without pools the tiles are computed after the close
+    shutil.rmtree(test_prefix)
+    with buzz.Dataset().close as ds:
+        r = _open(functools.partial(_meshgrid_in, reffp=fp))
+        warmup = r.warm_cache()
+        r.close()
+        _check_cancelled(warmup)
+
+def test_warm_cache_low_priority(test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    tiles = fp.tile((10, 10)).flatten()
+    computed = []
+    first_computation_allowed = threading.Event()
+
+    def _compute(cache_fp, *args):
+        if not computed:
+            assert first_computation_allowed.wait(timeout=60)
+        computed.append(cache_fp)
+        return _meshgrid_raster_in(cache_fp, *args, reffp=fp)
+
+    pool = mp.pool.ThreadPool(1)
+    with buzz.Dataset().close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=_compute,
+            cache_dir=test_prefix, cache_tiles=(10, 10), cache_format='npy',
+            computation_pool=pool,
+        )
+        ds.pools.set_token_bounds(pool, 1, 1)
+        warmup = r.warm_cache(priority='low')
+
+        # The warmup holds the only worker, the query waits behind it
+        q = r.queue_data([tiles[-1]], channels=None)
+        time.sleep(0.5)
+        first_computation_allowed.set()
+        q.get(timeout=60)
+        assert computed[:2] == [tiles[0], tiles[-1]]
+
+        assert warmup.wait(timeout=60)
+        assert len(computed) == len(tiles)
+        r.close()
+    pool.terminate()
+
+def test_cache_lock(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    xref, yref = fp.meshgrid_raster
+
+    class _Observer:
+        def __init__(self):
+            self.updates = []
+
+        def on_cache_file_update(self, raster, cache_fp, status):
+            self.updates.append((cache_fp, status))
+
+    def _open(compute_array, **options):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50), cache_lock_lease=1,
+            **options,
+            **kwargs
+        )
+
+    def _paths(ext):
+        return glob.glob(os.path.join(test_prefix, '*' + ext))
+
+    def _lock_paths():
+        return glob.glob(os.path.join(test_prefix, '.locks', '*'))
+
+    def _lock_by_another_process(lease):
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, 'w') as stream:
+            json.dump({'owner': 'elsewhere:0:0', 'expiry': time.time() + lease}, stream)
+
+    compute = functools.partial(_meshgrid_raster_in, reffp=fp)
+    with buzz.Dataset().close as ds:
+        r = _open(compute)
+        assert r.cache_lock_lease == 1
+        prefix = r._back.fname_prefix_of_cache_fp(r.cache_tiles.flat[0])
+        lock_path = os.path.join(test_prefix, '.locks', prefix + '.lock')
+
+        # The process that claimed a cache tile died, its claim is taken over once expired
+        _lock_by_another_process(1)
+        arr = r.get_data(channels=None)
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+        assert len(_paths('.tif')) == 4
+        assert _lock_paths() == []
+        assert _paths('.lock') == []
+        r.close()
+
+        # The lock files did not modify `cache_dir`, the cache files are trusted from its manifest
+        obs = _Observer()
+        r = _open(_should_not_be_called, cache_validation='stat', debug_observers=[obs])
+        r.get_data()
+        r.close()
+        assert {status for _, status in obs.updates} == {'ready'}
+
+        # The process that claimed a cache tile writes it, it is read from there
+        path, = glob.glob(os.path.join(test_prefix, prefix + '*.tif'))
+        other_path = os.path.join(os.path.dirname(test_prefix), str(uuid.uuid4()))
+        shutil.move(path, other_path)
+        _lock_by_another_process(60)
+
+        def _written_by_another_process():
+            os.replace(other_path, path)
+            os.remove(lock_path)
+
+        timer = threading.Timer(1, _written_by_another_process)
+        timer.start()
+        r = _open(_should_not_be_called)
+        arr = r.get_data(channels=None)
+        timer.join()
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+        assert _lock_paths() == []
+        r.close()
+
+    with pytest.raises(ValueError, match='cache_lock_lease'):
+        with buzz.Dataset().close as ds:
+            ds.acreate_cached_raster_recipe(
+                fp, 'float32', 2,
+                compute_array=compute,
+                cache_dir=test_prefix, cache_lock_lease=0,
+            )
+
+def test_invalidate_cache(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    xref, yref = fp.meshgrid_raster
+
+    def _open(compute_array, recipe_version=None):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50), recipe_version=recipe_version,
+            **kwargs
+        )
+
+    def _mtimes():
+        return {
+            path: os.stat(path).st_mtime_ns
+            for path in glob.glob(os.path.join(test_prefix, '*.tif'))
+        }
+
+    def _check(arr):
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+
+    compute = functools.partial(_meshgrid_raster_in, reffp=fp)
+    with buzz.Dataset().close as ds:
+        r = _open(compute)
+        _check(r.get_data(channels=None))
+        mtimes = _mtimes()
+        assert len(mtimes) == 4
+        time.sleep(0.1)
+
+        # Only the intersecting cache tile is computed again
+        r.invalidate_cache(fp.clip(0, 0, 10, 10))
+        _check(r.get_data(channels=None))
+        new_mtimes = _mtimes()
+        assert mtimes.keys() == new_mtimes.keys()
+        assert sum(mtimes[path] != new_mtimes[path] for path in mtimes) == 1
+
+        # While a query reads the cache files
+        q = r.queue_data([fp] * 3, channels=None, max_queue_size=1)
+        _check(q.get(timeout=60))
+        r.invalidate_cache([fp])
+        _check(q.get(timeout=60))
+        _check(q.get(timeout=60))
+        _check(r.get_data(channels=None))
+        assert len(_mtimes()) == 4
+        r.close()
+
+        # The cache files of another version of the recipe are stale
+        r = _open(compute, recipe_version=1)
+        assert r.recipe_version == 1
+        _check(r.get_data(channels=None))
+        paths = list(_mtimes().keys())
+        assert len(paths) == 4
+        assert all('_v' in os.path.basename(path) for path in paths)
+        r.close()
+
+        r = _open(_should_not_be_called, recipe_version=1)
+        _check(r.get_data(channels=None))
+        r.close()
+
+        r = _open(compute, recipe_version='2')
+        _check(r.get_data(channels=None))
+        assert len(_mtimes()) == 4
+        assert not set(_mtimes().keys()) & set(paths)
+        r.close()
+
+def test_invalidate_cache_computing(test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    xref, yref = fp.meshgrid_raster
+    tiles = fp.tile((50, 50)).flatten()
+    version = [0]
+    computing = threading.Event()
+    computation_allowed = threading.Event()
+
+    def _compute(cache_fp, *args):
+        offset = version[0]
+        if cache_fp == tiles[0]:
+            computing.set()
+            assert computation_allowed.wait(timeout=60)
+        return _meshgrid_raster_in(cache_fp, *args, reffp=fp) + offset
+
+    pool = mp.pool.ThreadPool(2)
+    with buzz.Dataset().close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=_compute,
+            cache_dir=test_prefix, cache_tiles=(50, 50), cache_format='npy',
+            computation_pool=pool,
+        )
+        q = r.queue_data([tiles[0]], channels=None)
+        assert computing.wait(timeout=60)
+
+        # The data changes while the first cache tile is being computed
+        version[0] = 1
+        r.invalidate_cache(tiles[0])
+        warmup = r.warm_cache(tiles[1])
+        assert warmup.wait(timeout=60)
+        computation_allowed.set()
+
+        # The cache tile is computed again before being read
+        arr = q.get(timeout=60)
+        assert np.all(arr[..., 0] == xref[tiles[0].slice_in(fp)] + 1)
+        assert np.all(arr[..., 1] == yref[tiles[0].slice_in(fp)] + 1)
+        r.close()
+
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=_should_not_be_called,
+            cache_dir=test_prefix, cache_tiles=(50, 50), cache_format='npy',
+        )
+        arr = r.get_data(fp=tiles[0], channels=None)
+        assert np.all(arr[..., 0] == xref[tiles[0].slice_in(fp)] + 1)
+        assert len(glob.glob(os.path.join(test_prefix, '*.npy'))) == 2
+        r.close()
+    pool.terminate()
+
+def test_tile_memory_cache(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    xref, yref = fp.meshgrid_raster
+    tile_nbytes = 50 * 50 * 2 * 4
+
+    def _open(compute_array):
+        return ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=compute_array,
+            cache_dir=test_prefix, cache_tiles=(50, 50),
+            **kwargs
+        )
+
+    # Filled on read, the tiles do not all fit
+    with buzz.Dataset().close as ds:
+        r = _open(functools.partial(_meshgrid_raster_in, reffp=fp))
+        r.get_data()
+        r.close()
+    with buzz.Dataset(tile_memory_cache_bytes=tile_nbytes * 3).close as ds:
+        r = _open(_should_not_be_called)
+        r.get_data()
+        stats = ds.tile_memory_cache_stats()
+        assert stats['hits'] == 0
+        assert stats['misses'] == 4
+        assert stats['evictions'] == 1
+        assert stats['tile_count'] == 3
+        assert stats['bytes'] == tile_nbytes * 3
+
+        arr = r.get_data(channels=[1], fp=fp.clip(10, 10, 40, 40))
+        assert np.all(arr[..., 0] == yref[10:40, 10:40])
+        assert ds.tile_memory_cache_stats()['hits'] + ds.tile_memory_cache_stats()['misses'] == 5
+        r.close()
+        assert ds.tile_memory_cache_stats()['tile_count'] == 0
+
+    # Filled on write, the reads do not touch the disk
+    shutil.rmtree(test_prefix)
+    with buzz.Dataset(tile_memory_cache_bytes=tile_nbytes * 4).close as ds:
+        r = _open(functools.partial(_meshgrid_raster_in, reffp=fp))
+        r.get_data()
+        for path in glob.glob(os.path.join(test_prefix, '*.tif')):
+            os.remove(path)
+        arr = r.get_data(channels=None)
+        assert np.all(arr[..., 0] == xref)
+        assert np.all(arr[..., 1] == yref)
+        stats = ds.tile_memory_cache_stats()
+        assert stats['hits'] == 8
+        assert stats['misses'] == 0
+        r.close()
+
+def test_trace_recorder(pools, test_prefix):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    kwargs = dict(itertools.chain(
+        pools['merge'].items(),
+        pools['resample'].items(),
+        pools['computation'].items(),
+        pools['io'].items(),
+    ))
+    rec = buzz.utils.TraceRecorder()
+
+    with buzz.Dataset(debug_observers=[rec]).close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=test_prefix,
+            cache_tiles=(26, 26),
+            debug_observers=[rec],
+            **kwargs
+        )
+        r.get_data()
+
+    path = os.path.join(test_prefix, 'trace.json')
+    rec.dump(path)
+    with open(path) as stream:
+        events = json.load(stream)['traceEvents']
+
+    names = {e['name'] for e in events}
+    assert 'QueriesHandler.new_query' in names
+    assert 'cache_file ready' in names
+
+    # Each pool job is waiting then running, and all slices are closed
+    slices = collections.Counter(
+        (e['cat'], e['id'], e['ph'])
+        for e in events
+        if e['ph'] in 'be'
+    )
+    for (cat, id, ph), count in slices.items():
+        if ph == 'b':
+            assert slices[(cat, id, 'e')] == count
+    cats = {cat for cat, _, _ in slices}
+    if any(v is not None for v in kwargs.values()):
+        assert cats == {'wait', 'run'}
+    else:
+        assert cats == set()
+
 # Tools ***************************************************************************************** **
 class _AreaCounter(object):
     def __init__(self, fp):
@@ -402,6 +1575,10 @@ def _meshgrid_raster_in(fp, primitive_fps, primtive_arrays, raster, reffp):
     x, y = fp.meshgrid_raster_in(reffp)
     return np.stack([x, y], axis=2).astype('float32')
 
+def _meshgrid_in(fp, primitive_fps, primtive_arrays, raster, reffp):
+    x, y = fp.meshgrid_raster_in(reffp)
+    return np.stack([x, y], axis=2).astype('float32')
+
 class NecessaryCrash(Exception):
     pass
 
@@ -0,0 +1,85 @@
+""" Stochastic test that proves that IndexedHeap behaves like _IndexedHeap_Naive
+Since _IndexedHeap_Naive implementation is straightforward we can trust it, and
+transfer this confidence to IndexedHeap using this test.
+"""
+
+import itertools
+
+import pytest
+import numpy as np
+
+from buzzard._tools import IndexedHeap
+
+class _IndexedHeap_Naive(object):
+    """Class with the same specifications as IndexedHeap but with a simpler and less effective
+    implementation. It exists for unit testing purposes"""
+
+    def __init__(self):
+        self._d = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._d)
+
+    def __contains__(self, item):
+        return item in self._d
+
+    def prio_of(self, item):
+        return self._d[item][0]
+
+    def push(self, item, prio):
+        assert item not in self._d
+        self._d[item] = (prio, next(self._counter))
+
+    def update(self, item, prio):
+        self._d[item] = (prio, self._d[item][1])
+
+    def peek(self):
+        return min(self._d.items(), key=lambda kv: kv[1])[0]
+
+    def pop(self):
+        item = self.peek()
+        del self._d[item]
+        return item
+
+    def remove(self, item):
+        del self._d[item]
+
+@pytest.mark.parametrize('seed', range(5))
+def test_indexed_heap(seed):
+    rng = np.random.RandomState(seed)
+    ref = _IndexedHeap_Naive()
+    test = IndexedHeap()
+    items = list(range(50))
+
+    for _ in range(5000):
+        item = items[rng.randint(len(items))]
+        prio = (rng.randint(5), rng.randint(5))
+        op = rng.randint(5)
+        if op == 0:
+            if item not in ref:
+                ref.push(item, prio)
+                test.push(item, prio)
+        elif op == 1:
+            if item in ref:
+                ref.update(item, prio)
+                test.update(item, prio)
+        elif op == 2:
+            if item in ref:
+                ref.remove(item)
+                test.remove(item)
+        elif op == 3:
+            if len(ref):
+                assert ref.pop() == test.pop()
+        else:
+            if len(ref):
+                assert ref.peek() == test.peek()
+
+        assert len(ref) == len(test)
+        assert (item in ref) == (item in test)
+        if item in ref:
+            assert ref.prio_of(item) == test.prio_of(item)
+
+    while len(ref):
+        assert ref.pop() == test.pop()
+    assert len(test) == 0
@@ -0,0 +1,115 @@
+"""Tests for the pools accepted by the async rasters, configured with an initializer or with a
+maximum number of tasks per worker"""
+
+import concurrent.futures
+import functools
+import multiprocessing as mp
+import multiprocessing.pool
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+import buzzard as buzz
+from buzzard._actors.pool_adapter import pool_adapter
+
+_initialized_with = None
+
+def _initializer(value):
+    global _initialized_with
+    _initialized_with = value
+
+def _job(i):
+    return i, os.getpid(), _initialized_with
+
+def _meshgrid_raster_in(fp, primitive_fps, primtive_arrays, raster, reffp):
+    x, y = fp.meshgrid_raster_in(reffp)
+    return np.stack([x, y], axis=2).astype('float32')
+
+requires_max_tasks_per_child = pytest.mark.skipif(
+    sys.version_info < (3, 11), reason='`max_tasks_per_child` of executors requires python 3.11',
+)
+
+POOL_FACTORIES = {
+    'thread_pool_initializer': lambda: mp.pool.ThreadPool(
+        2, initializer=_initializer, initargs=('ok',),
+    ),
+    'process_pool_initializer': lambda: mp.pool.Pool(
+        2, initializer=_initializer, initargs=('ok',),
+    ),
+    'process_pool_maxtasksperchild': lambda: mp.pool.Pool(
+        2, initializer=_initializer, initargs=('ok',), maxtasksperchild=1,
+    ),
+    'thread_pool_executor_initializer': lambda: concurrent.futures.ThreadPoolExecutor(
+        2, initializer=_initializer, initargs=('ok',),
+    ),
+    'process_pool_executor_initializer': lambda: concurrent.futures.ProcessPoolExecutor(
+        2, initializer=_initializer, initargs=('ok',),
+    ),
+    # `max_tasks_per_child` is incompatible with the 'fork' start method
+    'process_pool_executor_max_tasks_per_child': lambda: concurrent.futures.ProcessPoolExecutor(
+        2, initializer=_initializer, initargs=('ok',), max_tasks_per_child=1,
+        mp_context=mp.get_context('spawn'),
+    ),
+}
+
+@pytest.fixture(params=[
+    'thread_pool_initializer',
+    'process_pool_initializer',
+    'process_pool_maxtasksperchild',
+    'thread_pool_executor_initializer',
+    'process_pool_executor_initializer',
+    pytest.param('process_pool_executor_max_tasks_per_child', marks=requires_max_tasks_per_child),
+])
+def pool(request):
+    pool = POOL_FACTORIES[request.param]()
+    yield pool
+    pool_adapter(pool).terminate().join()
+
+def test_submit(pool):
+    adapter = pool_adapter(pool)
+    assert adapter.worker_count == 2
+    is_thread_pool = isinstance(pool, (mp.pool.ThreadPool, concurrent.futures.ThreadPoolExecutor))
+    assert adapter.same_address_space == is_thread_pool
+
+    done = threading.Semaphore(0)
+    futures = [
+        adapter.submit(functools.partial(_job, i), lambda _: done.release())
+        for i in range(6)
+    ]
+    for _ in futures:
+        assert done.acquire(timeout=60)
+    results = [adapter.result(future) for future in futures]
+    assert [i for i, _, _ in results] == list(range(6))
+
+    # All the workers ran the initializer, including the ones that replaced the retired ones
+    assert {value for _, _, value in results} == {'ok'}
+    pids = {pid for _, pid, _ in results}
+    if is_thread_pool:
+        assert pids == {os.getpid()}
+    else:
+        assert os.getpid() not in pids
+    if getattr(pool, '_maxtasksperchild', None) or getattr(pool, '_max_tasks_per_child', None):
+        assert len(pids) == 6
+
+def test_cached_raster(pool, tmpdir):
+    fp = buzz.Footprint(
+        rsize=(100, 100),
+        size=(100, 100),
+        tl=(1000, 1100),
+    )
+    xref, yref = fp.meshgrid_raster
+    with buzz.Dataset().close as ds:
+        r = ds.acreate_cached_raster_recipe(
+            fp, 'float32', 2,
+            compute_array=functools.partial(_meshgrid_raster_in, reffp=fp),
+            cache_dir=str(tmpdir), cache_tiles=(50, 50), cache_format='npy',
+            computation_pool=pool, merge_pool=pool, io_pool=pool, resample_pool=pool,
+        )
+        for _ in range(2):
+            arr = r.get_data(channels=None)
+            assert np.all(arr[..., 0] == xref)
+            assert np.all(arr[..., 1] == yref)
+        r.close()
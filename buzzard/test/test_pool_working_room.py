@@ -0,0 +1,128 @@
+"""Tests for the packing of the small pool jobs in tasks"""
+
+import multiprocessing as mp
+import multiprocessing.pool
+import threading
+import time
+
+import pytest
+
+from buzzard._actors.pool_job import PoolJobWorking
+from buzzard._actors.pool_working_room import ActorPoolWorkingRoom, _groups_of_affinity
+from buzzard._debug_observers_manager import DebugObserversManager
+from buzzard._shared_memory_arena import SharedMemoryArena
+
+@pytest.fixture()
+def pool():
+    pool = mp.pool.ThreadPool(2)
+    yield pool
+    pool.terminate()
+
+def _job(affinity, kind='Reader', func=None):
+    if func is None:
+        func = lambda: affinity
+    return PoolJobWorking('/Raster0/{}'.format(kind), func, affinity)
+
+class _SharedMemoryJob(PoolJobWorking):
+    """Job that lends a block of shared memory when created, like the jobs of the Reader on
+    process pools"""
+
+    def __init__(self, arena, affinity, func):
+        super().__init__('/Raster0/Reader', func, affinity)
+        self.arena = arena
+        self.shared_array = arena.lend((10, 10), 'float32')
+
+    def discard(self):
+        self.arena.release(self.shared_array)
+
+def _open_room(pool, max_batch_size):
+    """Working room that records the affinities of the jobs of each task it submits"""
+    room = ActorPoolWorkingRoom(
+        pool, threading.Event(), DebugObserversManager([]), lambda: (max_batch_size, 0),
+    )
+    room.tasks = []
+    submit = room._submit
+    def _submit(jobs):
+        room.tasks.append([job.affinity for job in jobs])
+        submit(jobs)
+    room._submit = _submit
+    return room
+
+def _launch(room, jobs):
+    for i, job in enumerate(jobs):
+        assert room.receive_launch_job_with_token(job, i) == []
+
+def _results(room, count):
+    results = []
+    for _ in range(500):
+        results += [
+            msg.args[1]
+            for msg in room.ext_receive_nothing()
+            if msg.title == 'job_done'
+        ]
+        if len(results) == count:
+            return results
+        time.sleep(0.01)
+    assert False, results
+
+def test_groups_of_affinity():
+    jobs = [_job('a'), _job('b'), _job(None), _job('a'), _job(None), _job('a'), _job('b')]
+    assert _groups_of_affinity(jobs, 2) == [
+        [jobs[0], jobs[3]], [jobs[1], jobs[6]], [jobs[2]], [jobs[4]], [jobs[5]],
+    ]
+    assert _groups_of_affinity(jobs, 1) == [[job] for job in jobs]
+
+def test_same_file_on_free_worker(pool):
+    room = _open_room(pool, 4)
+    _launch(room, [_job('a'), _job('b'), _job('a')])
+    assert room.tasks == []
+
+    # The jobs that can start right away are sent with the ones reading the same file
+    assert sorted(_results(room, 3)) == ['a', 'a', 'b']
+    assert room.tasks == [['a', 'a'], ['b']]
+
+def test_same_file_packed(pool):
+    room = _open_room(pool, 3)
+    workers_released = threading.Event()
+    _launch(room, [
+        _job(None, 'Computer', workers_released.wait),
+        _job(None, 'Computer', workers_released.wait),
+    ])
+    assert room.tasks == [[None], [None]]
+
+    # No worker is free, the held jobs are packed by file
+    _launch(room, [_job('a'), _job('b'), _job('a'), _job('c'), _job('b'), _job('a')])
+    _launch(room, [_job('c', 'Resampler'), _job('d', 'Resampler'), _job('c', 'Resampler')])
+    room.ext_receive_nothing()
+    assert room.tasks[2:] == [['a', 'a', 'a'], ['b', 'b', 'c'], ['c', 'c', 'd']]
+
+    workers_released.set()
+    assert sorted(_results(room, 11), key=str) == (
+        [True, True] + ['a'] * 3 + ['b'] * 2 + ['c'] * 3 + ['d']
+    )
+
+@pytest.mark.skipif(
+    not SharedMemoryArena.available, reason='multiprocessing.shared_memory is not available',
+)
+def test_held_jobs_discarded(pool):
+    arena = SharedMemoryArena()
+    room = _open_room(pool, 4)
+    workers_released = threading.Event()
+    _launch(room, [
+        _job(None, 'Computer', workers_released.wait),
+        _job(None, 'Computer', workers_released.wait),
+    ])
+
+    # Cancelled while held, before reaching the pool
+    jobs = [_SharedMemoryJob(arena, 'a', lambda: None) for _ in range(3)]
+    _launch(room, jobs)
+    assert len(arena._lent_blocks) == 3
+    for i, job in enumerate(jobs[:2]):
+        assert [msg.title for msg in room.receive_cancel_job(job)] == ['salvage_token']
+        assert len(arena._lent_blocks) == 2 - i
+
+    # Still held when the pool is no longer used
+    room.receive_die()
+    assert arena._lent_blocks == {}
+    workers_released.set()
+    arena.close()
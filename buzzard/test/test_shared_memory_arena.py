@@ -0,0 +1,106 @@
+"""Tests for the blocks of shared memory lent to the jobs running on process pools"""
+
+import numpy as np
+import pytest
+
+from buzzard import _shared_memory_arena
+from buzzard._shared_memory_arena import SharedMemoryArena, _size_class_of_nbytes
+from buzzard._actors.computer import _compute_array_to_shared_array
+
+pytestmark = pytest.mark.skipif(
+    not SharedMemoryArena.available, reason='multiprocessing.shared_memory is not available',
+)
+
+@pytest.fixture()
+def arena():
+    arena = SharedMemoryArena()
+    yield arena
+    arena.close()
+
+def _block_exists(name):
+    try:
+        shm = _shared_memory_arena._open_block_untracked(name)
+    except FileNotFoundError:
+        return False
+    shm.close()
+    return True
+
+def test_size_class():
+    assert _size_class_of_nbytes(1) == 4096
+    assert _size_class_of_nbytes(4096) == 4096
+    assert _size_class_of_nbytes(4097) == 8192
+    for nbytes in [5000, 10 ** 5, 10 ** 6 + 1, 3 * 2 ** 20]:
+        size = _size_class_of_nbytes(nbytes)
+        assert nbytes <= size < nbytes * 1.125 + 4096
+        assert size % 4096 == 0
+
+def test_lend_take_back(arena):
+    ref = np.arange(50 * 40 * 3, dtype='float32').reshape(50, 40, 3)
+
+    a = arena.lend(ref.shape, ref.dtype)
+    assert (a.shape, a.dtype) == (ref.shape, ref.dtype)
+    a.attach()[...] = ref
+    arr = arena.take_back(a)
+    assert np.all(arr == ref)
+
+    # The block is reused for an array of the same size class
+    b = arena.lend((40, 50, 3), 'float32')
+    assert b.name == a.name
+    out = np.zeros((40, 50, 3), 'float32')
+    b.attach()[...] = ref.reshape(40, 50, 3)
+    assert arena.take_back(b, out) is out
+    assert np.all(out == ref.reshape(40, 50, 3))
+
+    # Two blocks lent at once are different
+    c = arena.lend(ref.shape, ref.dtype)
+    d = arena.lend(ref.shape, ref.dtype)
+    assert c.name != d.name
+    arena.release(c)
+    arena.release(d)
+
+def test_release(arena, monkeypatch):
+    monkeypatch.setattr(_shared_memory_arena, 'MAX_FREE_BYTES', 8192)
+    a = arena.lend((1024,), 'float32')
+    b = arena.lend((1024,), 'float32')
+    c = arena.lend((1024,), 'float32')
+    arena.release(a)
+    arena.release(b)
+
+    # The free blocks are full, `c` is destroyed
+    arena.release(c)
+    assert _block_exists(a.name)
+    assert _block_exists(b.name)
+    assert not _block_exists(c.name)
+    assert {arena.lend((1024,), 'float32').name for _ in range(2)} == {a.name, b.name}
+
+def test_array_too_big_for_block(arena):
+    a = arena.lend((10, 10, 1), 'float32')
+
+    # The result is written to the block
+    assert _compute_array_to_shared_array(a, lambda: np.ones((10, 10), 'float32')) is None
+    assert np.all(arena.take_back(a) == 1)
+
+    # The result is returned, the block is given back without being read
+    a = arena.lend((10, 10, 1), 'float32')
+    res = _compute_array_to_shared_array(a, lambda: np.ones((10, 11, 1), 'float32'))
+    assert res.shape == (10, 11, 1)
+    arena.release(a)
+    assert arena.lend((10, 10, 1), 'float32').name == a.name
+
+def test_close():
+    arena = SharedMemoryArena()
+    free = arena.lend((100,), 'uint8')
+    lent = arena.lend((100,), 'uint8')
+    arena.release(free)
+    arr = lent.attach()
+
+    arena.close()
+    assert not _block_exists(free.name)
+    assert not _block_exists(lent.name)
+    with pytest.raises(RuntimeError, match='closed'):
+        arena.lend((100,), 'uint8')
+
+    # A job may still be writing to a lent block
+    arr[...] = 42
+    del arr
+    arena.release(lent)
@@ -0,0 +1,46 @@
+"""Tests for the in-RAM tier in front of the cache files"""
+
+import numpy as np
+
+from buzzard._tile_memory_cache import TileMemoryCache
+
+def _arr(nbytes):
+    return np.zeros(nbytes, 'uint8')[:, None, None]
+
+def test_lru():
+    cache = TileMemoryCache(300)
+    assert cache.enabled
+    cache.put('a', 0, _arr(100))
+    cache.put('a', 1, _arr(100))
+    cache.put('b', 0, _arr(100))
+    assert cache.get('a', 0) is not None # `a0` is now the most recently used
+    cache.put('b', 1, _arr(100))
+    assert cache.get('a', 1) is None
+    assert cache.get('a', 0) is not None
+    assert cache.stats() == {
+        'hits': 2, 'misses': 1, 'evictions': 1, 'tile_count': 3, 'bytes': 300, 'max_bytes': 300,
+    }
+
+    # Replacing a tile
+    cache.put('b', 1, _arr(50))
+    assert cache.stats()['bytes'] == 250
+
+    # Too big
+    cache.put('c', 0, _arr(301))
+    assert cache.get('c', 0) is None
+    assert cache.stats()['tile_count'] == 3
+
+    cache.discard('a', 0)
+    cache.discard('a', 0)
+    assert cache.get('a', 0) is None
+    cache.discard_raster('b')
+    assert cache.stats()['tile_count'] == 0
+    assert cache.stats()['bytes'] == 0
+
+def test_disabled():
+    cache = TileMemoryCache(0)
+    assert not cache.enabled
+    assert not cache.accepts(1)
+    cache.put('a', 0, _arr(1))
+    assert cache.get('a', 0) is None
+    assert cache.stats()['misses'] == 0
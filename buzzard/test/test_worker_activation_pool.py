@@ -0,0 +1,105 @@
+"""Tests for the driver objects kept open by the workers of process pools"""
+
+import collections
+import os
+import time
+
+import pytest
+
+from buzzard import _worker_activation_pool
+
+@pytest.fixture(autouse=True)
+def empty_pool(monkeypatch):
+    monkeypatch.setattr(_worker_activation_pool, '_idle', collections.OrderedDict())
+    monkeypatch.setattr(_worker_activation_pool, '_generation_of_dataset', {})
+
+@pytest.fixture()
+def paths(tmpdir):
+    paths = []
+    for i in range(4):
+        path = str(tmpdir.join('{}.npy'.format(i)))
+        with open(path, 'wb') as stream:
+            stream.write(b'0')
+        paths.append(path)
+    return paths
+
+class _Allocator(object):
+    """Allocator of fake driver objects, counting the files opened"""
+
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self, path):
+        def _allocate():
+            self.opened.append(path)
+            return object()
+        return _allocate
+
+def _acquire(path, allocator, activation_key=('ds0', 0)):
+    with _worker_activation_pool.acquire_driver_object(path, allocator(path), activation_key) as obj:
+        return obj
+
+def test_reuse(paths):
+    allocator = _Allocator()
+    a = _acquire(paths[0], allocator)
+    assert _acquire(paths[0], allocator) is a
+    b = _acquire(paths[1], allocator)
+    assert b is not a
+    assert _acquire(paths[0], allocator) is a
+    assert allocator.opened == paths[:2]
+
+    # Acquired twice at once, the second one is a new driver object
+    with _worker_activation_pool.acquire_driver_object(paths[0], allocator(paths[0]), ('ds0', 0)) as obj:
+        assert obj is a
+        assert _acquire(paths[0], allocator) is not a
+    assert allocator.opened == paths[:2] + paths[:1]
+
+def test_file_changed(paths):
+    allocator = _Allocator()
+    a = _acquire(paths[0], allocator)
+
+    # Rewritten
+    time.sleep(0.01)
+    with open(paths[0], 'wb') as stream:
+        stream.write(b'01')
+    b = _acquire(paths[0], allocator)
+    assert b is not a
+    assert _acquire(paths[0], allocator) is b
+
+    # Removed
+    os.remove(paths[0])
+    assert _acquire(paths[0], allocator) is not b
+    assert allocator.opened == paths[:1] * 3
+
+def test_eviction(paths, monkeypatch):
+    monkeypatch.setattr(_worker_activation_pool, 'MAX_IDLE', 2)
+    allocator = _Allocator()
+    objs = [_acquire(path, allocator) for path in paths[:2]]
+    assert _acquire(paths[0], allocator) is objs[0]
+
+    # The least recently used is evicted
+    _acquire(paths[2], allocator)
+    assert list(_worker_activation_pool._idle.keys()) == [paths[0], paths[2]]
+    assert _acquire(paths[0], allocator) is objs[0]
+    assert _acquire(paths[1], allocator) is not objs[1]
+    assert allocator.opened == paths[:3] + paths[1:2]
+
+    _worker_activation_pool.deactivate(paths[1])
+    _worker_activation_pool.deactivate(paths[3])
+    assert list(_worker_activation_pool._idle.keys()) == [paths[0]]
+
+def test_key_isolation(paths):
+    allocator = _Allocator()
+    a = _acquire(paths[0], allocator, ('ds0', 0))
+    b = _acquire(paths[1], allocator, ('ds1', 0))
+
+    # An async raster of `ds0` was closed, its driver objects are dropped
+    assert _acquire(paths[1], allocator, ('ds1', 0)) is b
+    a2 = _acquire(paths[0], allocator, ('ds0', 1))
+    assert a2 is not a
+    assert _acquire(paths[1], allocator, ('ds1', 0)) is b
+
+    # A job of the previous generation, still running, does not drop them again
+    assert _acquire(paths[0], allocator, ('ds0', 0)) is a2
+    assert _acquire(paths[0], allocator, ('ds0', 1)) is a2
+    assert allocator.opened == paths[:2] + paths[:1]
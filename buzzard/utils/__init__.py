@@ -1,3 +1,4 @@
 """Utility code for buzzard's users"""
 
 from ._merge_functions import concat_arrays
+from ._trace_recorder import TraceRecorder
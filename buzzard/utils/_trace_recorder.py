@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+import itertools
+
+class TraceRecorder(object):
+    """Debug observer that records the life of the queries of the async rasters as trace events,
+    viewable in `Perfetto <https://ui.perfetto.dev>`_ or in `chrome://tracing`.
+
+    Give the same instance to the `debug_observers` parameter of the Dataset (to observe the
+    scheduler and the pools) and of the recipes (to observe the cache files).
+
+    >>> rec = buzz.utils.TraceRecorder()
+    ... ds = buzz.Dataset(debug_observers=[rec])
+    ... r = ds.acreate_cached_raster_recipe(..., debug_observers=[rec])
+    ... r.get_data()
+    ... rec.dump('trace.json')
+
+    Recorded tracks
+    ---------------
+    - One per scheduler thread, with a slice per message received by an actor.
+    - One per pool, with an asynchronous slice per job waiting for a token in the pool's waiting
+      room (category `wait`), and one per job running in the pool (category `run`). The name of a
+      slice is the name of the actor that sent the job (e.g. `Reader`, `Computer`).
+    - Instant events on each cache file update, and a counter of allocated objects per type.
+
+    The callbacks may be called from several threads at once.
+    """
+
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events = []
+
+        self._pid_of_pool = {}
+        self._next_pid = itertools.count(2)
+        self._thread_names = {}
+        self._allocations_per_type = {}
+
+        self._events.append(_metadata('process_name', 1, 0, 'Scheduler'))
+
+    # Scheduler events ************************************************************************** **
+    def on_message_passed(self, actor_class, title, delta):
+        ts = self._now()
+        tid = self._tid()
+        self._events.append({
+            'name': '{}.{}'.format(actor_class.replace('Actor', '', 1), title),
+            'cat': 'message',
+            'ph': 'X',
+            'ts': ts - delta * 1e6,
+            'dur': delta * 1e6,
+            'pid': 1,
+            'tid': tid,
+        })
+
+    def on_object_allocated(self, obj):
+        name = type(obj).__name__
+        with self._lock:
+            count = self._allocations_per_type.get(name, 0) + 1
+            self._allocations_per_type[name] = count
+        self._events.append({
+            'name': 'object_allocated',
+            'ph': 'C',
+            'ts': self._now(),
+            'pid': 1,
+            'args': {name: count},
+        })
+
+    # Raster events ***************************************************************************** **
+    def on_cache_file_update(self, raster, cache_fp, status):
+        self._events.append({
+            'name': 'cache_file {}'.format(status),
+            'cat': 'cache',
+            'ph': 'i',
+            's': 't',
+            'ts': self._now(),
+            'pid': 1,
+            'tid': self._tid(),
+            'args': {'cache_fp': str(cache_fp)},
+        })
+
+    # Pool events ******************************************************************************* **
+    def on_pool_job_waiting(self, pool_id, job):
+        self._pool_job_event(pool_id, job, 'wait', 'b')
+
+    def on_pool_job_granted(self, pool_id, job):
+        self._pool_job_event(pool_id, job, 'wait', 'e')
+
+    def on_pool_job_unscheduled(self, pool_id, job):
+        self._pool_job_event(pool_id, job, 'wait', 'e', cancelled=True)
+
+    def on_pool_job_working(self, pool_id, job):
+        self._pool_job_event(pool_id, job, 'run', 'b')
+
+    def on_pool_job_done(self, pool_id, job):
+        self._pool_job_event(pool_id, job, 'run', 'e')
+
+    def on_pool_job_cancelled(self, pool_id, job):
+        self._pool_job_event(pool_id, job, 'run', 'e', cancelled=True)
+
+    # Export ************************************************************************************ **
+    def to_dict(self):
+        """Get the recorded trace, in the trace event format"""
+        with self._lock:
+            events = list(self._events)
+        return {
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+        }
+
+    def dump(self, path):
+        """Write the recorded trace to a json file"""
+        with open(path, 'w') as stream:
+            json.dump(self.to_dict(), stream)
+
+    # Private *********************************************************************************** **
+    def _now(self):
+        return (time.perf_counter() - self._t0) * 1e6
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            with self._lock:
+                if tid not in self._thread_names:
+                    name = threading.current_thread().name
+                    self._thread_names[tid] = name
+                    self._events.append(_metadata('thread_name', 1, tid, name))
+        return tid
+
+    def _pid_of_pool_id(self, pool_id):
+        pid = self._pid_of_pool.get(pool_id)
+        if pid is None:
+            with self._lock:
+                if pool_id not in self._pid_of_pool:
+                    pid = next(self._next_pid)
+                    self._pid_of_pool[pool_id] = pid
+                    self._events.append(
+                        _metadata('process_name', pid, 0, 'Pool{:#x}'.format(pool_id))
+                    )
+                pid = self._pid_of_pool[pool_id]
+        return pid
+
+    def _pool_job_event(self, pool_id, job, cat, ph, cancelled=False):
+        _, raster, actor = job.sender_address.split('/')
+        event = {
+            'name': actor,
+            'cat': cat,
+            'ph': ph,
+            'ts': self._now(),
+            'pid': self._pid_of_pool_id(pool_id),
+            'tid': 0,
+            'id': '{:#x}'.format(id(job)),
+        }
+        if ph == 'b':
+            event['args'] = {'raster': raster}
+        elif cancelled:
+            event['args'] = {'cancelled': True}
+        self._events.append(event)
+
+def _metadata(name, pid, tid, value):
+    return {
+        'name': name,
+        'ph': 'M',
+        'pid': pid,
+        'tid': tid,
+        'args': {'name': value},
+    }
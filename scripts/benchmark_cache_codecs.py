@@ -0,0 +1,104 @@
+"""
+Benchmark of the encodings of the cache files of a cached raster recipe: bytes on disk, time to
+fill the cache and read throughput, for each `cache_options` (and for the `npy` format).
+
+The raster is a smooth elevation-like surface with some noise, it is computed on the fly.
+
+```sh
+$ python scripts/benchmark_cache_codecs.py --size 4096 --tile 512 --dir /mnt/network/tmp
+```
+
+"""
+
+import argparse
+import collections
+import functools
+import glob
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import buzzard as buzz
+
+ENCODINGS = collections.OrderedDict([
+    ('none', ('GTiff', [])),
+    ('lzw', ('GTiff', ['COMPRESS=LZW', 'PREDICTOR=3'])),
+    ('deflate-6', ('GTiff', ['COMPRESS=DEFLATE', 'ZLEVEL=6', 'PREDICTOR=3'])),
+    ('zstd-9', ('GTiff', ['COMPRESS=ZSTD', 'ZSTD_LEVEL=9', 'PREDICTOR=3'])),
+    ('zstd-9-mt', ('GTiff', ['COMPRESS=ZSTD', 'ZSTD_LEVEL=9', 'PREDICTOR=3', 'NUM_THREADS=4'])),
+    ('lerc-0.01', ('GTiff', ['COMPRESS=LERC_ZSTD', 'MAX_Z_ERROR=0.01'])),
+    ('npy', ('npy', [])),
+])
+
+def compute_surface(fp, primitive_fps, primitive_arrays, raster, reffp):
+    x, y = fp.meshgrid_raster_in(reffp)
+    z = np.sin(x / 150) * 40 + np.cos(y / 230) * 60 + (x + y) / 50
+    rng = np.random.RandomState(int(x[0, 0] * 7919 + y[0, 0]) % 2 ** 31)
+    z += rng.normal(0, 0.05, z.shape)
+    return z.astype('float32')[..., None]
+
+def bench(name, cache_format, cache_options, fp, tile, cache_dir, pool):
+    kwargs = dict(
+        compute_array=functools.partial(compute_surface, reffp=fp),
+        cache_dir=cache_dir, cache_tiles=(tile, tile),
+        cache_format=cache_format, cache_options=cache_options,
+        computation_pool=pool, merge_pool=pool, io_pool=pool, resample_pool=pool,
+    )
+    tiles = fp.tile((tile, tile), boundary_effect='shrink').flatten().tolist()
+
+    # Fill the cache
+    with buzz.Dataset().close as ds:
+        r = ds.acreate_cached_raster_recipe(fp, 'float32', 1, **kwargs)
+        t0 = time.perf_counter()
+        for _ in r.iter_data(tiles):
+            pass
+        fill = time.perf_counter() - t0
+
+    nbytes = sum(
+        os.stat(path).st_size
+        for path in glob.glob(os.path.join(cache_dir, 'buzz_*'))
+    )
+
+    # Read the cache from a new Dataset, without computations
+    with buzz.Dataset().close as ds:
+        r = ds.acreate_cached_raster_recipe(fp, 'float32', 1, **kwargs)
+        r.get_data(fp=tiles[0]) # Check the cache files
+        t0 = time.perf_counter()
+        for _ in r.iter_data(tiles):
+            pass
+        read = time.perf_counter() - t0
+
+    raw_nbytes = fp.rarea * 4
+    print('{:>10}: {:8.1f} MiB on disk ({:5.1%}), fill {:6.2f}s, read {:6.2f}s ({:7.1f} MiB/s)'.format(
+        name, nbytes / 2 ** 20, nbytes / raw_nbytes, fill, read, raw_nbytes / 2 ** 20 / read,
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--size', type=int, default=4096, help='Side of the raster in pixels')
+    parser.add_argument('--tile', type=int, default=512, help='Side of the cache tiles in pixels')
+    parser.add_argument('--dir', default=tempfile.gettempdir(), help='Where to create the caches')
+    parser.add_argument('--pool', default='io', choices=['io', 'cpu', 'process'])
+    parser.add_argument('encodings', nargs='*', default=list(ENCODINGS.keys()))
+    args = parser.parse_args()
+
+    fp = buzz.Footprint(tl=(0, 0), size=(args.size, args.size), rsize=(args.size, args.size))
+    if args.pool == 'process':
+        import multiprocessing as mp
+        pool = mp.Pool(os.cpu_count())
+    else:
+        pool = args.pool
+
+    for name in args.encodings:
+        cache_format, cache_options = ENCODINGS[name]
+        cache_dir = tempfile.mkdtemp(prefix='buzz-bench-{}-'.format(name), dir=args.dir)
+        try:
+            bench(name, cache_format, cache_options, fp, args.tile, cache_dir, pool)
+        finally:
+            shutil.rmtree(cache_dir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark of the data structures that sort the rank 1 jobs of `ActorPoolWaitingRoom`, when the
+priorities of the queries change.
+
+- `sortedset`: the structure used before `IndexedHeap`. A job is removed from and added again to a
+  `SortedSet` of priorities and to two dicts.
+- `heap`: an `IndexedHeap`, a job is moved in the heap.
+
+```sh
+$ python scripts/benchmark_waiting_room_priorities.py --jobs 50000 --queries 50
+```
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+import sortedcontainers
+
+from buzzard._tools import IndexedHeap
+
+class SortedSetStructure(object):
+    def __init__(self):
+        self._dict_of_prio_per_r1job = {}
+        self._sset_of_prios = sortedcontainers.SortedSet()
+        self._dict_of_r1jobs_per_prio = {}
+
+    def push(self, job, prio):
+        self._dict_of_prio_per_r1job[job] = prio
+        if prio in self._dict_of_r1jobs_per_prio:
+            self._dict_of_r1jobs_per_prio[prio].add(job)
+        else:
+            self._dict_of_r1jobs_per_prio[prio] = {job}
+            self._sset_of_prios.add(prio)
+
+    def remove(self, job):
+        prio = self._dict_of_prio_per_r1job.pop(job)
+        self._dict_of_r1jobs_per_prio[prio].remove(job)
+        if len(self._dict_of_r1jobs_per_prio[prio]) == 0:
+            del self._dict_of_r1jobs_per_prio[prio]
+            self._sset_of_prios.remove(prio)
+
+    def update(self, job, prio):
+        self.remove(job)
+        self.push(job, prio)
+
+    def pop(self):
+        prio = self._sset_of_prios[0]
+        job = next(iter(self._dict_of_r1jobs_per_prio[prio]))
+        self.remove(job)
+        return job
+
+class Job(object):
+    def __init__(self, query, y, x):
+        self.query = query
+        self.y = y
+        self.x = x
+
+def prio_of_job(job, query_prios):
+    # Same shape as the priorities of the waiting room: query prio, then position in the query
+    return (query_prios[job.query], 0, -job.y, job.x, 1)
+
+def run(structure, jobs_of_query, query_prios, update_count, pops_per_update, rng):
+    """Fill the structure, then alternate an update of the priorities of a query and a few pops,
+    like the waiting room does when the arrays of a query are consumed"""
+    t0 = time.perf_counter()
+    for jobs in jobs_of_query:
+        for job in jobs:
+            structure.push(job, prio_of_job(job, query_prios))
+    t1 = time.perf_counter()
+
+    updated_jobs = 0
+    for _ in range(update_count):
+        q = rng.randint(len(jobs_of_query))
+        query_prios[q] = rng.randint(100)
+        for job in jobs_of_query[q]:
+            structure.update(job, prio_of_job(job, query_prios))
+        updated_jobs += len(jobs_of_query[q])
+        for _ in range(pops_per_update):
+            job = structure.pop()
+            jobs_of_query[job.query].remove(job)
+    t2 = time.perf_counter()
+    return t1 - t0, t2 - t1, updated_jobs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--jobs', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=200)
+    parser.add_argument('--pops-per-update', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, cls in [('sortedset', SortedSetStructure), ('heap', IndexedHeap)]:
+        rng = np.random.RandomState(0)
+        per_query = args.jobs // args.queries
+        side = int(np.ceil(per_query ** 0.5))
+        jobs_of_query = [
+            set(Job(q, i // side, i % side) for i in range(per_query))
+            for q in range(args.queries)
+        ]
+        query_prios = list(rng.randint(100, size=args.queries))
+        fill, updates, updated_jobs = run(
+            cls(), jobs_of_query, query_prios, args.updates, args.pops_per_update, rng,
+        )
+        print('{:>10}: fill {:7.3f}s, updates {:7.3f}s ({:.2f}us per updated job)'.format(
+            name, fill, updates, updates / max(updated_jobs, 1) * 1e6,
+        ))
+
+if __name__ == '__main__':
+    main()